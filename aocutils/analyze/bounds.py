@@ -4,20 +4,26 @@ r"""Bounding box analysis"""
 
 import abc
 import logging
+import os
 import re
 import struct
 import sys
 
+import numpy as np
+
 from OCC.Core.Bnd import Bnd_Box
-from OCC.Core.BRepBndLib import brepbndlib_Add
-from OCC.Core.gp import gp_Pnt
+from OCC.Core.BRepBndLib import brepbndlib_Add, brepbndlib_AddOptimal
+from OCC.Core.gp import gp_Pnt, gp_Dir
+from OCC.Core.TopAbs import TopAbs_VERTEX
 from OCC.Core.TopoDS import TopoDS_Shape
 
+from aocutils.analyze.distance import MinimumDistance
 from aocutils.brep.face_make import from_points
 from aocutils.geom.point import Point
 from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
 from aocutils.exceptions import WrongTopologicalType
 from aocutils.operations.boolean import common
+from aocutils.parallel import BrepFile, pool_map, worker_shape
 from aocutils.topology import Topo
 
 if sys.version_info > (3, 0):
@@ -283,7 +289,179 @@ class BoundingBox(AbstractBoundingBox):
                               gp_Pnt(self.x_max, self.y_max, self.z_max))
 
 
-def build_plane_at_x(x, shape):
+class OptimalBoundingBox(BoundingBox):
+    r"""Axis aligned bounding box computed with BRepBndLib::AddOptimal
+
+    Tighter than BoundingBox as it is computed from the exact geometry
+    rather than from the poles of the curves and surfaces, for a higher cost
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape or subclass
+    tol : float, optional
+        Gap added around the shape
+    use_triangulation : bool, optional
+        Use the triangulation of the shape if it exists. Default is False
+    use_shape_tolerance : bool, optional
+        Enlarge the box with the tolerances of the sub-shapes.
+        Default is False
+
+    """
+    def __init__(self,
+                 shape,
+                 tol=OCCUTILS_DEFAULT_TOLERANCE,
+                 use_triangulation=False,
+                 use_shape_tolerance=False):
+        if isinstance(shape, TopoDS_Shape) or issubclass(shape.__class__,
+                                                         TopoDS_Shape):
+            self._shape = shape
+        else:
+            msg = "Expecting a TopoDS_Shape (or a subclass), " \
+                  "got a %s" % str(shape.__class__)
+            logger.error(msg)
+            raise WrongTopologicalType(msg)
+        self._tol = tol
+        self._bbox = Bnd_Box()
+        brepbndlib_AddOptimal(self._shape,
+                              self._bbox,
+                              use_triangulation,
+                              use_shape_tolerance)
+        self._bbox.SetGap(tol)
+
+        (self._x_min, self._y_min, self._z_min,
+         self._x_max, self._y_max, self._z_max) = self._bbox.Get()
+
+
+class OrientedBoundingBox(object):
+    r"""Oriented bounding box (OBB) of a shape
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape or subclass
+    optimal : bool, optional
+        Compute the optimal (smallest volume) box, slower. Default is False
+    use_triangulation : bool, optional
+        Use the triangulation of the shape if it exists. Default is True
+    use_shape_tolerance : bool, optional
+        Enlarge the box with the tolerances of the sub-shapes.
+        Default is False
+
+    """
+    def __init__(self,
+                 shape,
+                 optimal=False,
+                 use_triangulation=True,
+                 use_shape_tolerance=False):
+        if isinstance(shape, TopoDS_Shape) or issubclass(shape.__class__,
+                                                         TopoDS_Shape):
+            self._shape = shape
+        else:
+            msg = "Expecting a TopoDS_Shape (or a subclass), " \
+                  "got a %s" % str(shape.__class__)
+            logger.error(msg)
+            raise WrongTopologicalType(msg)
+        # Bnd_OBB is not wrapped by the older pythonocc versions,
+        # import it here so that the rest of the module still imports
+        from OCC.Core.Bnd import Bnd_OBB
+        from OCC.Core.BRepBndLib import brepbndlib_AddOBB
+        self._obb = Bnd_OBB()
+        brepbndlib_AddOBB(self._shape,
+                          self._obb,
+                          use_triangulation,
+                          optimal,
+                          use_shape_tolerance)
+
+    @property
+    def bnd_obb(self):
+        r"""The OCC oriented bounding box object
+
+        Returns
+        -------
+        OCC.Core.Bnd.Bnd_OBB
+
+        """
+        return self._obb
+
+    @property
+    def centre(self):
+        r"""Centre of the box
+
+        Returns
+        -------
+        gp_Pnt
+
+        """
+        return gp_Pnt(self._obb.Center())
+
+    @property
+    def directions(self):
+        r"""The 3 axes of the box
+
+        Returns
+        -------
+        tuple[gp_Dir]
+
+        """
+        return (gp_Dir(self._obb.XDirection()),
+                gp_Dir(self._obb.YDirection()),
+                gp_Dir(self._obb.ZDirection()))
+
+    @property
+    def half_sizes(self):
+        r"""Half dimensions of the box along its 3 axes
+
+        Returns
+        -------
+        tuple[float]
+
+        """
+        return self._obb.XHSize(), self._obb.YHSize(), self._obb.ZHSize()
+
+    @property
+    def volume(self):
+        r"""Volume of the box"""
+        x_half_size, y_half_size, z_half_size = self.half_sizes
+        return 8. * x_half_size * y_half_size * z_half_size
+
+    @property
+    def corners(self):
+        r"""The 8 corners of the box
+
+        Returns
+        -------
+        list[gp_Pnt]
+
+        """
+        centre = self._obb.Center()
+        axes = [self._obb.XDirection().Multiplied(self._obb.XHSize()),
+                self._obb.YDirection().Multiplied(self._obb.YHSize()),
+                self._obb.ZDirection().Multiplied(self._obb.ZHSize())]
+        corners = list()
+        for sign_x in (-1., 1.):
+            for sign_y in (-1., 1.):
+                for sign_z in (-1., 1.):
+                    corner = centre.Added(axes[0].Multiplied(sign_x))
+                    corner = corner.Added(axes[1].Multiplied(sign_y))
+                    corner = corner.Added(axes[2].Multiplied(sign_z))
+                    corners.append(gp_Pnt(corner))
+        return corners
+
+    def is_out(self, other):
+        r"""Is the other box disjoint from this one?
+
+        Parameters
+        ----------
+        other : OrientedBoundingBox
+
+        Returns
+        -------
+        bool
+
+        """
+        return self._obb.IsOut(other.bnd_obb)
+
+
+def build_plane_at_x(x, shape, bounding_box=None):
     r"""Build a plane for intersection with the shape at x. This is a YZ plane.
 
     Parameters
@@ -291,6 +469,8 @@ def build_plane_at_x(x, shape):
     x : float
         The x coordinate at which the plane is to be built
     shape : OCC shape
+    bounding_box : BoundingBox, optional
+        The bounding box of shape, if it is already known
 
     Returns
     -------
@@ -298,7 +478,8 @@ def build_plane_at_x(x, shape):
         The face representing the plane
 
     """
-    bounding_box = BoundingBox(shape)
+    if bounding_box is None:
+        bounding_box = BoundingBox(shape)
     extra = 1.
     p1 = gp_Pnt(float(x),
                 bounding_box.y_max + extra,
@@ -316,7 +497,7 @@ def build_plane_at_x(x, shape):
     return face
 
 
-def build_plane_at_y(y, shape):
+def build_plane_at_y(y, shape, bounding_box=None):
     r"""Build a plane for intersection with the shape at y. This is a XZ plane.
 
     Parameters
@@ -324,6 +505,8 @@ def build_plane_at_y(y, shape):
     y : float
         The x coordinate at which the plane is to be built
     shape : OCC shape
+    bounding_box : BoundingBox, optional
+        The bounding box of shape, if it is already known
 
     Returns
     -------
@@ -331,7 +514,8 @@ def build_plane_at_y(y, shape):
         The face representing the plane
 
     """
-    bounding_box = BoundingBox(shape)
+    if bounding_box is None:
+        bounding_box = BoundingBox(shape)
     extra = 1.
     p1 = gp_Pnt(bounding_box.x_max + extra,
                 float(y),
@@ -349,7 +533,7 @@ def build_plane_at_y(y, shape):
     return face
 
 
-def build_plane_at_z(z, shape):
+def build_plane_at_z(z, shape, bounding_box=None):
     r"""Build a plane for intersection with the shape at z. This is a XY plane.
 
     Parameters
@@ -357,6 +541,8 @@ def build_plane_at_z(z, shape):
     z : float
         The x coordinate at which the plane is to be built
     shape : OCC shape
+    bounding_box : BoundingBox, optional
+        The bounding box of shape, if it is already known
 
     Returns
     -------
@@ -364,7 +550,8 @@ def build_plane_at_z(z, shape):
         The face representing the plane
 
     """
-    bounding_box = BoundingBox(shape)
+    if bounding_box is None:
+        bounding_box = BoundingBox(shape)
     extra = 1.
     p1 = gp_Pnt(bounding_box.x_max + extra,
                 bounding_box.y_max + extra,
@@ -382,13 +569,144 @@ def build_plane_at_z(z, shape):
     return face
 
 
-def real_bb_position(axis, side, start_position, shape, increment=0.01):
+def _plane_intersects_shape(plane_builder, position, shape, bounding_box):
+    r"""Does the plane built at position intersect the shape?
+
+    This is the costly part of the bounding box workaround :
+    one boolean common per call
+
+    """
+    plane = plane_builder(position, shape, bounding_box)
+    common_shape = common(shape, plane)
+    first_vertex = next(Topo(common_shape).stream(TopAbs_VERTEX,
+                                                  unique=False), None)
+    return first_vertex is not None
+
+
+def _linear_bb_position(plane_builder, side, start_position, shape,
+                        increment, bounding_box):
+    r"""Linear search of the bounding box position
+
+    Returns
+    -------
+    tuple[float, int]
+        position, number of boolean evaluations
+
+    """
+    position = start_position
+    evaluations = 0
+
+    intersect = False
+    while intersect is False:
+        evaluations += 1
+        if _plane_intersects_shape(plane_builder, position, shape,
+                                   bounding_box):
+            intersect = True
+        else:
+            if side == "MIN":
+                position += increment
+            elif side == "MAX":
+                position -= increment
+
+    # Bug correction : make sure the computed bounding box is wider
+    # than the shape by a value between 0 and increment
+    if side == "MIN":
+        return position - 2 * increment, evaluations
+    elif side == "MAX":
+        return position + 2 * increment, evaluations
+
+
+def _bisection_bb_position(plane_builder, axis, side, start_position, shape,
+                           precision, bounding_box):
+    r"""Bisection search of the bounding box position
+
+    start_position (the BoundingBox value, which is always wider or equal to
+    the real bounds) is outside the shape. The search gallops inwards from it
+    by steps of precision, 2 * precision, 4 * precision ... until the plane
+    intersects the shape, then bisects this bracket : the number of boolean
+    evaluations grows with log2(gap / precision), where gap is the
+    imprecision of the BoundingBox.
+
+    Returns
+    -------
+    tuple[float, int]
+        position, number of boolean evaluations
+
+    """
+    axis_min = {"X": bounding_box.x_min,
+                "Y": bounding_box.y_min,
+                "Z": bounding_box.z_min}[axis]
+    axis_max = {"X": bounding_box.x_max,
+                "Y": bounding_box.y_max,
+                "Z": bounding_box.z_max}[axis]
+    # direction from the outside towards the inside of the shape
+    inwards = 1. if side == "MIN" else -1.
+    # the plane never needs to go further than the opposite side of the box
+    max_offset = max(axis_max - axis_min, precision)
+
+    evaluations = 1
+    if _plane_intersects_shape(plane_builder, start_position, shape,
+                               bounding_box):
+        # same convention as the linear search
+        return start_position - 2 * inwards * precision, evaluations
+
+    outside = start_position
+    inside = None
+    offset = precision
+    while inside is None:
+        candidate = start_position + inwards * min(offset, max_offset)
+        evaluations += 1
+        if _plane_intersects_shape(plane_builder, candidate, shape,
+                                   bounding_box):
+            inside = candidate
+        elif offset >= max_offset:
+            break
+        else:
+            outside = candidate
+            offset *= 2.
+
+    if inside is None:
+        logger.warning("Could not bracket the %s %s bound, "
+                       "falling back to a linear search" % (axis, side))
+        position, linear_evaluations = _linear_bb_position(plane_builder,
+                                                           side,
+                                                           start_position,
+                                                           shape,
+                                                           precision,
+                                                           bounding_box)
+        return position, evaluations + linear_evaluations
+
+    while abs(inside - outside) > precision:
+        middle = (inside + outside) / 2.
+        evaluations += 1
+        if _plane_intersects_shape(plane_builder, middle, shape, bounding_box):
+            inside = middle
+        else:
+            outside = middle
+
+    # same convention as the linear search : the computed bounding box is
+    # wider than the shape by a value between 0 and 2 * precision
+    return outside - inwards * precision, evaluations
+
+
+def real_bb_position(axis,
+                     side,
+                     start_position,
+                     shape,
+                     increment=0.01,
+                     method="bisection",
+                     bounding_box=None,
+                     return_evaluations=False):
     r"""Workaround for OCC bounding box imprecision.
 
     The principle is to move a plane (perpendicular to axis) closer and closer
     until it intersects the shape.
     The goal is to get a 'sure to intersect' coordinates for another program.
 
+    With the (default) "bisection" method, the number of boolean operations
+    grows with log2(bounding box imprecision / increment), instead of
+    (bounding box imprecision / increment) for the "linear" method.
+
     Parameters
     ----------
     axis : str
@@ -398,48 +716,86 @@ def real_bb_position(axis, side, start_position, shape, increment=0.01):
     start_position : float
     shape : OCC Shape
     increment : float, optional
-        The distance by which the intersection plane
-        is moved to try to intersect the shape
+        The precision of the search (for the "linear" method: the distance
+        by which the intersection plane is moved to try to intersect
+        the shape)
         Default is 0.01
+    method : str, optional
+        in ["bisection", "linear"]. Default is "bisection"
+    bounding_box : BoundingBox, optional
+        The BoundingBox of shape, if it is already known
+    return_evaluations : bool, optional
+        If True, also return the number of boolean operations performed
 
     Returns
     -------
     float
         The value of the position
         for the specified axis and side ("MIN" or "MAX")
+    (float, int) if return_evaluations is True
 
     """
     if axis not in ["X", "Y", "Z"]:
         raise ValueError("axis must be 'X', 'Y' or 'Z'")
     if side not in ["MIN", "MAX"]:
         raise ValueError("side must be 'MIN' or 'MAX'")
+    if method not in ["bisection", "linear"]:
+        raise ValueError("method must be 'bisection' or 'linear'")
 
     plane_builders = {"X": build_plane_at_x,
                       "Y": build_plane_at_y,
                       "Z": build_plane_at_z}
     plane_builder = plane_builders[axis]
 
-    position = start_position
+    if bounding_box is None:
+        bounding_box = BoundingBox(shape)
+
+    if method == "bisection":
+        position, evaluations = _bisection_bb_position(plane_builder,
+                                                       axis,
+                                                       side,
+                                                       start_position,
+                                                       shape,
+                                                       increment,
+                                                       bounding_box)
+    else:
+        position, evaluations = _linear_bb_position(plane_builder,
+                                                    side,
+                                                    start_position,
+                                                    shape,
+                                                    increment,
+                                                    bounding_box)
+    logger.debug("%s %s bound found after %i boolean evaluations"
+                 % (axis, side, evaluations))
 
-    intersect = False
-    while intersect is False:
-        plane = plane_builder(position, shape)
-        common_shape = common(shape, plane)
-        list_vertex = Topo(common_shape, return_iter=False).vertices
-        if len(list_vertex) >= 1:
-            intersect = True
-        else:
-            if side == "MIN":
-                position += increment
-            elif side == "MAX":
-                position -= increment
+    if return_evaluations:
+        return position, evaluations
+    return position
 
-    # Bug correction : make sure the computed bounding box is wider
-    # than the shape by a value between 0 and increment
-    if side == "MIN":
-        return position - 2 * increment
-    elif side == "MAX":
-        return position + 2 * increment
+
+def _real_bb_position_task(task):
+    r"""real_bb_position() for one side, in a worker process
+
+    Parameters
+    ----------
+    task : tuple
+        (BREP file name, axis, side, start position, increment, method)
+
+    Returns
+    -------
+    tuple[float, int]
+        position, number of boolean evaluations
+
+    """
+    filename, axis, side, start_position, increment, method = task
+    shape = worker_shape(filename)
+    return real_bb_position(axis,
+                            side,
+                            start_position,
+                            shape,
+                            increment=increment,
+                            method=method,
+                            return_evaluations=True)
 
 
 class BetterBoundingBox(AbstractBoundingBox):
@@ -458,23 +814,31 @@ class BetterBoundingBox(AbstractBoundingBox):
     The bounding box workaround is useful for complex shapes,
     not for simple primitives like sphere, box ...
 
-    Potential improvements
-    ----------------------
-    The algorithm could be faster by using dichotomy rather than linear movement
-    of the plane that is tested for intersection with the shape
-    The improvement would be useful if this workaround is to be used
-    in waterline
-    When used to generate hull offsets, BetterBoundingBox is slow when the
-    increment is smaller than 10e-2 but we can live with it in the meantime
+    The plane position is found by bisection (see real_bb_position()),
+    the number of boolean operations per side grows with
+    log2(imprecision / tol) rather than linearly with imprecision / tol.
 
     Parameters
     ----------
     shape : OCC.TopoDS.TopoDS_Shape
     tol : float, optional
         The tolerance for the evaluation of the bounding box
+    method : str, optional
+        "bisection" (default) or "linear", see real_bb_position()
+    processes : int, optional
+        If > 1, the 6 independent searches run in a pool of processes
+        (the shape is shipped as a BREP file). None or 0 uses one process
+        per CPU (capped at 6). Default is 1 (no pool)
+    timeout : float, optional
+        Maximum time in seconds to wait for the pool results
 
     """
-    def __init__(self, shape, tol=0.01):
+    def __init__(self,
+                 shape,
+                 tol=0.01,
+                 method="bisection",
+                 processes=1,
+                 timeout=None):
         if isinstance(shape, TopoDS_Shape) or issubclass(shape.__class__,
                                                          TopoDS_Shape):
             self._shape = shape
@@ -485,36 +849,49 @@ class BetterBoundingBox(AbstractBoundingBox):
             raise WrongTopologicalType(msg)
         # self._shape = shape
         bb = BoundingBox(self._shape)
-        self._x_min = real_bb_position("X",
-                                       "MIN",
-                                       bb.x_min,
-                                       self._shape,
-                                       increment=tol)
-        self._x_max = real_bb_position("X",
-                                       "MAX",
-                                       bb.x_max,
-                                       self._shape,
-                                       increment=tol)
-        self._y_min = real_bb_position("Y",
-                                       "MIN",
-                                       bb.y_min,
-                                       self._shape,
-                                       increment=tol)
-        self._y_max = real_bb_position("Y",
-                                       "MAX",
-                                       bb.y_max,
-                                       self._shape,
-                                       increment=tol)
-        self._z_min = real_bb_position("Z",
-                                       "MIN",
-                                       bb.z_min,
-                                       self._shape,
-                                       increment=tol)
-        self._z_max = real_bb_position("Z",
-                                       "MAX",
-                                       bb.z_max,
-                                       self._shape,
-                                       increment=tol)
+        sides = [("X", "MIN", bb.x_min),
+                 ("X", "MAX", bb.x_max),
+                 ("Y", "MIN", bb.y_min),
+                 ("Y", "MAX", bb.y_max),
+                 ("Z", "MIN", bb.z_min),
+                 ("Z", "MAX", bb.z_max)]
+
+        if processes == 1:
+            results = [real_bb_position(axis,
+                                        side,
+                                        start_position,
+                                        self._shape,
+                                        increment=tol,
+                                        method=method,
+                                        bounding_box=bb,
+                                        return_evaluations=True)
+                       for axis, side, start_position in sides]
+        else:
+            with BrepFile(self._shape) as brep_file:
+                tasks = [(brep_file.filename, axis, side, start_position,
+                          tol, method)
+                         for axis, side, start_position in sides]
+                results = pool_map(_real_bb_position_task,
+                                   tasks,
+                                   filename=brep_file.filename,
+                                   processes=processes,
+                                   timeout=timeout)
+
+        self._boolean_evaluations = dict()
+        for (axis, side, _), (position, evaluations) in zip(sides, results):
+            setattr(self, "_%s_%s" % (axis.lower(), side.lower()), position)
+            self._boolean_evaluations[(axis, side)] = evaluations
+
+    @property
+    def boolean_evaluations(self):
+        r"""Number of boolean operations used to compute the bounding box
+
+        Returns
+        -------
+        int
+
+        """
+        return sum(self._boolean_evaluations.values())
 
     @property
     def x_min(self):
@@ -595,92 +972,172 @@ class BetterBoundingBox(AbstractBoundingBox):
                               gp_Pnt(self.x_max, self.y_max, self.z_max))
 
 
-def stl_bounding_box(path_to_stl):
-    """Reads an ascii or binary STL file to determine its bounding box
+class TightBoundingBox(BoundingBox):
+    r"""A bounding box that is close to the truth, without boolean operations
+
+    The OptimalBoundingBox is used as a starting point. On each of the 6
+    sides, a plane is built just outside the shape and the exact minimum
+    distance (BRepExtrema_DistShapeShape) between the shape and the plane
+    gives the position of the real bound.
+
+    The result is comparable to BetterBoundingBox (the bounds are wider
+    than the shape by a value between 0 and tol) at a fraction of the cost.
 
     Parameters
     ----------
-    path_to_stl : str
-        Path to the stl file
+    shape : OCC.TopoDS.TopoDS_Shape
+    tol : float, optional
+        The tolerance for the evaluation of the bounding box
 
-    References
-    ----------
-    http://stackoverflow.com/questions/7566825/python-parsing-binary-stl-file
-    http://sukhbinder.wordpress.com/2013/11/28/
-                              binary-stl-file-reader-in-python-powered-by-numpy/
     """
+    def __init__(self, shape, tol=0.01):
+        if isinstance(shape, TopoDS_Shape) or issubclass(shape.__class__,
+                                                         TopoDS_Shape):
+            self._shape = shape
+        else:
+            msg = "Expecting a TopoDS_Shape (or a subclass), " \
+                  "got a %s" % str(shape.__class__)
+            logger.error(msg)
+            raise WrongTopologicalType(msg)
+        self._tol = tol
+        optimal_bb = OptimalBoundingBox(self._shape)
+
+        # the planes are moved out of the optimal box
+        # so that they do not touch the shape
+        margin = max(optimal_bb.max_dimension * 0.01, 10. * tol)
+        plane_builders = {"X": build_plane_at_x,
+                          "Y": build_plane_at_y,
+                          "Z": build_plane_at_z}
+        for axis, side, start_position in [("X", "MIN", optimal_bb.x_min),
+                                           ("X", "MAX", optimal_bb.x_max),
+                                           ("Y", "MIN", optimal_bb.y_min),
+                                           ("Y", "MAX", optimal_bb.y_max),
+                                           ("Z", "MIN", optimal_bb.z_min),
+                                           ("Z", "MAX", optimal_bb.z_max)]:
+            outwards = -1. if side == "MIN" else 1.
+            plane_position = start_position + outwards * margin
+            plane = plane_builders[axis](plane_position,
+                                         self._shape,
+                                         optimal_bb)
+            distance = MinimumDistance(self._shape, plane).minimum_distance
+            position = plane_position - outwards * distance + outwards * tol
+            setattr(self, "_%s_%s" % (axis.lower(), side.lower()), position)
 
-    xmin, xmax = 1e12, -1e12
-    ymin, ymax = 1e12, -1e12
-    zmin, zmax = 1e12, -1e12
+        self._bbox = Bnd_Box()
+        self._bbox.Update(self._x_min, self._y_min, self._z_min,
+                          self._x_max, self._y_max, self._z_max)
 
-    binary = is_binary(path_to_stl)
 
-    if binary:
+# binary STL : 80 bytes header, 4 bytes number of triangles
+# then 50 bytes per triangle
+_STL_BINARY_HEADER_SIZE = 84
+_STL_BINARY_TRIANGLE_DTYPE = np.dtype([("normal", "<f4", (3,)),
+                                       ("vertices", "<f4", (3, 3)),
+                                       ("attribute", "<u2")])
 
-        def unpack(fi, sig, l):
-            s = fi.read(l)
-            return struct.unpack(sig, s)
+# ascii STL : 'vertex x y z' lines
+_STL_ASCII_VERTEX_REGEX = re.compile(r"vertex\s+(\S+)\s+(\S+)\s+(\S+)")
 
-        f = open(path_to_stl, 'rb')
 
-        logger.info('Reading binary stl file : %s' % path_to_stl)
+def _is_binary_stl(path_to_stl):
+    r"""Is the STL file binary?
 
-        f.seek(f.tell() + 80)  # read header
-        # l = struct.unpack("@i", f.read(4))[0]
-        _ = struct.unpack("@i", f.read(4))[0]
-
-        try:
-            while True:
-                # n = unpack(f, "<3f", 12)
-                _ = unpack(f, "<3f", 12)
-                p1 = unpack(f, "<3f", 12)
-                p2 = unpack(f, "<3f", 12)
-                p3 = unpack(f, "<3f", 12)
-                # b = unpack(f, "<h", 2)
-                _ = unpack(f, "<h", 2)
-                numbers = [tuple(p1), tuple(p2), tuple(p3)]
-                for number in numbers:
-                    x, y, z = number[0], number[1], number[2]
-                    if x < xmin:
-                        xmin = x
-                    if x > xmax:
-                        xmax = x
-                    if y < ymin:
-                        ymin = y
-                    if y > ymax:
-                        ymax = y
-                    if z < zmin:
-                        zmin = z
-                    if z > zmax:
-                        zmax = z
-        # except struct.error as e:
-        except struct.error:
-            logger.info('Finished reading binary stl file')
+    A binary STL file size is fully determined by the number of triangles
+    in its header, which avoids scanning a (potentially huge) ascii file
+    for null bytes. is_binary() is the fallback for inconsistent files.
 
-    else:
-        lines = open(path_to_stl, 'r').readlines()
+    """
+    file_size = os.path.getsize(path_to_stl)
+    if file_size >= _STL_BINARY_HEADER_SIZE:
+        with open(path_to_stl, "rb") as f:
+            f.seek(80)
+            (n_triangles,) = struct.unpack("<I", f.read(4))
+        expected_size = (_STL_BINARY_HEADER_SIZE +
+                         n_triangles * _STL_BINARY_TRIANGLE_DTYPE.itemsize)
+        if file_size == expected_size:
+            return True
+    return is_binary(path_to_stl)
 
-        logger.info('Reading ascii stl file : %s' % path_to_stl)
 
-        for line in lines:
-            if 'vertex' in line:
-                # split the cleaned up line
-                s = re.sub(' +', ' ', line.strip()).split(' ')
-                x, y, z = float(s[1]), float(s[2]), float(s[3])
-                if x < xmin:
-                    xmin = x
-                if x > xmax:
-                    xmax = x
-                if y < ymin:
-                    ymin = y
-                if y > ymax:
-                    ymax = y
-                if z < zmin:
-                    zmin = z
-                if z > zmax:
-                    zmax = z
+def _binary_stl_bounds(path_to_stl, chunk_size):
+    r"""Min and max coordinates of the vertices of a binary STL file
+
+    The triangles are memory mapped with a structured dtype and reduced
+    chunk by chunk, the file is never loaded as a whole
+
+    """
+    # as many full triangles as the file holds, whatever the header says
+    n_triangles = ((os.path.getsize(path_to_stl) - _STL_BINARY_HEADER_SIZE) //
+                   _STL_BINARY_TRIANGLE_DTYPE.itemsize)
+    mins, maxs = np.full(3, 1e12), np.full(3, -1e12)
+    if n_triangles <= 0:
+        return mins, maxs
+
+    triangles = np.memmap(path_to_stl,
+                          dtype=_STL_BINARY_TRIANGLE_DTYPE,
+                          mode="r",
+                          offset=_STL_BINARY_HEADER_SIZE,
+                          shape=(n_triangles,))
+    for i in range(0, n_triangles, chunk_size):
+        vertices = triangles["vertices"][i:i + chunk_size]
+        np.minimum(mins, vertices.min(axis=(0, 1)), out=mins)
+        np.maximum(maxs, vertices.max(axis=(0, 1)), out=maxs)
+    del triangles
+    return mins, maxs
+
+
+def _ascii_stl_bounds(path_to_stl, chunk_size):
+    r"""Min and max coordinates of the vertices of an ascii STL file
+
+    The file is read by chunks of about chunk_size bytes (whole lines),
+    the memory used is bounded whatever the file size
+
+    """
+    mins, maxs = np.full(3, 1e12), np.full(3, -1e12)
+    with open(path_to_stl, "r") as f:
+        while True:
+            lines = f.readlines(chunk_size)
+            if len(lines) == 0:
+                break
+            coordinates = _STL_ASCII_VERTEX_REGEX.findall("".join(lines))
+            if len(coordinates) == 0:
+                continue
+            vertices = np.array(coordinates, dtype=np.float64)
+            np.minimum(mins, vertices.min(axis=0), out=mins)
+            np.maximum(maxs, vertices.max(axis=0), out=maxs)
+    return mins, maxs
+
+
+def stl_bounding_box(path_to_stl, chunk_size=1 << 20):
+    """Reads an ascii or binary STL file to determine its bounding box
+
+    Parameters
+    ----------
+    path_to_stl : str
+        Path to the stl file
+    chunk_size : int, optional
+        Number of triangles (binary) or of bytes (ascii) processed at once
 
+    Returns
+    -------
+    tuple
+        (xmin, xmax), (ymin, ymax), (zmin, zmax)
+
+    References
+    ----------
+    http://stackoverflow.com/questions/7566825/python-parsing-binary-stl-file
+    http://sukhbinder.wordpress.com/2013/11/28/
+                              binary-stl-file-reader-in-python-powered-by-numpy/
+    """
+    if _is_binary_stl(path_to_stl):
+        logger.info('Reading binary stl file : %s' % path_to_stl)
+        mins, maxs = _binary_stl_bounds(path_to_stl, chunk_size)
+        logger.info('Finished reading binary stl file')
+    else:
+        logger.info('Reading ascii stl file : %s' % path_to_stl)
+        mins, maxs = _ascii_stl_bounds(path_to_stl, chunk_size)
         logger.info('Finished reading ascii stl file')
 
+    xmin, ymin, zmin = [float(value) for value in mins]
+    xmax, ymax, zmax = [float(value) for value in maxs]
     return (xmin, xmax), (ymin, ymax), (zmin, zmax)
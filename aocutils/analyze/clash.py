@@ -0,0 +1,289 @@
+# coding: utf-8
+
+r"""Clash (interference) detection between the parts of an assembly
+
+The pairs of parts go through stages of increasing cost, a pair leaves the
+pipeline as soon as a stage proves it clear :
+
+1. axis aligned bounding boxes (sweep and prune over all the parts)
+2. oriented bounding boxes
+3. minimum distance (BRepExtrema)
+4. boolean common and its volume, only for the pairs in contact
+
+"""
+
+import logging
+
+import numpy as np
+
+from aocutils.analyze.bounds import BoundingBox, OrientedBoundingBox
+from aocutils.analyze.distance import MinimumDistance, sweep_and_prune
+from aocutils.analyze.global_ import VOLUME, mass_properties
+from aocutils.operations.boolean import common
+from aocutils.parallel import BrepFile, pool_map, worker_sub_shapes
+from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
+from aocutils.topology import Topo
+
+logger = logging.getLogger(__name__)
+
+TOUCH = "touch"
+CLEARANCE_VIOLATION = "clearance_violation"
+INTERFERENCE = "interference"
+
+
+class Clash(object):
+    r"""Clash between 2 parts
+
+    Parameters
+    ----------
+    i : int
+        Index of the first part
+    j : int
+        Index of the second part, i < j
+    kind : str
+        TOUCH, CLEARANCE_VIOLATION or INTERFERENCE
+    distance : float
+        Minimum distance between the parts (0 for touch and interference)
+    volume : float
+        Volume of the common part (0 for touch and clearance violation)
+    points : np.ndarray
+        (2, 3) a point of the minimum distance on each part
+
+    """
+    def __init__(self, i, j, kind, distance, volume, points):
+        self.i = i
+        self.j = j
+        self.kind = kind
+        self.distance = distance
+        self.volume = volume
+        self.points = points
+
+    def __repr__(self):
+        return "Clash(%i, %i, %s, distance=%g, volume=%g)" % \
+               (self.i, self.j, self.kind, self.distance, self.volume)
+
+
+def _common_volume(shape_1, shape_2):
+    r"""Volume of the common part of 2 shapes, the throwaway solids of the
+    boolean common are not cached"""
+    return sum(mass_properties(solid, VOLUME, cache=False).mass
+               for solid in Topo(common(shape_1, shape_2)).solids)
+
+
+def _narrow_phase(shapes, pairs, clearance, tolerance, volume_tolerance):
+    r"""Minimum distance and, for the pairs in contact, common volume
+
+    Returns
+    -------
+    list
+        (kind or None, distance, volume, points) for each pair,
+        kind is None if the pair does not clash
+
+    """
+    results = list()
+    for i, j in pairs:
+        minimum_distance = MinimumDistance(shapes[i], shapes[j])
+        distance = minimum_distance.minimum_distance
+        point_1, point_2 = minimum_distance.point_pairs[0]
+        points = np.array([(point_1.X(), point_1.Y(), point_1.Z()),
+                           (point_2.X(), point_2.Y(), point_2.Z())])
+        volume = 0.
+        if distance > clearance + tolerance:
+            kind = None
+        elif distance > tolerance:
+            kind = CLEARANCE_VIOLATION
+        else:
+            volume = _common_volume(shapes[i], shapes[j])
+            kind = INTERFERENCE if volume > volume_tolerance else TOUCH
+        results.append((kind, distance, volume, points))
+    return results
+
+
+def _narrow_phase_task(task):
+    r"""_narrow_phase() for a chunk of pairs, in a worker process"""
+    filename, pairs, clearance, tolerance, volume_tolerance = task
+    return _narrow_phase(worker_sub_shapes(filename), pairs, clearance,
+                         tolerance, volume_tolerance)
+
+
+class ClashDetector(object):
+    r"""Staged clash detection between the parts of an assembly
+
+    Parameters
+    ----------
+    shapes : list[TopoDS_Shape]
+        The parts
+    clearance : float, optional
+        Parts closer than clearance (but not in contact) are reported as
+        clearance violations. The default is 0 (only contacts)
+    tolerance : float, optional
+        Distance under which 2 parts are in contact
+    volume_tolerance : float, optional
+        Common volume above which a contact is an interference
+    processes : int, optional
+        Number of worker processes for the distance and boolean stages,
+        1 (default) runs in this process,
+        see aocutils.parallel.number_of_processes()
+    chunk_size : int, optional
+        Number of pairs per worker task
+
+    """
+    def __init__(self,
+                 shapes,
+                 clearance=0.,
+                 tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+                 volume_tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+                 processes=1,
+                 chunk_size=20):
+        self._shapes = list(shapes)
+        self._clearance = clearance
+        self._tolerance = tolerance
+        self._volume_tolerance = volume_tolerance
+        self._processes = processes
+        self._chunk_size = chunk_size
+        self._boxes = np.array([self._box(shape)
+                                for shape in self._shapes]).reshape(-1, 6)
+        self._obbs = [None] * len(self._shapes)
+        self._clashes = dict()
+        self._stage_counts = dict()
+
+    def _box(self, shape):
+        r"""Axis aligned bounding box as a (6,) array"""
+        return np.array(BoundingBox(shape, self._tolerance).as_tuple)
+
+    def _obb(self, index):
+        r"""Oriented bounding box of a part, enlarged by half the clearance
+        so that disjoint boxes prove a clearance-free pair"""
+        if self._obbs[index] is None:
+            obb = OrientedBoundingBox(self._shapes[index])
+            obb.bnd_obb.Enlarge(self._clearance / 2. + self._tolerance)
+            self._obbs[index] = obb
+        return self._obbs[index]
+
+    @property
+    def shapes(self):
+        r"""The parts"""
+        return self._shapes
+
+    @property
+    def clashes(self):
+        r"""Current clashes, sorted by pair
+
+        Returns
+        -------
+        list[Clash]
+
+        """
+        return [self._clashes[pair] for pair in sorted(self._clashes)]
+
+    @property
+    def stage_counts(self):
+        r"""Number of pairs that entered each stage during the last
+        perform() or move()
+
+        Returns
+        -------
+        dict
+            Keys are 'aabb', 'obb', 'distance' and 'boolean'
+
+        """
+        return self._stage_counts
+
+    def clashes_of_kind(self, kind):
+        r"""Current clashes of a kind
+
+        Parameters
+        ----------
+        kind : str
+            TOUCH, CLEARANCE_VIOLATION or INTERFERENCE
+
+        Returns
+        -------
+        list[Clash]
+
+        """
+        return [clash for clash in self.clashes if clash.kind == kind]
+
+    def perform(self):
+        r"""Detect the clashes between all the parts
+
+        Returns
+        -------
+        list[Clash]
+
+        """
+        n = len(self._shapes)
+        pairs = sweep_and_prune(self._boxes[:, :3],
+                                self._boxes[:, 3:],
+                                self._clearance)
+        self._clashes = dict()
+        self._run(pairs, n * (n - 1) // 2)
+        return self.clashes
+
+    def move(self, index, shape):
+        r"""Replace a part (e.g. after it moved) and update the clashes,
+        only the pairs of that part go through the pipeline again
+
+        Parameters
+        ----------
+        index : int
+            Index of the part
+        shape : TopoDS_Shape
+            The new shape of the part
+
+        Returns
+        -------
+        list[Clash]
+            All the current clashes
+
+        """
+        self._shapes[index] = shape
+        self._boxes[index] = self._box(shape)
+        self._obbs[index] = None
+        for pair in [pair for pair in self._clashes if index in pair]:
+            del self._clashes[pair]
+
+        lower, upper = self._boxes[:, :3], self._boxes[:, 3:]
+        overlap = np.all((lower <= upper[index] + self._clearance) &
+                         (lower[index] <= upper + self._clearance), axis=1)
+        overlap[index] = False
+        others = np.flatnonzero(overlap)
+        pairs = np.column_stack((np.minimum(others, index),
+                                 np.maximum(others, index)))
+        self._run(pairs, len(self._shapes) - 1)
+        return self.clashes
+
+    def _run(self, pairs, number_of_pairs):
+        r"""Oriented boxes, distance and boolean stages on the pairs
+        that passed the axis aligned boxes stage"""
+        self._stage_counts = {"aabb": number_of_pairs,
+                              "obb": len(pairs),
+                              "distance": 0,
+                              "boolean": 0}
+        pairs = [(i, j) for i, j in pairs.tolist()
+                 if not self._obb(i).is_out(self._obb(j))]
+        self._stage_counts["distance"] = len(pairs)
+        if self._processes == 1 or len(pairs) <= self._chunk_size:
+            results = _narrow_phase(self._shapes, pairs, self._clearance,
+                                    self._tolerance, self._volume_tolerance)
+        else:
+            with BrepFile(self._shapes) as brep_file:
+                tasks = [(brep_file.filename,
+                          pairs[k:k + self._chunk_size],
+                          self._clearance,
+                          self._tolerance,
+                          self._volume_tolerance)
+                         for k in range(0, len(pairs), self._chunk_size)]
+                results = [result
+                           for chunk in pool_map(_narrow_phase_task,
+                                                 tasks,
+                                                 filename=brep_file.filename,
+                                                 processes=self._processes)
+                           for result in chunk]
+        for (i, j), (kind, distance, volume, points) in zip(pairs, results):
+            if distance <= self._tolerance:
+                self._stage_counts["boolean"] += 1
+            if kind is not None:
+                self._clashes[(i, j)] = Clash(i, j, kind, distance, volume,
+                                              points)
+        logger.debug("Clash stages : %s" % str(self._stage_counts))
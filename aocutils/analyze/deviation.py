@@ -0,0 +1,402 @@
+# coding: utf-8
+
+r"""Deviation of point clouds (e.g. metrology scans) from a shape
+
+The triangulation of the shape is indexed once in a TriangleBVH. For each
+point, the nearest triangle gives the candidate face, the point is then
+projected exactly on the surface of that face. The projections that fall
+outside of the face boundaries (points facing an edge or a vertex of the
+shape) are recomputed with BRepExtrema_DistShapeShape on the face. On a
+coarse mesh, the nearest triangle may belong to a neighbour of the closest
+face near the face boundaries : the points are also projected on the faces
+adjacent to the candidate face (through the shared edges) whose bounding
+box is closer than the candidate distance, the closest face wins.
+
+"""
+
+import logging
+
+import numpy as np
+
+from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeVertex
+from OCC.Core.BRepExtrema import BRepExtrema_DistShapeShape, \
+    BRepExtrema_IsInFace
+from OCC.Core.gp import gp_Pnt
+
+from aocutils.analyze.bounds import BoundingBox
+from aocutils.brep.face import Face
+from aocutils.bvh import TriangleBVH
+from aocutils.parallel import BrepFile, pool_map, worker_shape
+from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
+
+logger = logging.getLogger(__name__)
+
+# deviation analyses built by the current (worker) process
+# key: (BREP file path, tolerance); value: DeviationAnalysis
+_worker_analyses = dict()
+
+
+class Deviations(object):
+    r"""Signed distances of points to a shape
+
+    Parameters
+    ----------
+    points : np.ndarray
+        (N, 3) measured points
+    distances : np.ndarray
+        (N,) signed distances, positive on the side the face normals
+        point to (outside of a solid)
+    faces : np.ndarray
+        (N,) int32 index of the closest face,
+        see aocutils.topology.Topo(shape, indexed=True)
+    uvs : np.ndarray
+        (N, 2) parameters of the closest points on the closest faces
+    closest_points : np.ndarray
+        (N, 3) closest points on the shape
+
+    """
+    def __init__(self, points, distances, faces, uvs, closest_points):
+        self._points = points
+        self._distances = distances
+        self._faces = faces
+        self._uvs = uvs
+        self._closest_points = closest_points
+
+    @classmethod
+    def concatenate(cls, deviations_list):
+        r"""Deviations of consecutive chunks of points
+
+        Parameters
+        ----------
+        deviations_list : list[Deviations]
+
+        Returns
+        -------
+        Deviations
+
+        """
+        return cls(np.concatenate([d.points for d in deviations_list]),
+                   np.concatenate([d.distances for d in deviations_list]),
+                   np.concatenate([d.faces for d in deviations_list]),
+                   np.concatenate([d.uvs for d in deviations_list]),
+                   np.concatenate([d.closest_points
+                                   for d in deviations_list]))
+
+    def __len__(self):
+        return len(self._distances)
+
+    @property
+    def points(self):
+        r"""(N, 3) measured points"""
+        return self._points
+
+    @property
+    def distances(self):
+        r"""(N,) signed distances"""
+        return self._distances
+
+    @property
+    def faces(self):
+        r"""(N,) closest face indices"""
+        return self._faces
+
+    @property
+    def uvs(self):
+        r"""(N, 2) parameters on the closest faces"""
+        return self._uvs
+
+    @property
+    def closest_points(self):
+        r"""(N, 3) closest points on the shape"""
+        return self._closest_points
+
+    def statistics(self, tolerance=None):
+        r"""Summary statistics of the signed distances
+
+        Parameters
+        ----------
+        tolerance : float, optional
+            If given, the fraction of the points whose absolute distance
+            is within tolerance is added as 'within_tolerance'
+
+        Returns
+        -------
+        dict
+            number_of_points, min, max, mean, std, rms, mean_absolute,
+            max_absolute and the 'p50', 'p95' and 'p99' percentiles of the
+            absolute distances
+
+        """
+        distances = self._distances
+        if len(distances) == 0:
+            msg = "No deviations to compute statistics on"
+            logger.error(msg)
+            raise ValueError(msg)
+        absolute = np.abs(distances)
+        statistics = {"number_of_points": len(distances),
+                      "min": float(distances.min()),
+                      "max": float(distances.max()),
+                      "mean": float(distances.mean()),
+                      "std": float(distances.std()),
+                      "rms": float(np.sqrt(np.mean(distances ** 2))),
+                      "mean_absolute": float(absolute.mean()),
+                      "max_absolute": float(absolute.max())}
+        for percentile in (50, 95, 99):
+            statistics["p%i" % percentile] = \
+                float(np.percentile(absolute, percentile))
+        if tolerance is not None:
+            statistics["within_tolerance"] = \
+                float(np.count_nonzero(absolute <= tolerance)) / len(absolute)
+        return statistics
+
+    def histogram(self, bins=50, range_=None, absolute=False):
+        r"""Histogram of the distances
+
+        Parameters
+        ----------
+        bins : int or array-like, optional
+            Number of bins or bin edges, see np.histogram
+        range_ : tuple[float], optional
+            (min, max) of the bins, default is the range of the distances
+        absolute : bool, optional
+            Histogram of the absolute distances
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            Counts and bin edges
+
+        """
+        distances = np.abs(self._distances) if absolute else self._distances
+        return np.histogram(distances, bins=bins, range=range_)
+
+    def face_statistics(self):
+        r"""Per face summary of the signed distances
+
+        Returns
+        -------
+        dict
+            key: face index; value: (number of points, min, max, rms)
+
+        """
+        result = dict()
+        for face_index in np.unique(self._faces).tolist():
+            face_distances = self._distances[self._faces == face_index]
+            result[face_index] = (len(face_distances),
+                                  float(face_distances.min()),
+                                  float(face_distances.max()),
+                                  float(np.sqrt(np.mean(face_distances ** 2))))
+        return result
+
+
+class DeviationAnalysis(object):
+    r"""Signed distances of point arrays to a shape, the acceleration
+    structure is built once
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape
+        Shape with faces, it is meshed if it is not
+    tolerance : float, optional
+        Precision of the projections
+    leaf_size : int, optional
+        See aocutils.bvh.TriangleBVH
+
+    """
+    def __init__(self,
+                 shape,
+                 tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+                 leaf_size=4):
+        self._shape = shape
+        self._tolerance = tolerance
+        self._leaf_size = leaf_size
+        self._bvh = TriangleBVH(shape, leaf_size)
+        self._face_face = self._bvh.topo.graph().face_face
+        self._faces = dict()
+        self._face_boxes = dict()
+
+    @property
+    def shape(self):
+        r"""The analyzed shape"""
+        return self._shape
+
+    @property
+    def tolerance(self):
+        r"""Precision of the projections"""
+        return self._tolerance
+
+    def face(self, face_index):
+        r"""Face from a face index, the Face instances (and the adaptors and
+        classifier they hold) are kept for the next points
+
+        Parameters
+        ----------
+        face_index : int
+
+        Returns
+        -------
+        aocutils.brep.face.Face
+
+        """
+        if face_index not in self._faces:
+            face = Face(self._bvh.face(face_index))
+            face.tolerance = self._tolerance
+            self._faces[face_index] = face
+        return self._faces[face_index]
+
+    def face_box(self, face_index):
+        r"""(6,) axis aligned bounding box of a face, kept for the next
+        points"""
+        if face_index not in self._face_boxes:
+            self._face_boxes[face_index] = np.array(
+                BoundingBox(self.face(face_index).topods_face,
+                            self._tolerance).as_tuple)
+        return self._face_boxes[face_index]
+
+    def perform(self, points, processes=1, chunk_size=10000, timeout=None):
+        r"""Signed distances of points to the shape
+
+        Parameters
+        ----------
+        points : np.ndarray
+            (N, 3) points
+        processes : int, optional
+            Number of worker processes, 1 (default) runs in this process,
+            see aocutils.parallel.number_of_processes()
+        chunk_size : int, optional
+            Number of points per worker task
+        timeout : float, optional
+            Maximum time in seconds to wait for the workers
+
+        Returns
+        -------
+        Deviations
+
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if processes == 1 or len(points) <= chunk_size:
+            return self._perform(points)
+
+        offsets = range(0, len(points), chunk_size)
+        with BrepFile(self._shape) as brep_file:
+            tasks = [(brep_file.filename,
+                      self._tolerance,
+                      self._leaf_size,
+                      points[offset:offset + chunk_size])
+                     for offset in offsets]
+            deviations_list = pool_map(_perform_task,
+                                       tasks,
+                                       filename=brep_file.filename,
+                                       processes=processes,
+                                       timeout=timeout)
+        return Deviations.concatenate(deviations_list)
+
+    def _perform(self, points):
+        r"""Signed distances of points to the shape, in this process"""
+        mesh_faces, _, _ = self._bvh.closest_points(points)
+        mesh_faces = mesh_faces.astype(np.int32)
+        faces = mesh_faces.copy()
+        uvs = np.empty((len(points), 2))
+        closest = np.empty((len(points), 3))
+        distances = np.empty(len(points))
+        candidates = np.unique(mesh_faces).tolist()
+        for face_index in candidates:
+            members = np.flatnonzero(mesh_faces == face_index)
+            (uvs[members],
+             closest[members],
+             distances[members]) = self._face_distances(face_index,
+                                                        points[members])
+
+        # the nearest triangle may belong to a neighbour of the closest face
+        for face_index in candidates:
+            members = np.flatnonzero(mesh_faces == face_index)
+            for neighbour in self._face_face.neighbours(face_index).tolist():
+                box = self.face_box(neighbour)
+                gaps = np.maximum(np.maximum(box[:3] - points[members],
+                                             points[members] - box[3:]),
+                                  0.)
+                near = members[np.linalg.norm(gaps, axis=1) <
+                               distances[members]]
+                if len(near) == 0:
+                    continue
+                (neighbour_uvs,
+                 neighbour_closest,
+                 neighbour_distances) = self._face_distances(neighbour,
+                                                             points[near])
+                better = neighbour_distances < distances[near]
+                near = near[better]
+                faces[near] = neighbour
+                uvs[near] = neighbour_uvs[better]
+                closest[near] = neighbour_closest[better]
+                distances[near] = neighbour_distances[better]
+
+        # the sign is given by the face normal at the closest point
+        for face_index in np.unique(faces).tolist():
+            members = np.flatnonzero(faces == face_index)
+            face = self.face(face_index)
+            u_min, u_max, v_min, v_max = face.domain
+            u, v = uvs[members, 0], uvs[members, 1]
+            normals = face.normals(np.clip(u, u_min, u_max),
+                                   np.clip(v, v_min, v_max))
+            sides = np.einsum("ij,ij->i",
+                              points[members] - closest[members],
+                              normals)
+            distances[members] *= np.where(sides < 0., -1., 1.)
+        return Deviations(points, distances, faces, uvs, closest)
+
+    def _face_distances(self, face_index, points):
+        r"""Unsigned distances from points to a trimmed face
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            (N, 2) parameters, (N, 3) closest points and (N,) distances
+
+        """
+        face = self.face(face_index)
+        uvs, closest, distances = face.project_points(points)
+        u_min, u_max, v_min, v_max = face.domain
+        for i, (u, v) in enumerate(uvs.tolist()):
+            if (u_min <= u <= u_max and v_min <= v <= v_max and
+                    face.on_trimmed(u, v)):
+                continue
+            uvs[i], closest[i], distances[i] = \
+                self._face_distance(face, points[i])
+        return uvs, closest, distances
+
+    @staticmethod
+    def _face_distance(face, xyz):
+        r"""Distance from a point to a trimmed face, the closest point may be
+        on its boundary
+
+        Returns
+        -------
+        tuple
+            (u, v), (x, y, z) of the closest point and the distance
+
+        """
+        vertex = BRepBuilderAPI_MakeVertex(gp_Pnt(*xyz.tolist())).Vertex()
+        extrema = BRepExtrema_DistShapeShape(vertex, face.topods_face)
+        if not extrema.IsDone() or extrema.NbSolution() == 0:
+            msg = "Distance from point %s to the face failed" % str(xyz)
+            logger.error(msg)
+            raise AssertionError(msg)
+        pnt = extrema.PointOnShape2(1)
+        if extrema.SupportTypeShape2(1) == BRepExtrema_IsInFace:
+            uv = extrema.ParOnFaceS2(1)
+        else:
+            # on an edge or a vertex of the face
+            uv = face.point_to_parameter(pnt)
+        return uv, (pnt.X(), pnt.Y(), pnt.Z()), extrema.Value()
+
+
+def _perform_task(task):
+    r"""Deviations of a chunk of points to the shape of a BREP file,
+    in a worker process"""
+    filename, tolerance, leaf_size, points = task
+    key = (filename, tolerance)
+    if key not in _worker_analyses:
+        _worker_analyses[key] = DeviationAnalysis(worker_shape(filename),
+                                                  tolerance,
+                                                  leaf_size)
+    return _worker_analyses[key]._perform(points)
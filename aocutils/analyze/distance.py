@@ -4,9 +4,13 @@ r"""distance"""
 
 import logging
 
+import numpy as np
+
 from OCC.Core.BRepExtrema import BRepExtrema_DistShapeShape
 
 from aocutils.common import AssertIsDone
+from aocutils.parallel import BrepFile, pool_map, worker_sub_shapes
+from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
 
 logger = logging.getLogger(__name__)
 
@@ -75,3 +79,266 @@ class MinimumDistance(object):
             raise RuntimeError(msg)
         # assert self._nb_solutions == len(self._points_pairs)
         return self._nb_solutions
+
+
+def sweep_and_prune(lower, upper, threshold=0.):
+    r"""Pairs of axis aligned boxes that are closer than threshold
+
+    The boxes are sorted along the axis where their minimum coordinates
+    spread the most, each box is paired with the following boxes that
+    start before its end (plus threshold), then the pairs are checked
+    on the 3 axes.
+
+    Parameters
+    ----------
+    lower : np.ndarray
+        (N, 3) minimum corners
+    upper : np.ndarray
+        (N, 3) maximum corners
+    threshold : float, optional
+        Boxes whose gap along an axis is larger than threshold are not paired
+
+    Returns
+    -------
+    np.ndarray
+        (P, 2) int64 pairs (i, j) with i < j, sorted
+
+    """
+    lower = np.asarray(lower, dtype=np.float64).reshape(-1, 3)
+    upper = np.asarray(upper, dtype=np.float64).reshape(-1, 3)
+    if len(lower) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    axis = int(np.argmax(np.ptp(lower, axis=0)))
+    order = np.argsort(lower[:, axis], kind="stable")
+    sorted_lower = lower[order, axis]
+    ends = np.searchsorted(sorted_lower,
+                           upper[order, axis] + threshold,
+                           side="right")
+    counts = np.maximum(ends - np.arange(len(order)) - 1, 0)
+    firsts = np.repeat(np.arange(len(order)), counts)
+    seconds = (firsts + 1 + np.arange(counts.sum()) -
+               np.repeat(np.cumsum(counts) - counts, counts))
+    firsts, seconds = order[firsts], order[seconds]
+    overlap = np.all((lower[firsts] <= upper[seconds] + threshold) &
+                     (lower[seconds] <= upper[firsts] + threshold), axis=1)
+    pairs = np.sort(np.column_stack((firsts[overlap], seconds[overlap])),
+                    axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+class ClearanceMatrix(object):
+    r"""Sparse symmetric matrix of the minimum distances between shapes,
+    only the pairs closer than a threshold are stored
+
+    Parameters
+    ----------
+    number_of_shapes : int
+    pairs : np.ndarray
+        (P, 2) int64 shape indices (i, j), i < j
+    distances : np.ndarray
+        (P,) minimum distances
+    points : np.ndarray
+        (P, 2, 3) a solution point on shape i and on shape j
+    threshold : float
+    number_of_candidates : int
+        Number of pairs that passed the bounding box culling
+
+    """
+    def __init__(self,
+                 number_of_shapes,
+                 pairs,
+                 distances,
+                 points,
+                 threshold,
+                 number_of_candidates):
+        self._number_of_shapes = number_of_shapes
+        self._pairs = pairs
+        self._distances = distances
+        self._points = points
+        self._threshold = threshold
+        self._number_of_candidates = number_of_candidates
+        self._lookup = dict(((i, j), k)
+                            for k, (i, j) in enumerate(pairs.tolist()))
+
+    def __len__(self):
+        return len(self._distances)
+
+    @property
+    def number_of_shapes(self):
+        r"""Size of the matrix"""
+        return self._number_of_shapes
+
+    @property
+    def pairs(self):
+        r"""(P, 2) shape indices (i, j), i < j"""
+        return self._pairs
+
+    @property
+    def distances(self):
+        r"""(P,) minimum distances"""
+        return self._distances
+
+    @property
+    def points(self):
+        r"""(P, 2, 3) solution points on shape i and on shape j"""
+        return self._points
+
+    @property
+    def threshold(self):
+        r"""Distance above which the pairs are not stored"""
+        return self._threshold
+
+    @property
+    def number_of_candidates(self):
+        r"""Number of exact distance computations that were made"""
+        return self._number_of_candidates
+
+    def distance(self, i, j):
+        r"""Minimum distance between 2 shapes
+
+        Parameters
+        ----------
+        i : int
+        j : int
+
+        Returns
+        -------
+        float or None
+            None if the shapes are farther than the threshold
+
+        """
+        k = self._lookup.get((min(i, j), max(i, j)))
+        return None if k is None else float(self._distances[k])
+
+    def point_pair(self, i, j):
+        r"""Solution points of the minimum distance between 2 shapes
+
+        Parameters
+        ----------
+        i : int
+        j : int
+
+        Returns
+        -------
+        tuple[np.ndarray] or None
+            Point on shape i, point on shape j. None if the shapes are
+            farther than the threshold
+
+        """
+        k = self._lookup.get((min(i, j), max(i, j)))
+        if k is None:
+            return None
+        if i <= j:
+            return self._points[k, 0], self._points[k, 1]
+        return self._points[k, 1], self._points[k, 0]
+
+    def to_dense(self, fill_value=np.inf):
+        r"""Dense (N, N) symmetric matrix
+
+        Parameters
+        ----------
+        fill_value : float, optional
+            Value of the pairs farther than the threshold
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        matrix = np.full((self._number_of_shapes, self._number_of_shapes),
+                         fill_value)
+        np.fill_diagonal(matrix, 0.)
+        matrix[self._pairs[:, 0], self._pairs[:, 1]] = self._distances
+        matrix[self._pairs[:, 1], self._pairs[:, 0]] = self._distances
+        return matrix
+
+
+def _minimum_distances(shapes, pairs):
+    r"""Minimum distances and a solution point pair for pairs of shapes
+
+    Returns
+    -------
+    tuple[np.ndarray]
+        (P,) distances and (P, 2, 3) points
+
+    """
+    distances = np.empty(len(pairs))
+    points = np.empty((len(pairs), 2, 3))
+    for k, (i, j) in enumerate(pairs.tolist()):
+        minimum_distance = MinimumDistance(shapes[i], shapes[j])
+        distances[k] = minimum_distance.minimum_distance
+        point_1, point_2 = minimum_distance.point_pairs[0]
+        points[k] = ((point_1.X(), point_1.Y(), point_1.Z()),
+                     (point_2.X(), point_2.Y(), point_2.Z()))
+    return distances, points
+
+
+def _minimum_distances_task(task):
+    r"""_minimum_distances() for a chunk of pairs, in a worker process"""
+    filename, pairs = task
+    return _minimum_distances(worker_sub_shapes(filename), pairs)
+
+
+def clearance_matrix(shapes,
+                     threshold,
+                     tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+                     processes=1,
+                     chunk_size=50,
+                     timeout=None):
+    r"""Minimum distances between all the pairs of shapes closer than
+    threshold
+
+    The pairs whose (tolerance enlarged) bounding boxes are farther than
+    threshold are culled by sweep_and_prune(), the exact
+    BRepExtrema_DistShapeShape computation only runs on the other pairs.
+
+    Parameters
+    ----------
+    shapes : list[TopoDS_Shape]
+    threshold : float
+    tolerance : float, optional
+        Gap of the bounding boxes
+    processes : int, optional
+        Number of worker processes, 1 (default) runs in this process,
+        see aocutils.parallel.number_of_processes()
+    chunk_size : int, optional
+        Number of pairs per worker task
+    timeout : float, optional
+        Maximum time in seconds to wait for the workers
+
+    Returns
+    -------
+    ClearanceMatrix
+
+    """
+    # bounds.py imports this module
+    from aocutils.analyze.bounds import BoundingBox
+
+    shapes = list(shapes)
+    boxes = np.array([BoundingBox(shape, tolerance).as_tuple
+                      for shape in shapes]).reshape(-1, 6)
+    candidates = sweep_and_prune(boxes[:, :3], boxes[:, 3:], threshold)
+    logger.debug("%i candidate pairs out of %i" %
+                 (len(candidates), len(shapes) * (len(shapes) - 1) // 2))
+
+    if processes == 1 or len(candidates) <= chunk_size:
+        distances, points = _minimum_distances(shapes, candidates)
+    else:
+        with BrepFile(shapes) as brep_file:
+            tasks = [(brep_file.filename, candidates[k:k + chunk_size])
+                     for k in range(0, len(candidates), chunk_size)]
+            results = pool_map(_minimum_distances_task,
+                               tasks,
+                               filename=brep_file.filename,
+                               processes=processes,
+                               timeout=timeout)
+        distances = np.concatenate([result[0] for result in results])
+        points = np.concatenate([result[1] for result in results])
+
+    close = distances <= threshold
+    return ClearanceMatrix(len(shapes),
+                           candidates[close],
+                           distances[close],
+                           points[close],
+                           threshold,
+                           len(candidates))
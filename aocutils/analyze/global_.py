@@ -1,22 +1,443 @@
 # coding: utf-8
 
-r"""Global analysis properties"""
+r"""Global analysis properties
 
+The properties (mass, centre of mass and matrix of inertia) of a shape are
+integrated once per shape, kind and precision, and kept in a bounded module
+level cache : asking a GlobalProperties for its volume, centre and inertia
+only integrates the shape once, as does building several GlobalProperties
+of the same shape. The properties of a compound are aggregated from those
+of its sub-shapes with the parallel axis theorem.
+
+3 modes trade speed for accuracy :
+
+- DEFAULT : BRepGProp default integration, no error estimate
+- ADAPTIVE : BRepGProp adaptive integration up to a relative error eps,
+  which reports the relative error it reached
+- MESH : sums over the triangulation of the shape (the existing one if
+  any), with the divergence theorem for the volumic properties. The error
+  is estimated from the deflection of the triangulation. Not cached
+
+The cache is keyed on the TShape, Location and Orientation of the shapes :
+call clear_cache() after modifying the geometry of a shape in place.
+
+"""
+
+import collections
 import logging
 
+import numpy as np
+
 from OCC.Core.GProp import GProp_GProps
 from OCC.Core.BRepGProp import (
     brepgprop_LinearProperties,
     brepgprop_SurfaceProperties,
     brepgprop_VolumeProperties,
 )
+from OCC.Core.gp import gp_Pnt
 
 import aocutils.topology
+from aocutils.mesh import mesh, triangulation
+from aocutils.parallel import BrepFile, pool_map, worker_sub_shapes
 from aocutils.types_ import topo_lut
 from aocutils.exceptions import WrongTopologicalType
 
 logger = logging.getLogger(__name__)
 
+LINEAR = "linear"
+SURFACE = "surface"
+VOLUME = "volume"
+
+DEFAULT = "default"
+ADAPTIVE = "adaptive"
+MESH = "mesh"
+
+# eps of the ADAPTIVE mode when none is given
+default_eps = 1e-6
+
+# key: (ShapeKey, orientation, kind, mode, eps)
+# value: (GProp_GProps, MassProperties)
+_cache = collections.OrderedDict()
+_cache_size = 4096
+
+
+def clear_cache():
+    r"""Forget the properties computed so far"""
+    _cache.clear()
+
+
+def set_cache_size(size):
+    r"""Set the maximum number of cached properties
+
+    Parameters
+    ----------
+    size : int
+        0 disables the cache
+
+    """
+    global _cache_size
+    _cache_size = size
+    while len(_cache) > _cache_size:
+        _cache.popitem(last=False)
+
+
+class MassProperties(object):
+    r"""Global properties of a shape, computed in a single pass
+
+    The mass is the length, area or volume of the shape depending on its
+    kind (unit density).
+
+    Parameters
+    ----------
+    kind : str
+        LINEAR, SURFACE or VOLUME
+    mass : float
+    centre : np.ndarray
+        (3,) centre of mass
+    inertia : np.ndarray
+        (3, 3) matrix of inertia at the centre of mass
+    eps : float or None
+        Relative precision requested for the integration
+    error : float or None
+        Estimated absolute error on the mass, None if unknown
+    mode : str
+        DEFAULT, ADAPTIVE or MESH
+
+    """
+    def __init__(self, kind, mass, centre, inertia, eps=None, error=None,
+                 mode=DEFAULT):
+        self.kind = kind
+        self.mass = mass
+        self.centre = centre
+        self.inertia = inertia
+        self.eps = eps
+        self.error = error
+        self.mode = mode
+
+    @property
+    def relative_error(self):
+        r"""Estimated relative error on the mass, None if unknown"""
+        if self.error is None:
+            return None
+        if self.mass == 0.:
+            return 0. if self.error == 0. else float("inf")
+        return self.error / abs(self.mass)
+
+    @classmethod
+    def from_system(cls, system, kind, eps=None, relative_error=None,
+                    mode=DEFAULT):
+        r"""Properties of an integrated GProp_GProps
+
+        Parameters
+        ----------
+        system : GProp_GProps
+        kind : str
+        eps : float, optional
+        relative_error : float, optional
+            Relative error reported by the integration
+        mode : str, optional
+
+        Returns
+        -------
+        MassProperties
+
+        """
+        centre = system.CentreOfMass()
+        matrix = system.MatrixOfInertia()
+        inertia = np.array([[matrix.Value(i, j) for j in range(1, 4)]
+                            for i in range(1, 4)])
+        mass = system.Mass()
+        return cls(kind,
+                   mass,
+                   np.array([centre.X(), centre.Y(), centre.Z()]),
+                   inertia,
+                   eps,
+                   None if relative_error is None
+                   else relative_error * abs(mass),
+                   mode)
+
+    @classmethod
+    def combine(cls, properties_list, kind=None):
+        r"""Properties of the union of disjoint shapes
+
+        The centres are averaged with the masses as weights and the
+        matrices of inertia are moved to the common centre of mass with the
+        parallel axis theorem, without integrating again. The errors add up.
+
+        Parameters
+        ----------
+        properties_list : list[MassProperties]
+        kind : str, optional
+            Default is the kind of the first properties
+
+        Returns
+        -------
+        MassProperties
+
+        """
+        if kind is None:
+            kind = properties_list[0].kind if properties_list else VOLUME
+        masses = np.array([p.mass for p in properties_list])
+        centres = np.array([p.centre for p in properties_list]).reshape(-1, 3)
+        inertias = np.array([p.inertia
+                             for p in properties_list]).reshape(-1, 3, 3)
+        eps = [p.eps for p in properties_list if p.eps is not None]
+        errors = [p.error for p in properties_list]
+        mass, centre, inertia = combine_arrays(masses, centres, inertias)
+        return cls(kind,
+                   mass,
+                   centre,
+                   inertia,
+                   max(eps) if eps else None,
+                   None if None in errors else float(sum(errors)),
+                   properties_list[0].mode if properties_list else DEFAULT)
+
+    def __repr__(self):
+        return "MassProperties(%s, mass=%g, centre=%s)" % (self.kind,
+                                                           self.mass,
+                                                           str(self.centre))
+
+
+def combine_arrays(masses, centres, inertias):
+    r"""Total mass, centre of mass and matrix of inertia (at the centre of
+    mass) of disjoint bodies, with the parallel axis theorem
+
+    Parameters
+    ----------
+    masses : np.ndarray
+        (N,)
+    centres : np.ndarray
+        (N, 3) centres of mass
+    inertias : np.ndarray
+        (N, 3, 3) matrices of inertia at the centres of mass
+
+    Returns
+    -------
+    tuple
+        mass, (3,) centre, (3, 3) matrix of inertia
+
+    """
+    mass = float(np.sum(masses))
+    if mass == 0.:
+        return 0., np.zeros(3), np.zeros((3, 3))
+    centre = np.dot(masses, centres) / mass
+    offsets = centres - centre
+    square_norms = np.einsum("ij,ij->i", offsets, offsets)
+    transport = (square_norms[:, np.newaxis, np.newaxis] * np.eye(3) -
+                 np.einsum("ij,ik->ijk", offsets, offsets))
+    inertia = np.sum(inertias +
+                     masses[:, np.newaxis, np.newaxis] * transport, axis=0)
+    return mass, centre, inertia
+
+
+def _resolve_mode(mode, eps):
+    r"""Mode and eps to use : ADAPTIVE if eps is given and no mode is"""
+    if mode is None:
+        mode = DEFAULT if eps is None else ADAPTIVE
+    if mode not in (DEFAULT, ADAPTIVE, MESH):
+        msg = "Unknown mode %s, use DEFAULT, ADAPTIVE or MESH" % str(mode)
+        logger.error(msg)
+        raise ValueError(msg)
+    if mode == ADAPTIVE:
+        return mode, default_eps if eps is None else eps
+    return mode, None
+
+
+def _integrate(shape, kind, eps):
+    r"""Integrated GProp_GProps of a (non compound) shape and the relative
+    error reported by the adaptive integration (None if eps is None)"""
+    system = GProp_GProps()
+    relative_error = None
+    if kind == LINEAR:
+        # no precision control for the linear properties
+        brepgprop_LinearProperties(shape, system)
+    elif kind == SURFACE:
+        if eps is None:
+            brepgprop_SurfaceProperties(shape, system)
+        else:
+            relative_error = brepgprop_SurfaceProperties(shape,
+                                                         system,
+                                                         float(eps))
+    else:
+        if eps is None:
+            brepgprop_VolumeProperties(shape, system)
+        else:
+            relative_error = brepgprop_VolumeProperties(shape,
+                                                        system,
+                                                        float(eps))
+    return system, relative_error
+
+
+def _cached(shape, kind, eps, mode=DEFAULT, cache=True):
+    r"""Cached (GProp_GProps, MassProperties) of a (non compound) shape,
+    integrated in the DEFAULT or ADAPTIVE mode. With cache False, the
+    cache is neither read nor filled"""
+    key = (aocutils.topology.ShapeKey(shape), shape.Orientation(), kind,
+           mode, eps)
+    if cache and key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    system, relative_error = _integrate(shape, kind, eps)
+    value = system, MassProperties.from_system(system, kind, eps,
+                                               relative_error, mode)
+    if cache and _cache_size > 0:
+        _cache[key] = value
+        while len(_cache) > _cache_size:
+            _cache.popitem(last=False)
+    return value
+
+
+def _mesh_properties(shape, kind, cache=True):
+    r"""Properties of the triangulation of a (non compound) shape
+
+    The surfacic properties are sums over the triangles, the volumic ones
+    sums over the tetrahedra the triangles make with a reference point
+    (divergence theorem, the triangles are oriented outwards). The faces
+    without a triangulation are meshed with the aocutils.mesh.mesh()
+    defaults, the existing triangulations are kept.
+
+    A triangle whose face has a deflection d misses a cap of about
+    pi * d ** 2 of area and area * d / 2 of volume (spherical cap), the
+    error estimate is the sum over the triangles.
+
+    """
+    if kind == LINEAR:
+        # the edges are integrated exactly, at a negligible cost
+        return _cached(shape, kind, None, cache=cache)[1]
+    shape_triangulation = triangulation(shape)
+    if np.any(np.isnan(shape_triangulation.deflections)):
+        mesh(shape)
+        shape_triangulation = triangulation(shape)
+        if np.any(np.isnan(shape_triangulation.deflections)):
+            msg = "%i faces could not be meshed" % \
+                  np.count_nonzero(np.isnan(shape_triangulation.deflections))
+            logger.error(msg)
+            raise ValueError(msg)
+    corners = shape_triangulation.corners
+    if len(corners) == 0:
+        return MassProperties(kind, 0., np.zeros(3), np.zeros((3, 3)),
+                              error=0., mode=MESH)
+
+    # coordinates relative to a reference point limit the cancellations
+    reference = shape_triangulation.vertices.mean(axis=0)
+    a, b, c = (corners[:, 0] - reference,
+               corners[:, 1] - reference,
+               corners[:, 2] - reference)
+    sums = a + b + c
+    outer_sums = (np.einsum("ti,tj->tij", a, a) +
+                  np.einsum("ti,tj->tij", b, b) +
+                  np.einsum("ti,tj->tij", c, c) +
+                  np.einsum("ti,tj->tij", sums, sums))
+    areas = 0.5 * np.linalg.norm(np.cross(b - a, c - a), axis=1)
+    deflections = \
+        shape_triangulation.deflections[shape_triangulation.face_indices]
+    if kind == SURFACE:
+        masses = areas
+        first_moments = masses[:, np.newaxis] * sums / 3.
+        second_moments = masses / 12.
+        error = float(np.pi * np.sum(deflections ** 2))
+    else:
+        masses = np.einsum("ij,ij->i", a, np.cross(b, c)) / 6.
+        first_moments = masses[:, np.newaxis] * sums / 4.
+        second_moments = masses / 20.
+        error = float(np.sum(areas * deflections) / 2.)
+
+    mass = float(masses.sum())
+    if mass == 0.:
+        return MassProperties(kind, 0., reference, np.zeros((3, 3)),
+                              error=error, mode=MESH)
+    centre = first_moments.sum(axis=0) / mass
+    # second moment at the centre of mass, then matrix of inertia
+    second_moment = (np.einsum("t,tij->ij", second_moments, outer_sums) -
+                     mass * np.outer(centre, centre))
+    inertia = np.trace(second_moment) * np.eye(3) - second_moment
+    return MassProperties(kind, mass, centre + reference, inertia,
+                          error=error, mode=MESH)
+
+
+def _properties(shape, kind, eps, mode, cache=True):
+    r"""MassProperties of a (non compound) shape in any mode"""
+    if mode == MESH:
+        return _mesh_properties(shape, kind, cache)
+    return _cached(shape, kind, eps, mode, cache)[1]
+
+
+def _sub_shapes(shape, kind):
+    r"""Sub-shapes of a compound whose properties are aggregated"""
+    topo = aocutils.topology.Topo(shape, return_iter=False)
+    return {LINEAR: topo.edges, SURFACE: topo.faces, VOLUME: topo.solids}[kind]
+
+
+def _properties_task(task):
+    r"""Properties of sub-shapes of a BREP file, in a worker process"""
+    filename, indices, kind, eps, mode, cache = task
+    sub_shapes = worker_sub_shapes(filename)
+    return [_properties(sub_shapes[i], kind, eps, mode, cache)
+            for i in indices]
+
+
+def mass_properties(shape,
+                    kind,
+                    eps=None,
+                    processes=1,
+                    chunk_size=50,
+                    mode=None,
+                    cache=True):
+    r"""Global properties of a shape, integrated once and cached
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape
+    kind : str
+        LINEAR, SURFACE or VOLUME
+    eps : float, optional
+        Relative precision of the ADAPTIVE integration (see BRepGProp),
+        default_eps if the mode is ADAPTIVE and eps is None
+    processes : int, optional
+        Number of worker processes the sub-shapes of a compound are
+        integrated in, 1 (default) runs in this process,
+        see aocutils.parallel.number_of_processes()
+    chunk_size : int, optional
+        Number of sub-shapes per worker task
+    mode : str, optional
+        DEFAULT, ADAPTIVE or MESH. The default is ADAPTIVE if eps is given,
+        DEFAULT otherwise
+    cache : bool, optional
+        Use the cache. False for throwaway shapes (e.g. boolean results)
+        that should not be kept alive by the cache. Default is True
+
+    Returns
+    -------
+    MassProperties
+        With the error estimate of the mode (None in the DEFAULT mode)
+
+    """
+    mode, eps = _resolve_mode(mode, eps)
+    if topo_lut[shape.ShapeType()] != "compound":
+        return _properties(shape, kind, eps, mode, cache)
+
+    sub_shapes = _sub_shapes(shape, kind)
+    if processes == 1 or len(sub_shapes) <= chunk_size:
+        properties_list = [_properties(sub_shape, kind, eps, mode, cache)
+                           for sub_shape in sub_shapes]
+    else:
+        with BrepFile(sub_shapes) as brep_file:
+            tasks = [(brep_file.filename,
+                      list(range(i, min(i + chunk_size, len(sub_shapes)))),
+                      kind,
+                      eps,
+                      mode,
+                      cache)
+                     for i in range(0, len(sub_shapes), chunk_size)]
+            properties_list = [properties
+                               for chunk in pool_map(
+                                   _properties_task,
+                                   tasks,
+                                   filename=brep_file.filename,
+                                   processes=processes)
+                               for properties in chunk]
+    return MassProperties.combine(properties_list, kind)
+
 
 class GlobalProperties(object):
     r"""Global properties for all topologies
@@ -24,26 +445,73 @@ class GlobalProperties(object):
     Parameters
     ----------
     shape : OCC.TopoDS.TopoDS_Shape
+    eps : float, optional
+        Relative precision of the surface and volume integration,
+        see mass_properties()
+    processes : int, optional
+        Number of worker processes for the sub-shapes of a compound
+    mode : str, optional
+        DEFAULT, ADAPTIVE or MESH, see mass_properties()
 
     """
-    # TODO : how to handle compound ?
     linear_types = ["edge", "wire"]
     surfacic_types = ["face", "shell"]
     volumic_types = ["solid"]
 
-    def __init__(self, shape):
+    def __init__(self, shape, eps=None, processes=1, mode=None):
         self.shape = shape
         self._topo_type = topo_lut[self.shape.ShapeType()]
-        self._system = None
+        self._mode, self._eps = _resolve_mode(mode, eps)
+        self._processes = processes
 
     @property
     def topo_type(self):
         r"""Topological geom_type"""
         return self._topo_type
 
+    @property
+    def kind(self):
+        r"""LINEAR, SURFACE or VOLUME, depending on the topological type.
+        A compound is volumic if it contains solids, else surfacic if it
+        contains faces, else linear
+
+        Returns
+        -------
+        str
+
+        """
+        if self._topo_type in GlobalProperties.surfacic_types:
+            return SURFACE
+        elif self._topo_type in GlobalProperties.linear_types:
+            return LINEAR
+        elif self._topo_type in GlobalProperties.volumic_types:
+            return VOLUME
+        elif self._topo_type == "compound":
+            topo = aocutils.topology.Topo(self.shape)
+            if topo.number_of_solids > 0:
+                return VOLUME
+            elif topo.number_of_faces > 0:
+                return SURFACE
+            return LINEAR
+        msg = f"ShapeType [{self._topo_type}] is not linear, surfacic or volumic"
+        logger.error(msg)
+        raise WrongTopologicalType(msg)
+
+    @property
+    def mode(self):
+        r"""DEFAULT, ADAPTIVE or MESH"""
+        return self._mode
+
+    @property
+    def error(self):
+        r"""Estimated absolute error on the length, area or volume,
+        None in the DEFAULT mode"""
+        return self.properties.error
+
     @property
     def system(self):
-        r"""Initialise the GProp_GProps depending on the topological type
+        r"""The GProp_GProps integrated for the topological type (cached),
+        with the DEFAULT integration in the MESH mode
 
         Notes
         -----
@@ -54,23 +522,30 @@ class GlobalProperties(object):
         OCC.GProp.GProp_GProps
 
         """
-        self._system = GProp_GProps()
-
-        if self._topo_type in GlobalProperties.surfacic_types:
-            brepgprop_SurfaceProperties(self.shape, self._system)
-        elif self._topo_type in GlobalProperties.linear_types:
-            brepgprop_LinearProperties(self.shape, self._system)
-        elif self._topo_type in GlobalProperties.volumic_types:
-            brepgprop_VolumeProperties(self.shape, self._system)
-        else:
-            msg = f"ShapeType [{self._topo_type}] is not linear, surfacic or volumic"
+        if self._topo_type == "compound":
+            compound_solids = list(aocutils.topology.Topo(self.shape).solids)
+            msg = f"Shape is a compound that contains {len(compound_solids)} " \
+                  f"solids, use properties"
             logger.error(msg)
-            if self._topo_type == "compound":
-                compound_solids = list(aocutils.topology.Topo(self.shape).solids)
-                msg = f"Shape is a compound that contains {len(compound_solids)} solids"
-                logger.info(msg)
             raise WrongTopologicalType(msg)
-        return self._system
+        if self._mode == MESH:
+            return _cached(self.shape, self.kind, None)[0]
+        return _cached(self.shape, self.kind, self._eps, self._mode)[0]
+
+    @property
+    def properties(self):
+        r"""All the global properties, computed in a single pass (cached)
+
+        Returns
+        -------
+        MassProperties
+
+        """
+        return mass_properties(self.shape,
+                               self.kind,
+                               self._eps,
+                               processes=self._processes,
+                               mode=self._mode)
 
     @property
     def centre(self):
@@ -78,34 +553,16 @@ class GlobalProperties(object):
 
         Returns
         -------
+        gp_Pnt
+
         """
-        return self.system.CentreOfMass()
+        return gp_Pnt(*self.properties.centre.tolist())
 
     @property
     def inertia(self):
         """Inertia matrix"""
         return self.system.MatrixOfInertia(), self.system.MomentOfInertia()
 
-    # @property
-    # def area(self):
-    #     r"""Area of the surface"""
-    #     if self.topo_type not in GlobalProperties.surfacic_types:
-    #         msg = "area is only defined for linear surfacic types"
-    #         logger.error(msg)
-    #         raise aocutils.exceptions.WrongTopologicalType(msg)
-    #     return self._mass()
-    #
-    # @property
-    # def volume(self):
-    #     r"""Volume"""
-    #     if self.topo_type not in GlobalProperties.volumic_types:
-    #         msg = "volume is only defined for linear volumic types"
-    #         logger.error(msg)
-    #         raise aocutils.exceptions.WrongTopologicalType(msg)
-    #     return self._mass()
-
-    # New handling of area and volume to properly handle compound
-
     @property
     def area(self):
         r"""Area of the surface"""
@@ -114,9 +571,11 @@ class GlobalProperties(object):
                 msg = "area is only defined for linear surfacic types"
                 logger.error(msg)
                 raise WrongTopologicalType(msg)
-            else:
-                faces = aocutils.topology.Topo(self.shape).faces
-                return sum([GlobalProperties(face).area for face in faces])
+            return mass_properties(self.shape,
+                                   SURFACE,
+                                   self._eps,
+                                   processes=self._processes,
+                                   mode=self._mode).mass
         return self._mass()
 
     @property
@@ -127,13 +586,15 @@ class GlobalProperties(object):
                 msg = "volume is only defined for linear volumic types"
                 logger.error(msg)
                 raise WrongTopologicalType(msg)
-            else:
-                solids = aocutils.topology.Topo(self.shape).solids
-                return sum([GlobalProperties(solid).volume for solid in solids])
+            return mass_properties(self.shape,
+                                   VOLUME,
+                                   self._eps,
+                                   processes=self._processes,
+                                   mode=self._mode).mass
         return self._mass()
 
     def _mass(self):
-        return self.system.Mass()
+        return self.properties.mass
 
     @property
     def length(self):
@@ -142,4 +603,4 @@ class GlobalProperties(object):
             msg = "length is only defined for linear topological types"
             logger.error(msg)
             raise WrongTopologicalType(msg)
-        return self.system.Mass()
+        return self._mass()
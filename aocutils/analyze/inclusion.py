@@ -4,10 +4,14 @@ r"""Inclusion of points in bounding box and in solid"""
 
 import logging
 
+import numpy as np
+
 from OCC.Core.BRepClass3d import BRepClass3d_SolidClassifier
+from OCC.Core.gp import gp_Pnt
 from OCC.Core.TopAbs import TopAbs_ON, TopAbs_OUT, TopAbs_IN
 
 from aocutils.analyze.bounds import BoundingBox
+from aocutils.parallel import BrepFile, pool_map, worker_shape
 from aocutils.types_ import topo_lut
 from aocutils.exceptions import WrongTopologicalType
 from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
@@ -35,21 +39,32 @@ def point_in_boundingbox(shape, pnt, tolerance=OCCUTILS_DEFAULT_TOLERANCE):
     return not BoundingBox(shape, tolerance).bnd_box.IsOut(pnt)
 
 
-def point_in_solid(shape, pnt, tolerance=OCCUTILS_DEFAULT_TOLERANCE):
-    r"""Is pnt inside solid?
+def points_in_boundingbox(shape, points, tolerance=OCCUTILS_DEFAULT_TOLERANCE):
+    r"""Are the points inside the bounding box of the shape?
 
     Parameters
     ----------
-    shape : TopoDS_*
-    pnt : OCC.gp.gp_Pnt
+    shape : TopoDS_Shape
+    points : np.ndarray
+        (N, 3) coordinates
     tolerance : float
 
     Returns
     -------
-    bool
-        True if pnt lies in solid, False otherwise
+    np.ndarray
+        (N,) bool
 
     """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    bb = BoundingBox(shape, tolerance)
+    # BoundingBox bounds already include the tolerance gap
+    lower = np.array([bb.x_min, bb.y_min, bb.z_min])
+    upper = np.array([bb.x_max, bb.y_max, bb.z_max])
+    return np.all((points >= lower) & (points <= upper), axis=1)
+
+
+def _check_is_3d(shape):
+    r"""Raise if an in/out position cannot be evaluated for the shape"""
     if topo_lut[shape.ShapeType()] not in ["compound",
                                            "compsolid",
                                            "solid",
@@ -58,11 +73,113 @@ def point_in_solid(shape, pnt, tolerance=OCCUTILS_DEFAULT_TOLERANCE):
         logger.error(msg)
         raise WrongTopologicalType(msg)
 
+
+def point_in_solid(shape, pnt, tolerance=OCCUTILS_DEFAULT_TOLERANCE):
+    r"""Is pnt inside solid?
+
+    Parameters
+    ----------
+    shape : TopoDS_*
+    pnt : OCC.gp.gp_Pnt
+    tolerance : float
+
+    Returns
+    -------
+    bool
+        True if pnt lies in solid, False otherwise
+
+    """
+    _check_is_3d(shape)
+
     _in_solid = BRepClass3d_SolidClassifier(shape, pnt, tolerance)
-    logger.info('State : %s' % str(_in_solid.State()))
+    logger.debug('State : %s' % str(_in_solid.State()))
     if _in_solid.State() == TopAbs_ON:
         return None
     if _in_solid.State() == TopAbs_OUT:
         return False
     if _in_solid.State() == TopAbs_IN:
         return True
+
+
+def _classify_points(shape, points, tolerance):
+    r"""TopAbs_State of each point, with a single classifier
+
+    The points outside the bounding box of the shape are OUT
+    without calling the classifier
+
+    """
+    states = np.full(len(points), TopAbs_OUT, dtype=np.uint8)
+    candidates = np.flatnonzero(points_in_boundingbox(shape,
+                                                      points,
+                                                      tolerance))
+    if len(candidates) == 0:
+        return states
+
+    classifier = BRepClass3d_SolidClassifier(shape)
+    for i, (x, y, z) in zip(candidates, points[candidates].tolist()):
+        classifier.Perform(gp_Pnt(x, y, z), tolerance)
+        states[i] = classifier.State()
+    return states
+
+
+def _points_in_solid_task(task):
+    r"""_classify_points() on a chunk of points, in a worker process
+
+    Parameters
+    ----------
+    task : tuple
+        (BREP file name, (n, 3) points, tolerance)
+
+    """
+    filename, points, tolerance = task
+    return _classify_points(worker_shape(filename), points, tolerance)
+
+
+def points_in_solid(shape,
+                    points,
+                    tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+                    processes=1,
+                    chunk_size=100000,
+                    timeout=None):
+    r"""State of many points with respect to a solid
+
+    The solid is loaded once in a BRepClass3d_SolidClassifier (once per
+    worker process if processes != 1) and the points outside its bounding
+    box are discarded before classification.
+
+    Parameters
+    ----------
+    shape : TopoDS_*
+    points : np.ndarray
+        (N, 3) coordinates
+    tolerance : float
+    processes : int, optional
+        Number of worker processes for the chunks of points. None or 0
+        means one per CPU. Default is 1 (no pool)
+    chunk_size : int, optional
+        Number of points per task when a pool is used
+    timeout : float, optional
+        Maximum time in seconds to wait for the pool results
+
+    Returns
+    -------
+    np.ndarray
+        (N,) uint8 array of TopAbs_State values (TopAbs_IN, TopAbs_OUT,
+        TopAbs_ON), see types_.state_lut
+
+    """
+    _check_is_3d(shape)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+    if processes == 1 or len(points) <= chunk_size:
+        return _classify_points(shape, points, tolerance)
+
+    with BrepFile(shape) as brep_file:
+        tasks = [(brep_file.filename, points[i:i + chunk_size], tolerance)
+                 for i in range(0, len(points), chunk_size)]
+        results = pool_map(_points_in_solid_task,
+                           tasks,
+                           filename=brep_file.filename,
+                           processes=processes,
+                           timeout=timeout)
+    return np.concatenate(results)
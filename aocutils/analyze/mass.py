@@ -0,0 +1,226 @@
+# coding: utf-8
+
+r"""Mass properties of many shapes at once, with NumPy arrays as output
+
+The volumic and surfacic properties of the shapes are integrated (and
+cached, see aocutils.analyze.global_) one shape at a time, possibly in a
+process pool. The densities scale the volumic properties afterwards and the
+assembly properties are combined with the parallel axis theorem, so that
+changing the densities does not integrate again.
+
+"""
+
+import logging
+
+import numpy as np
+
+from aocutils.analyze.global_ import SURFACE, VOLUME, combine_arrays, \
+    mass_properties
+from aocutils.parallel import BrepFile, pool_map, worker_sub_shapes
+from aocutils.topology import Topo
+from aocutils.types_ import topo_lut
+
+logger = logging.getLogger(__name__)
+
+# dtype of BulkMassProperties.as_structured()
+mass_properties_dtype = np.dtype([("volume", np.float64),
+                                  ("area", np.float64),
+                                  ("density", np.float64),
+                                  ("mass", np.float64),
+                                  ("centre", np.float64, (3,)),
+                                  ("inertia", np.float64, (3, 3))])
+
+
+class BulkMassProperties(object):
+    r"""Mass properties of N shapes
+
+    Parameters
+    ----------
+    volumes : np.ndarray
+        (N,)
+    areas : np.ndarray
+        (N,)
+    centres : np.ndarray
+        (N, 3) centres of mass (of the volumes)
+    volume_inertias : np.ndarray
+        (N, 3, 3) matrices of inertia of the volumes (unit density) at their
+        centres of mass
+    densities : float or np.ndarray, optional
+        Density of every shape, or (N,) densities
+
+    """
+    def __init__(self, volumes, areas, centres, volume_inertias, densities=1.):
+        self._volumes = volumes
+        self._areas = areas
+        self._centres = centres
+        self._volume_inertias = volume_inertias
+        self._densities = None
+        self.densities = densities
+
+    def __len__(self):
+        return len(self._volumes)
+
+    @property
+    def densities(self):
+        r"""(N,) densities"""
+        return self._densities
+
+    @densities.setter
+    def densities(self, densities):
+        densities = np.asarray(densities, dtype=np.float64)
+        if densities.ndim > 0 and densities.shape != self._volumes.shape:
+            msg = "%i densities for %i shapes" % (len(densities),
+                                                  len(self._volumes))
+            logger.error(msg)
+            raise ValueError(msg)
+        self._densities = np.broadcast_to(densities,
+                                          self._volumes.shape).copy()
+
+    @property
+    def volumes(self):
+        r"""(N,) volumes"""
+        return self._volumes
+
+    @property
+    def areas(self):
+        r"""(N,) areas"""
+        return self._areas
+
+    @property
+    def masses(self):
+        r"""(N,) masses"""
+        return self._densities * self._volumes
+
+    @property
+    def centres(self):
+        r"""(N, 3) centres of mass"""
+        return self._centres
+
+    @property
+    def inertias(self):
+        r"""(N, 3, 3) matrices of inertia (with the densities) at the
+        centres of mass"""
+        return self._densities[:, np.newaxis, np.newaxis] * \
+            self._volume_inertias
+
+    def as_structured(self):
+        r"""All the properties in a structured array
+
+        Returns
+        -------
+        np.ndarray
+            (N,) array of dtype mass_properties_dtype
+
+        """
+        result = np.empty(len(self), dtype=mass_properties_dtype)
+        result["volume"] = self._volumes
+        result["area"] = self._areas
+        result["density"] = self._densities
+        result["mass"] = self.masses
+        result["centre"] = self._centres
+        result["inertia"] = self.inertias
+        return result
+
+    def total(self, selection=None):
+        r"""Mass, centre of mass and matrix of inertia of the assembly
+        of the shapes, with the parallel axis theorem
+
+        Parameters
+        ----------
+        selection : array-like, optional
+            Indices or (N,) bool mask of the shapes to combine,
+            default is all the shapes
+
+        Returns
+        -------
+        tuple
+            mass, (3,) centre of mass and (3, 3) matrix of inertia at the
+            centre of mass
+
+        """
+        masses, centres, inertias = self.masses, self._centres, self.inertias
+        if selection is not None:
+            masses = masses[selection]
+            centres = centres[selection]
+            inertias = inertias[selection]
+        return combine_arrays(masses, centres, inertias)
+
+
+def _bulk_properties(shapes, eps):
+    r"""Volumes, areas, centres and volume inertias of shapes
+
+    Returns
+    -------
+    tuple[np.ndarray]
+
+    """
+    volumes = np.empty(len(shapes))
+    areas = np.empty(len(shapes))
+    centres = np.empty((len(shapes), 3))
+    inertias = np.empty((len(shapes), 3, 3))
+    for i, shape in enumerate(shapes):
+        volume_properties = mass_properties(shape, VOLUME, eps)
+        volumes[i] = volume_properties.mass
+        centres[i] = volume_properties.centre
+        inertias[i] = volume_properties.inertia
+        areas[i] = mass_properties(shape, SURFACE, eps).mass
+    return volumes, areas, centres, inertias
+
+
+def _bulk_properties_task(task):
+    r"""_bulk_properties() for a range of the shapes of a BREP file,
+    in a worker process"""
+    filename, first, last, eps = task
+    return _bulk_properties(worker_sub_shapes(filename)[first:last], eps)
+
+
+def bulk_mass_properties(shapes,
+                         densities=1.,
+                         eps=None,
+                         processes=1,
+                         chunk_size=50,
+                         timeout=None):
+    r"""Mass properties of many shapes
+
+    Parameters
+    ----------
+    shapes : iterable[TopoDS_Shape] or TopoDS_Compound
+        The solids of a compound are used
+    densities : float or array-like, optional
+        Density of every shape, or (N,) densities
+    eps : float, optional
+        Relative precision of the integration,
+        see aocutils.analyze.global_.mass_properties()
+    processes : int, optional
+        Number of worker processes, 1 (default) runs in this process,
+        see aocutils.parallel.number_of_processes()
+    chunk_size : int, optional
+        Number of shapes per worker task
+    timeout : float, optional
+        Maximum time in seconds to wait for the workers
+
+    Returns
+    -------
+    BulkMassProperties
+
+    """
+    if not isinstance(shapes, (list, tuple)) and \
+            hasattr(shapes, "ShapeType") and \
+            topo_lut[shapes.ShapeType()] == "compound":
+        shapes = Topo(shapes, return_iter=False).solids
+    shapes = list(shapes)
+
+    if processes == 1 or len(shapes) <= chunk_size:
+        arrays = _bulk_properties(shapes, eps)
+    else:
+        with BrepFile(shapes) as brep_file:
+            tasks = [(brep_file.filename, first, first + chunk_size, eps)
+                     for first in range(0, len(shapes), chunk_size)]
+            chunks = pool_map(_bulk_properties_task,
+                              tasks,
+                              filename=brep_file.filename,
+                              processes=processes,
+                              timeout=timeout)
+        arrays = [np.concatenate([chunk[k] for chunk in chunks])
+                  for k in range(4)]
+    return BulkMassProperties(*arrays, densities=densities)
@@ -0,0 +1,232 @@
+# coding: utf-8
+
+r"""Voxelization of solids
+
+The occupancy grid is filled row by row : a ray is cast along each row of
+voxel centres and the spans between the successive entry / exit hits are
+filled, so that the cost grows with rows x hits rather than with the number
+of voxels.
+
+"""
+
+import logging
+
+import numpy as np
+
+from OCC.Core.TopAbs import TopAbs_OUT
+
+from aocutils.analyze.bounds import BoundingBox
+from aocutils.analyze.inclusion import points_in_solid, _check_is_3d
+from aocutils.operations.intersect import ShapeIntersector
+from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
+
+logger = logging.getLogger(__name__)
+
+
+class VoxelGrid(object):
+    r"""Boolean occupancy grid
+
+    The voxel (i, j, k) is the cube of side pitch whose minimum corner is
+    origin + (i, j, k) * pitch
+
+    Parameters
+    ----------
+    occupancy : np.ndarray
+        (nx, ny, nz) bool
+    origin : np.ndarray
+        (3,) minimum corner of the grid
+    pitch : float
+        Side of a voxel
+
+    """
+    def __init__(self, occupancy, origin, pitch):
+        self._occupancy = occupancy
+        self._origin = np.asarray(origin, dtype=np.float64)
+        self._pitch = pitch
+
+    @property
+    def occupancy(self):
+        r"""(nx, ny, nz) bool occupancy array"""
+        return self._occupancy
+
+    @property
+    def origin(self):
+        r"""(3,) minimum corner of the grid"""
+        return self._origin
+
+    @property
+    def pitch(self):
+        r"""Side of a voxel"""
+        return self._pitch
+
+    @property
+    def shape(self):
+        r"""Number of voxels along x, y and z"""
+        return self._occupancy.shape
+
+    @property
+    def number_of_occupied(self):
+        r"""Number of occupied voxels"""
+        return int(np.count_nonzero(self._occupancy))
+
+    @property
+    def volume(self):
+        r"""Volume of the occupied voxels"""
+        return self.number_of_occupied * self._pitch ** 3
+
+    def indices(self):
+        r"""Sparse representation : indices of the occupied voxels
+
+        Returns
+        -------
+        np.ndarray
+            (N, 3) int32
+
+        """
+        return np.argwhere(self._occupancy).astype(np.int32)
+
+    def centres(self, indices=None):
+        r"""Coordinates of voxel centres
+
+        Parameters
+        ----------
+        indices : np.ndarray, optional
+            (N, 3) voxel indices. Default is the occupied voxels
+
+        Returns
+        -------
+        np.ndarray
+            (N, 3)
+
+        """
+        if indices is None:
+            indices = self.indices()
+        return self._origin + (np.asarray(indices) + 0.5) * self._pitch
+
+    def packed(self):
+        r"""Bit packed occupancy, along the last (z) axis
+
+        Returns
+        -------
+        np.ndarray
+            (nx, ny, ceil(nz / 8)) uint8, see np.unpackbits
+
+        """
+        return np.packbits(self._occupancy, axis=-1)
+
+    def narrow_band(self, width=1):
+        r"""Occupied voxels that are within width voxels of an empty voxel
+        (face neighbourhood), i.e. a shell along the boundary of the shape
+
+        Parameters
+        ----------
+        width : int
+
+        Returns
+        -------
+        VoxelGrid
+
+        """
+        interior = self._occupancy.copy()
+        for _ in range(width):
+            padded = np.pad(interior, 1,
+                            mode="constant",
+                            constant_values=False)
+            interior = (padded[1:-1, 1:-1, 1:-1] &
+                        padded[:-2, 1:-1, 1:-1] & padded[2:, 1:-1, 1:-1] &
+                        padded[1:-1, :-2, 1:-1] & padded[1:-1, 2:, 1:-1] &
+                        padded[1:-1, 1:-1, :-2] & padded[1:-1, 1:-1, 2:])
+        return VoxelGrid(self._occupancy & ~interior, self._origin,
+                         self._pitch)
+
+
+def voxelize(shape,
+             pitch,
+             tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+             axis=None,
+             processes=1):
+    r"""Voxel occupancy grid of a solid
+
+    A voxel is occupied if its centre is inside (or on) the shape.
+
+    The rays are cast along axis, from outside the bounding box, one per row
+    of voxel centres, with a single ShapeIntersector. The rows
+    for which the hits cannot be paired in entry / exit spans (e.g. a ray
+    grazing an edge) are classified voxel by voxel with points_in_solid().
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape
+        A solid, shell, compsolid or compound
+    pitch : float
+        Side of a voxel
+    tolerance : float, optional
+    axis : int, optional
+        0, 1 or 2 for X, Y or Z. Default is the axis with the most voxels,
+        which minimizes the number of rays
+    processes : int, optional
+        Number of worker processes for the ray casting, 1 (default) runs in
+        this process, see aocutils.parallel.number_of_processes()
+
+    Returns
+    -------
+    VoxelGrid
+
+    """
+    _check_is_3d(shape)
+
+    bb = BoundingBox(shape)
+    lower = np.array([bb.x_min, bb.y_min, bb.z_min])
+    upper = np.array([bb.x_max, bb.y_max, bb.z_max])
+    counts = np.maximum(np.ceil((upper - lower) / pitch).astype(int), 1)
+    if axis is None:
+        axis = int(np.argmax(counts))
+    b, c = [i for i in range(3) if i != axis]
+    centres = [lower[i] + (np.arange(counts[i]) + 0.5) * pitch
+               for i in range(3)]
+
+    # one ray per (b, c) row, starting outside the bounding box
+    grid_b, grid_c = np.meshgrid(centres[b], centres[c], indexing="ij")
+    origins = np.empty((grid_b.size, 3))
+    origins[:, axis] = lower[axis] - pitch
+    origins[:, b] = grid_b.ravel()
+    origins[:, c] = grid_c.ravel()
+    directions = np.zeros((grid_b.size, 3))
+    directions[:, axis] = 1.
+
+    hits = ShapeIntersector(shape, tolerance).perform(origins,
+                                                      directions,
+                                                      nearest=False,
+                                                      processes=processes)
+
+    # occupancy in (axis, b, c) order
+    occupancy = np.zeros((counts[axis], counts[b], counts[c]), dtype=bool)
+    unpaired_rows = list()
+    for row, w in enumerate(hits.split(len(origins))):
+        if len(w) == 0:
+            continue
+        j, k = divmod(row, counts[c])
+        # the same hit is found twice on an edge shared by 2 faces
+        w = w[np.concatenate(([True], np.diff(w) > tolerance))]
+        if len(w) % 2 == 1:
+            unpaired_rows.append((j, k))
+            continue
+        # a centre is inside if an odd number of hits precede it
+        occupancy[:, j, k] = np.searchsorted(origins[row, axis] + w,
+                                             centres[axis]) % 2 == 1
+
+    if len(unpaired_rows) > 0:
+        logger.debug("%i rows classified voxel by voxel" % len(unpaired_rows))
+        points = np.empty((len(unpaired_rows), counts[axis], 3))
+        for row, (j, k) in enumerate(unpaired_rows):
+            points[row, :, axis] = centres[axis]
+            points[row, :, b] = centres[b][j]
+            points[row, :, c] = centres[c][k]
+        states = points_in_solid(shape, points.reshape(-1, 3), tolerance)
+        states = states.reshape(len(unpaired_rows), counts[axis])
+        for row, (j, k) in enumerate(unpaired_rows):
+            occupancy[:, j, k] = states[row] != TopAbs_OUT
+
+    # back to (x, y, z) order
+    occupancy = np.transpose(occupancy, np.argsort([axis, b, c]))
+    return VoxelGrid(np.ascontiguousarray(occupancy), lower, pitch)
@@ -0,0 +1,245 @@
+# coding: utf-8
+
+r"""Arc length parameterization of edges
+
+The arc length s(u) of an edge is tabulated at breakpoints u_k and
+interpolated between them with cubic Hermite polynomials, using the
+speeds |C'(u_k)| as derivatives. The table is refined adaptively : an
+interval is split until its 5 points Gauss-Legendre length agrees with
+the sum of the lengths of its 2 halves, and the Hermite interpolation at
+its middle agrees with the integrated length, within its share of the
+tolerance.
+
+"""
+
+import logging
+
+import numpy as np
+
+from aocutils.exceptions import ParameterOutOfDomainException
+from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
+
+logger = logging.getLogger(__name__)
+
+_GAUSS_NODES, _GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(5)
+
+
+class ArcLengthTable(object):
+    r"""Adaptively refined parameter <-> arc length table of an edge
+
+    Parameters
+    ----------
+    edge : aocutils.brep.edge.Edge
+    tolerance : float, optional
+        Target absolute error on the lengths
+    initial_intervals : int, optional
+        Number of uniform intervals before refinement
+    max_intervals : int, optional
+        The refinement stops when the table reaches this number of intervals
+
+    """
+    def __init__(self,
+                 edge,
+                 tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+                 initial_intervals=8,
+                 max_intervals=65536):
+        self._edge = edge
+        self._tolerance = tolerance
+        first, last = edge.domain
+        self._first, self._last = first, last
+
+        converged_lows, converged_highs = list(), list()
+        converged_lengths, converged_errors = list(), list()
+        lows = np.linspace(first, last, initial_intervals + 1)[:-1]
+        highs = np.append(lows[1:], last)
+        n_intervals = initial_intervals
+        while len(lows) > 0:
+            middles = (lows + highs) / 2.
+            whole = self._gauss_lengths(lows, highs)
+            left = self._gauss_lengths(lows, middles)
+            right = self._gauss_lengths(middles, highs)
+            speeds = self._speeds(np.concatenate((lows, middles, highs)))
+            low_speeds, middle_speeds, high_speeds = np.split(speeds, 3)
+            widths = highs - lows
+            # Hermite interpolation at the middle of the interval
+            hermite_middle = ((left + right) / 2. +
+                              widths * (low_speeds - high_speeds) / 8.)
+            errors = np.maximum(np.abs(whole - left - right),
+                                np.abs(hermite_middle - left))
+            allowed = tolerance * widths / (last - first)
+            done = (errors <= allowed) | (n_intervals >= max_intervals)
+            converged_lows.append(lows[done])
+            converged_highs.append(highs[done])
+            converged_lengths.append((left + right)[done])
+            converged_errors.append(errors[done])
+            n_intervals += np.count_nonzero(~done)
+            lows, highs, middles = lows[~done], highs[~done], middles[~done]
+            lows, highs = (np.concatenate((lows, middles)),
+                           np.concatenate((middles, highs)))
+        if n_intervals >= max_intervals:
+            logger.warning("The arc length table reached %i intervals" %
+                           max_intervals)
+
+        lows = np.concatenate(converged_lows)
+        order = np.argsort(lows)
+        highs = np.concatenate(converged_highs)
+        self._parameters = np.append(lows[order], highs[order][-1])
+        self._lengths = np.concatenate(
+            ([0.], np.cumsum(np.concatenate(converged_lengths)[order])))
+        self._speeds_at_parameters = self._speeds(self._parameters)
+        self._error_bound = float(np.sum(np.concatenate(converged_errors)))
+
+    def _speeds(self, us):
+        r"""|C'(u)|"""
+        return np.linalg.norm(self._edge.evaluate(us, order=1)[1], axis=1)
+
+    def _gauss_lengths(self, lows, highs):
+        r"""5 points Gauss-Legendre lengths of the intervals"""
+        half_widths = (highs - lows) / 2.
+        us = ((lows + highs) / 2.)[:, np.newaxis] + \
+            half_widths[:, np.newaxis] * _GAUSS_NODES
+        speeds = self._speeds(us.ravel()).reshape(us.shape)
+        return half_widths * speeds.dot(_GAUSS_WEIGHTS)
+
+    @property
+    def parameters(self):
+        r"""(K + 1,) breakpoints"""
+        return self._parameters
+
+    @property
+    def lengths(self):
+        r"""(K + 1,) arc lengths from the domain start at the breakpoints"""
+        return self._lengths
+
+    @property
+    def total_length(self):
+        r"""Length of the edge"""
+        return float(self._lengths[-1])
+
+    @property
+    def error_bound(self):
+        r"""Estimated bound of the absolute error on the lengths"""
+        return self._error_bound
+
+    def _check_parameters(self, us):
+        us = np.asarray(us, dtype=np.float64)
+        if np.any((us < self._first) | (us > self._last)):
+            msg = "Parameter is outside of domain ranging from " \
+                  "%s to %s" % (str(self._first), str(self._last))
+            logger.error(msg)
+            raise ParameterOutOfDomainException(msg)
+        return us
+
+    def _hermite(self, us):
+        r"""Interpolated arc lengths and their derivatives (the speeds)"""
+        k = np.clip(np.searchsorted(self._parameters, us, side="right") - 1,
+                    0,
+                    len(self._parameters) - 2)
+        u_k, u_k1 = self._parameters[k], self._parameters[k + 1]
+        s_k, s_k1 = self._lengths[k], self._lengths[k + 1]
+        widths = u_k1 - u_k
+        f_k = self._speeds_at_parameters[k] * widths
+        f_k1 = self._speeds_at_parameters[k + 1] * widths
+        t = (us - u_k) / widths
+        t2, t3 = t * t, t * t * t
+        lengths = ((2 * t3 - 3 * t2 + 1) * s_k + (t3 - 2 * t2 + t) * f_k +
+                   (-2 * t3 + 3 * t2) * s_k1 + (t3 - t2) * f_k1)
+        derivatives = ((6 * t2 - 6 * t) * s_k + (3 * t2 - 4 * t + 1) * f_k +
+                       (-6 * t2 + 6 * t) * s_k1 + (3 * t2 - 2 * t) * f_k1)
+        return lengths, derivatives / widths
+
+    def lengths_at(self, us):
+        r"""Arc lengths from the domain start at parameters
+
+        Parameters
+        ----------
+        us : array-like
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        return self._hermite(self._check_parameters(us))[0]
+
+    def length(self, lbound=None, ubound=None):
+        r"""Length between 2 parameters
+
+        Parameters
+        ----------
+        lbound : float, optional
+            Default is the domain start
+        ubound : float, optional
+            Default is the domain end
+
+        Returns
+        -------
+        float
+
+        """
+        lbound = self._first if lbound is None else lbound
+        ubound = self._last if ubound is None else ubound
+        lengths = self.lengths_at([lbound, ubound])
+        return float(lengths[1] - lengths[0])
+
+    def parameters_at(self, lengths, iterations=8):
+        r"""Parameters at arc lengths from the domain start
+
+        Parameters
+        ----------
+        lengths : array-like
+            In [0, total_length]
+        iterations : int, optional
+            Number of Newton iterations on the Hermite interpolation
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        lengths = np.asarray(lengths, dtype=np.float64)
+        if np.any((lengths < -self._tolerance) |
+                  (lengths > self.total_length + self._tolerance)):
+            msg = "Arc length is outside of the edge, ranging from " \
+                  "0 to %s" % str(self.total_length)
+            logger.error(msg)
+            raise ParameterOutOfDomainException(msg)
+        lengths = np.clip(lengths, 0., self.total_length)
+        k = np.clip(np.searchsorted(self._lengths, lengths, side="right") - 1,
+                    0,
+                    len(self._parameters) - 2)
+        lows, highs = self._parameters[k], self._parameters[k + 1]
+        s_lows, s_highs = self._lengths[k], self._lengths[k + 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            us = lows + (highs - lows) * np.where(s_highs > s_lows,
+                                                  (lengths - s_lows) /
+                                                  (s_highs - s_lows),
+                                                  0.)
+            for _ in range(iterations):
+                values, derivatives = self._hermite(us)
+                steps = np.where(derivatives > 0.,
+                                 (values - lengths) / derivatives,
+                                 0.)
+                us = np.clip(us - steps, lows, highs)
+        return us
+
+    def uniform_parameters(self, n_pts, lbound=None, ubound=None):
+        r"""Parameters of n_pts points equally spaced along the edge
+
+        Parameters
+        ----------
+        n_pts : int
+        lbound : float, optional
+            Default is the domain start
+        ubound : float, optional
+            Default is the domain end
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        lbound = self._first if lbound is None else lbound
+        ubound = self._last if ubound is None else ubound
+        s_lbound, s_ubound = self.lengths_at([lbound, ubound])
+        return self.parameters_at(np.linspace(s_lbound, s_ubound, n_pts))
@@ -70,22 +70,39 @@ class BaseObject(object):
         """
         return self._mesh_factor
 
-    def mesh(self, factor=4000.):
+    def mesh(self, factor=4000., angular_deflection=0.5, parallel=False):
         r"""Mesh the wrapped instance
 
+        The faces whose triangulation already meets the deflection
+        are not meshed again
+
         Parameters
         ----------
         factor : float
             Division factor of the bounding box max dimension
+        angular_deflection : float
+            Angular deflection in radians
+        parallel : bool
+            Mesh the faces in parallel threads
+
+        Returns
+        -------
+        aocutils.mesh.MeshReport or None
+            None if the wrapped instance was already meshed with factor
 
         """
         if self.is_meshed is False or self.mesh_factor != factor:
             logger.info("Meshing with factor %s" % str(factor))
-            mesh(self._wrapped_instance, factor=factor)
+            report = mesh(self._wrapped_instance,
+                          factor=factor,
+                          angular_deflection=angular_deflection,
+                          parallel=parallel)
             self._is_meshed = True
             self._mesh_factor = factor
+            return report
         else:
             logger.info("Already meshed !")
+            return None
 
     @property
     def tshape(self):
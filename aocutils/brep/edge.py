@@ -6,6 +6,8 @@ from __future__ import print_function
 
 import logging
 
+import numpy as np
+
 from OCC.Core.BRepAdaptor import BRepAdaptor_Curve, BRepAdaptor_HCurve
 # import OCC.BRepBuilderAPI
 from OCC.Core.GCPnts import GCPnts_AbscissaPoint, GCPnts_UniformAbscissa
@@ -14,15 +16,18 @@ from OCC.Core.TopExp import topexp
 from OCC.Core.TopoDS import TopoDS_Vertex, TopoDS_Edge, TopoDS_Face
 from OCC.Core.gp import gp_Pnt, gp_Vec, gp_Dir
 from OCC.Core.GeomLProp import GeomLProp_CurveTool
+from OCC.Core.GeomAbs import GeomAbs_Line, GeomAbs_Circle
 from OCC.Core.BRepLProp import BRepLProp_CLProps
 from OCC.Core.GeomLib import geomlib
 from OCC.Core.GeomAPI import GeomAPI_ProjectPointOnCurve
+from OCC.Core.Extrema import Extrema_ExtPC
 from OCC.Core.ShapeAnalysis import ShapeAnalysis_Edge
 from OCC.Core.BRep import BRep_Tool_Curve, BRep_Tool, BRep_Tool_Continuity
 from OCC.Core.BRepIntCurveSurface import BRepIntCurveSurface_Inter
 # import OCC.BRepCheck
 
 from aocutils.analyze.distance import MinimumDistance
+from aocutils.brep.arc_length import ArcLengthTable
 from aocutils.brep.base import BaseObject
 from aocutils.brep.edge_make import edge
 from aocutils.common import AssertIsDone
@@ -38,6 +43,20 @@ from aocutils.display.display import show
 logger = logging.getLogger(__name__)
 
 
+def _coordinates(xyz):
+    r"""(3,) array of the coordinates of a gp_Pnt, gp_Vec or gp_Dir"""
+    return np.array([xyz.X(), xyz.Y(), xyz.Z()])
+
+
+def _normalized(vectors, tolerance):
+    r"""Unit vectors, NaN rows for the vectors shorter than tolerance"""
+    norms = np.linalg.norm(vectors, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unit_vectors = vectors / norms[:, np.newaxis]
+    unit_vectors[norms <= tolerance] = np.nan
+    return unit_vectors
+
+
 class Edge(BaseObject):
     r"""Wrapper for TopoDS_Edge
 
@@ -59,6 +78,7 @@ class Edge(BaseObject):
 
         self._adaptor = None
         self._brep_local_props = None
+        self._arc_length_table = None
 
     @property
     def topods_edge(self):
@@ -345,10 +365,26 @@ class Edge(BaseObject):
     def domain_end(self):
         return self.domain[1]
 
+    @property
+    def arc_length_table(self):
+        r"""Arc length table of the edge, built on first use
+
+        Trimming gives a new Edge, hence a new table
+
+        Returns
+        -------
+        aocutils.brep.arc_length.ArcLengthTable
+
+        """
+        if self._arc_length_table is None:
+            self._arc_length_table = ArcLengthTable(self, self.tolerance)
+        return self._arc_length_table
+
     def length(self,
                lbound=None,
                ubound=None,
-               tolerance=OCCUTILS_DEFAULT_TOLERANCE):
+               tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+               use_table=False):
         r"""Curve length
 
         If either lbound | ubound | both are given, then the length
@@ -359,6 +395,9 @@ class Edge(BaseObject):
         lbound
         ubound
         tolerance : float
+        use_table : bool
+            Interpolate in arc_length_table instead of integrating,
+            tolerance is then the one of the edge
 
         Returns
         -------
@@ -366,6 +405,9 @@ class Edge(BaseObject):
             The length
 
         """
+        if use_table:
+            return self.arc_length_table.length(lbound, ubound)
+
         _min, _max = self.domain
         if _min < self.adaptor.FirstParameter():
             msg = 'the lbound argument is < to the first parameter of the curve: %s' % self.adaptor.FirstParameter()
@@ -419,6 +461,10 @@ class Edge(BaseObject):
             raise ValueError('to extend you self.curve should be <= 3, is %s' % self.degree)
         # return geomlib.ExtendCurveToPoint(self.curve, pnt, continuity, after)
         geomlib.ExtendCurveToPoint(self.curve, pnt, continuity, after)
+        # the curve changed
+        self._adaptor = None
+        self._brep_local_props = None
+        self._arc_length_table = None
 
     def closest(self, other):
         r"""Closest
@@ -455,7 +501,93 @@ class Edge(BaseObject):
         return (project_point_on_curve.LowerDistanceParameter(),
                 project_point_on_curve.NearestPoint())
 
-    def distance_on_curve(self, distance, close_parameter, estimate_parameter):
+    def project_points(self, points, warm_start=False, max_iterations=10):
+        r"""Orthogonal projections of an array of points on the edge
+
+        A single Extrema_ExtPC initialized once on the adaptor gives the
+        global solution of each point (the ends of the edge included).
+
+        With warm_start, each point is first solved by Newton iterations on
+        C'(u).(C(u) - P) = 0 started from the parameter of the previous
+        point, the global solution is only used when Newton does not
+        converge inside the domain to a minimum. This is faster for closely
+        spaced ordered points (paths, scan lines) only : Newton may converge
+        to a local minimum when consecutive points are far apart or
+        unordered.
+
+        Parameters
+        ----------
+        points : array-like
+            (N, 3) points
+        warm_start : bool, optional
+            Default is False
+        max_iterations : int, optional
+            Maximum number of Newton iterations per point
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            (N,) parameters, (N, 3) nearest points and (N,) distances
+
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        first, last = self.domain
+        adaptor = self.adaptor
+        tolerance = self.tolerance
+        extrema = Extrema_ExtPC()
+        extrema.Initialize(adaptor, first, last, tolerance)
+        end_points = (_coordinates(adaptor.Value(first)),
+                      _coordinates(adaptor.Value(last)))
+
+        def global_projection(pnt, xyz):
+            r"""Parameter of the nearest extremum or end of the edge"""
+            candidates = [(np.sum((end_points[0] - xyz) ** 2), first),
+                          (np.sum((end_points[1] - xyz) ** 2), last)]
+            extrema.Perform(pnt)
+            if extrema.IsDone():
+                for j in range(1, extrema.NbExt() + 1):
+                    candidates.append((extrema.SquareDistance(j),
+                                       extrema.Point(j).Parameter()))
+            return min(candidates)[1]
+
+        params = np.empty(len(points))
+        c, d1, d2 = gp_Pnt(), gp_Vec(), gp_Vec()
+        u = None
+        for i, xyz in enumerate(points):
+            pnt = gp_Pnt(*xyz.tolist())
+            converged = False
+            if warm_start and u is not None:
+                for _ in range(max_iterations):
+                    adaptor.D2(u, c, d1, d2)
+                    delta = _coordinates(c) - xyz
+                    first_derivative = _coordinates(d1)
+                    f = first_derivative.dot(delta)
+                    df = (first_derivative.dot(first_derivative) +
+                          _coordinates(d2).dot(delta))
+                    if df <= 0.:
+                        # not a minimum
+                        break
+                    step = f / df
+                    u -= step
+                    if not first <= u <= last:
+                        break
+                    if abs(step) * np.sqrt(
+                            first_derivative.dot(first_derivative)) < \
+                            tolerance:
+                        converged = True
+                        break
+            if not converged:
+                u = global_projection(pnt, xyz)
+            params[i] = u
+
+        nearest = self.parameters_to_points(np.clip(params, first, last))
+        return params, nearest, np.linalg.norm(nearest - points, axis=1)
+
+    def distance_on_curve(self,
+                          distance,
+                          close_parameter,
+                          estimate_parameter,
+                          use_table=False):
         r"""Returns the parameter if there is a parameter on the curve with a distance length from u
 
         Parameters
@@ -463,6 +595,10 @@ class Edge(BaseObject):
         distance
         close_parameter
         estimate_parameter
+            Not used if use_table is True
+        use_table : bool
+            Invert arc_length_table instead of solving with
+            GCPnts_AbscissaPoint
 
         Returns
         -------
@@ -474,6 +610,11 @@ class Edge(BaseObject):
         OutOfBoundary
             if no such parameter exists
         """
+        if use_table:
+            table = self.arc_length_table
+            return float(table.parameters_at(
+                table.lengths_at(close_parameter) + distance))
+
         abscissa_point = GCPnts_AbscissaPoint(self.adaptor,
                                               distance,
                                               close_parameter,
@@ -507,7 +648,11 @@ class Edge(BaseObject):
         _min, _max = self.domain
         return (_min + _max) / 2.
 
-    def divide_by_number_of_points(self, n_pts, lbound=None, ubound=None):
+    def divide_by_number_of_points(self,
+                                   n_pts,
+                                   lbound=None,
+                                   ubound=None,
+                                   use_table=False):
         r"""Nested list of parameters and points on the edge
         at the requested interval [(param, gp_Pnt),...]
 
@@ -516,6 +661,9 @@ class Edge(BaseObject):
         n_pts
         lbound
         ubound
+        use_table : bool
+            Interpolate the parameters in arc_length_table instead of
+            using GCPnts_UniformAbscissa
 
         Returns
         -------
@@ -532,6 +680,13 @@ class Edge(BaseObject):
         if n_pts <= 1:
             n_pts = 2
 
+        if use_table:
+            params = self.arc_length_table.uniform_parameters(n_pts,
+                                                              _lbound,
+                                                              _ubound)
+            return [(param, self.adaptor.Value(param))
+                    for param in params.tolist()]
+
         try:
             npts = GCPnts_UniformAbscissa(self.adaptor,
                                           n_pts,
@@ -633,6 +788,104 @@ class Edge(BaseObject):
         self._check_u_in_domain(u)
         return self.adaptor.Value(u)
 
+    def _check_us_in_domain(self, us):
+        r"""Vectorized _check_u_in_domain()
+
+        Parameters
+        ----------
+        us : array-like
+
+        Returns
+        -------
+        np.ndarray
+            (N,) float64 parameters
+
+        """
+        us = np.asarray(us, dtype=np.float64).ravel()
+        first, last = self.domain
+        outside = (us < first) | (us > last)
+        if np.any(outside):
+            msg = "%i parameters are outside of domain ranging from " \
+                  "%s to %s" % (np.count_nonzero(outside), str(first), str(last))
+            logger.error(msg)
+            raise ParameterOutOfDomainException(msg)
+        return us
+
+    def evaluate(self, us, order=2):
+        r"""Points and derivatives at an array of parameters
+
+        Lines and circles are evaluated in closed form with NumPy,
+        other curves with one adaptor call per parameter
+
+        Parameters
+        ----------
+        us : array-like
+            (N,) parameters
+        order : int
+            0, 1 or 2, highest derivative order
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            (N, 3) points, then (N, 3) first and second derivatives
+            up to order
+
+        """
+        if order not in (0, 1, 2):
+            raise AssertionError('order is one of [0, 1, 2]')
+        us = self._check_us_in_domain(us)
+        curve_type = self.adaptor.GetType()
+
+        if curve_type == GeomAbs_Line:
+            line = self.adaptor.Line()
+            origin = _coordinates(line.Location())
+            direction = _coordinates(line.Direction())
+            results = (origin + us[:, np.newaxis] * direction,
+                       np.tile(direction, (len(us), 1)),
+                       np.zeros((len(us), 3)))
+        elif curve_type == GeomAbs_Circle:
+            circle = self.adaptor.Circle()
+            centre = _coordinates(circle.Location())
+            x_axis = _coordinates(circle.XAxis().Direction())
+            y_axis = _coordinates(circle.YAxis().Direction())
+            radius_cos = circle.Radius() * np.cos(us)[:, np.newaxis]
+            radius_sin = circle.Radius() * np.sin(us)[:, np.newaxis]
+            results = (centre + radius_cos * x_axis + radius_sin * y_axis,
+                       -radius_sin * x_axis + radius_cos * y_axis,
+                       -radius_cos * x_axis - radius_sin * y_axis)
+        else:
+            results = tuple(np.empty((len(us), 3)) for _ in range(order + 1))
+            pnt, d1, d2 = gp_Pnt(), gp_Vec(), gp_Vec()
+            adaptor = self.adaptor
+            for i, u in enumerate(us.tolist()):
+                if order == 0:
+                    adaptor.D0(u, pnt)
+                elif order == 1:
+                    adaptor.D1(u, pnt, d1)
+                    results[1][i] = d1.X(), d1.Y(), d1.Z()
+                else:
+                    adaptor.D2(u, pnt, d1, d2)
+                    results[1][i] = d1.X(), d1.Y(), d1.Z()
+                    results[2][i] = d2.X(), d2.Y(), d2.Z()
+                results[0][i] = pnt.X(), pnt.Y(), pnt.Z()
+        return results[:order + 1]
+
+    def parameters_to_points(self, us):
+        r"""Points at an array of parameters
+
+        Parameters
+        ----------
+        us : array-like
+            (N,) parameters
+
+        Returns
+        -------
+        np.ndarray
+            (N, 3) points
+
+        """
+        return self.evaluate(us, order=0)[0]
+
     def fix_continuity(self, continuity):
         r"""Splits an edge to achieve a level of continuity
 
@@ -851,6 +1104,87 @@ class Edge(BaseObject):
         except KeyError:
             raise AssertionError('n of derivative is one of [1,2,3]')
 
+    def derivatives(self, us, n):
+        r"""n-th derivatives at an array of parameters
+
+        Parameters
+        ----------
+        us : array-like
+            (N,) parameters
+        n : int
+            1 or 2
+
+        Returns
+        -------
+        np.ndarray
+            (N, 3) derivatives
+
+        """
+        if n not in (1, 2):
+            raise AssertionError('n of derivatives is one of [1, 2]')
+        return self.evaluate(us, order=n)[n]
+
+    def tangents(self, us):
+        r"""Unit tangents at an array of parameters
+
+        Parameters
+        ----------
+        us : array-like
+            (N,) parameters
+
+        Returns
+        -------
+        np.ndarray
+            (N, 3) unit tangents, NaN where the tangent is not defined
+
+        """
+        d1 = self.evaluate(us, order=1)[1]
+        return _normalized(d1, self.tolerance)
+
+    def curvatures(self, us):
+        r"""Curvatures at an array of parameters
+
+        Parameters
+        ----------
+        us : array-like
+            (N,) parameters
+
+        Returns
+        -------
+        np.ndarray
+            (N,) curvatures, NaN where the tangent is not defined
+
+        """
+        _, d1, d2 = self.evaluate(us, order=2)
+        speed = np.linalg.norm(d1, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            curvatures = np.linalg.norm(np.cross(d1, d2), axis=1) / speed ** 3
+        curvatures[speed <= self.tolerance] = np.nan
+        return curvatures
+
+    def normals(self, us):
+        r"""Unit main normals (towards the centre of curvature)
+        at an array of parameters
+
+        Parameters
+        ----------
+        us : array-like
+            (N,) parameters
+
+        Returns
+        -------
+        np.ndarray
+            (N, 3) unit normals, NaN where the normal is not defined
+            (e.g. on a straight segment)
+
+        """
+        _, d1, d2 = self.evaluate(us, order=2)
+        tangents = _normalized(d1, self.tolerance)
+        # component of the second derivative normal to the tangent
+        normals = d2 - np.einsum("ij,ij->i", d2, tangents)[:, np.newaxis] * \
+            tangents
+        return _normalized(normals, self.tolerance)
+
     def points_from_tangential_deflection(self):
         r"""
 
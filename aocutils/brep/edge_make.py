@@ -7,11 +7,13 @@ from __future__ import print_function
 import logging
 import functools
 
+import numpy as np
+
 # import OCC.BRepAdaptor
 import OCC
 from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_MakeEdge, \
     BRepBuilderAPI_MakeEdge2d
-from OCC.Core.gp import gp_Circ
+from OCC.Core.gp import gp_Circ, gp_Pnt
 
 from aocutils.common import AssertIsDone
 from aocutils.math_ import smooth_pnts
@@ -125,52 +127,28 @@ def geodesic_path(pnt_a,
     TopoDS_Edge
 
     """
-    # uv_a, srf_pnt_a = aoc_face.project_vertex(pnt_a)
-    # uv_b, srf_pnt_b = aoc_face.project_vertex(pnt_b)
-    uv_a, _ = aoc_face.project_vertex(pnt_a)
-    uv_b, _ = aoc_face.project_vertex(pnt_b)
-
-    path = []
-    for i in range(n_segments):
-        t = i / n_segments
-        u = uv_a[0] + t*(uv_b[0] - uv_a[0])
-        v = uv_a[1] + t*(uv_b[1] - uv_a[1])
-        path.append(aoc_face.parameter_to_point(u, v))
-
-    def project_pnts(x):
-        r"""Project points
-
-        Parameters
-        ----------
-        x
+    ends = np.array([[pnt.X(), pnt.Y(), pnt.Z()] for pnt in (pnt_a, pnt_b)])
+    (uv_a, uv_b), _, _ = aoc_face.project_points(ends)
 
-        Returns
-        -------
-
-        """
-        return [aoc_face.project_vertex(j)[1] for j in x]
+    # straight line in the parametric space, end points included
+    t = np.linspace(0., 1., n_segments + 1)[:, np.newaxis]
+    uvs = uv_a + t * (uv_b - uv_a)
+    path = aoc_face.parameters_to_points(uvs[:, 0], uvs[:, 1])
 
     def poly_length(x):
-        r"""Poly length
-
-        Parameters
-        ----------
-        x
-
-        Returns
-        -------
-
-        """
-        return sum([x[j].Distance(x[j + 1]) for j in range(len(x) - 1)]) / len(x)
+        r"""Mean segment length of a (N, 3) polyline"""
+        return np.linalg.norm(np.diff(x, axis=0), axis=1).sum() / len(x)
 
     length = poly_length(path)
 
     n = 0
     while True:
-        path = smooth_pnts(path)
-        path = project_pnts(path)
-        newlength = poly_length(path)
-        if abs(newlength-length) < _tolerance or n == n_iter:
-            crv = points_to_bspline(path)
+        path = np.asarray(smooth_pnts(path))
+        # the previous u, v are good initial guesses for the smoothed points
+        uvs, path, _ = aoc_face.project_points(path, uv0=uvs)
+        new_length = poly_length(path)
+        if abs(new_length - length) < _tolerance or n == n_iter:
+            crv = points_to_bspline([gp_Pnt(*xyz) for xyz in path.tolist()])
             return edge(crv)
+        length = new_length
         n += 1
@@ -4,6 +4,8 @@ r"""face.py module of aocutils"""
 
 import logging
 
+import numpy as np
+
 import OCC
 # import OCC.BRepBuilderAPI
 from OCC.Core.BRep import BRep_Tool, BRep_Tool_Surface
@@ -25,11 +27,11 @@ from OCC.Core.BRepAdaptor import BRepAdaptor_Surface, BRepAdaptor_HSurface
 from OCC.Core.ShapeAnalysis import ShapeAnalysis_Surface
 from OCC.Core.GeomProjLib import geomprojlib
 from OCC.Core.Adaptor3d import Adaptor3d_IsoCurve
-from OCC.Core.gp import gp_Pnt2d, gp_Vec, gp_Dir
+from OCC.Core.gp import gp_Pnt, gp_Pnt2d, gp_Vec, gp_Dir
 from OCC.Core.BRepCheck import BRepCheck_NoError, BRepCheck_Face
 
 from aocutils.brep.base import BaseObject
-from aocutils.brep.edge import Edge
+from aocutils.brep.edge import Edge, _normalized
 from aocutils.topology import WireExplorer
 from aocutils.exceptions import WrongTopologicalType, \
     ParameterOutOfDomainException, TangentException
@@ -465,6 +467,79 @@ class Face(BaseObject):
         uv = sas.ValueOfUV(pt, self.tolerance)
         return uv.X(), uv.Y()
 
+    def project_points(self, points, uv0=None, warm_start=False):
+        r"""Projections of an array of points on the face surface
+
+        A single ShapeAnalysis_Surface is used for all the points. With
+        warm_start, each point is searched from the u, v of the previous
+        point (ShapeAnalysis_Surface.NextValueOfUV) instead of a global
+        search (ValueOfUV). This is faster for closely spaced ordered points
+        (paths, scan lines) only : the search may converge to a local
+        minimum when consecutive points are far apart or unordered.
+
+        Parameters
+        ----------
+        points : array-like
+            (N, 3) points
+        uv0 : array-like, optional
+            Initial u, v guess : (2,) for the first point or
+            (N, 2) for every point
+        warm_start : bool, optional
+            Default is False
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            (N, 2) u, v parameters, (N, 3) nearest points
+            and (N,) distances
+
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        guesses = None if uv0 is None else \
+            np.asarray(uv0, dtype=np.float64).reshape(-1, 2)
+        if guesses is not None and len(guesses) not in (1, len(points)):
+            msg = "%i u, v guesses for %i points" % (len(guesses),
+                                                     len(points))
+            logger.error(msg)
+            raise ValueError(msg)
+
+        # the surface does not hold the location of the face
+        location = self._wrapped_instance.Location()
+        to_surface = location.Transformation().Inverted()
+
+        surface_analysis = ShapeAnalysis_Surface(self.surface_handle)
+        uvs = np.empty((len(points), 2))
+        distances = np.empty(len(points))
+        previous = None
+        for i, xyz in enumerate(points.tolist()):
+            pnt = gp_Pnt(*xyz).Transformed(to_surface)
+            if guesses is not None and len(guesses) == len(points):
+                guess = gp_Pnt2d(*guesses[i].tolist())
+            elif guesses is not None and i == 0:
+                guess = gp_Pnt2d(*guesses[0].tolist())
+            elif warm_start:
+                guess = previous
+            else:
+                guess = None
+            if guess is None:
+                uv = surface_analysis.ValueOfUV(pnt, self.tolerance)
+            else:
+                uv = surface_analysis.NextValueOfUV(guess,
+                                                    pnt,
+                                                    self.tolerance)
+            uvs[i] = uv.X(), uv.Y()
+            distances[i] = surface_analysis.Gap()
+            previous = uv
+
+        nearest = np.empty((len(points), 3))
+        to_shape = location.Transformation()
+        # the projections may be outside of the face domain
+        surface = self.surface
+        for i, (u, v) in enumerate(uvs.tolist()):
+            pnt = surface.Value(u, v).Transformed(to_shape)
+            nearest[i] = pnt.X(), pnt.Y(), pnt.Z()
+        return uvs, nearest, distances
+
     def continuity_edge_face(self, edge, face):
         r"""compute the continuity between two faces at edge
 
@@ -790,6 +865,249 @@ class Face(BaseObject):
 
         return abs((_crv_min + _crv_max)/2.)
 
+    def uv_grid(self, n_u, n_v):
+        r"""Regular grid of parameters over the u, v domain
+
+        Parameters
+        ----------
+        n_u : int
+        n_v : int
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            (n_u, n_v) u and v parameters
+
+        """
+        u_min, u_max, v_min, v_max = self.domain
+        return np.meshgrid(np.linspace(u_min, u_max, n_u),
+                           np.linspace(v_min, v_max, n_v),
+                           indexing="ij")
+
+    def _check_uvs_in_domain(self, us, vs):
+        r"""Vectorized _check_u_in_domain() and _check_v_in_domain()
+
+        Parameters
+        ----------
+        us : array-like
+        vs : array-like
+
+        Returns
+        -------
+        tuple
+            (N,) float64 u and v parameters and the broadcast shape of us, vs
+
+        """
+        us, vs = np.broadcast_arrays(np.asarray(us, dtype=np.float64),
+                                     np.asarray(vs, dtype=np.float64))
+        u_min, u_max, v_min, v_max = self.domain
+        outside = (us < u_min) | (us > u_max) | (vs < v_min) | (vs > v_max)
+        if np.any(outside):
+            msg = "%i parameters are outside of domain ranging from " \
+                  "%s to %s in u and %s to %s in v" % \
+                  (np.count_nonzero(outside),
+                   str(u_min), str(u_max), str(v_min), str(v_max))
+            logger.error(msg)
+            raise ParameterOutOfDomainException(msg)
+        return us.ravel(), vs.ravel(), us.shape
+
+    def evaluate(self, us, vs, order=1):
+        r"""Points and partial derivatives at arrays of parameters
+
+        us and vs are broadcast together : they can be scattered parameters
+        or grids (see uv_grid()). The evaluation is made on the adaptor
+        (the location of the face is taken into account), with one
+        D0/D1/D2 call per parameter pair into reused gp objects.
+
+        Parameters
+        ----------
+        us : array-like
+        vs : array-like
+        order : int
+            0, 1 or 2, highest derivative order
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            Arrays of shape broadcast(us, vs).shape + (3,) :
+            points, then du and dv for order >= 1,
+            then duu, dvv and duv for order 2
+
+        """
+        if order not in (0, 1, 2):
+            raise AssertionError('order is one of [0, 1, 2]')
+        us, vs, shape = self._check_uvs_in_domain(us, vs)
+        n_results = {0: 1, 1: 3, 2: 6}[order]
+        results = tuple(np.empty((len(us), 3)) for _ in range(n_results))
+        pnt = gp_Pnt()
+        vecs = tuple(gp_Vec() for _ in range(n_results - 1))
+        adaptor = self.adaptor
+        for i, (u, v) in enumerate(zip(us.tolist(), vs.tolist())):
+            if order == 0:
+                adaptor.D0(u, v, pnt)
+            elif order == 1:
+                adaptor.D1(u, v, pnt, *vecs)
+            else:
+                adaptor.D2(u, v, pnt, *vecs)
+            results[0][i] = pnt.X(), pnt.Y(), pnt.Z()
+            for result, vec in zip(results[1:], vecs):
+                result[i] = vec.X(), vec.Y(), vec.Z()
+        return tuple(result.reshape(shape + (3,)) for result in results)
+
+    def parameters_to_points(self, us, vs):
+        r"""Points at arrays of parameters
+
+        Parameters
+        ----------
+        us : array-like
+        vs : array-like
+
+        Returns
+        -------
+        np.ndarray
+            broadcast(us, vs).shape + (3,) points
+
+        """
+        return self.evaluate(us, vs, order=0)[0]
+
+    def _inside_domain(self, us, vs):
+        r"""Move the parameters on the domain boundary slightly inside,
+        where the local properties are more likely to be defined
+        (vectorized version of the correction in local_props())"""
+        us, vs = np.broadcast_arrays(np.asarray(us, dtype=np.float64),
+                                     np.asarray(vs, dtype=np.float64))
+        us, vs = us.copy(), vs.copy()
+        u_min, u_max, v_min, v_max = self.domain
+        delta_u, delta_v = (u_max - u_min) / 1000, (v_max - v_min) / 1000
+        us[us == u_min] += delta_u
+        us[us == u_max] -= delta_u
+        vs[vs == v_min] += delta_v
+        vs[vs == v_max] -= delta_v
+        return us, vs
+
+    def _evaluate_defined(self, us, vs, order):
+        r"""evaluate() in one pass, the derivatives at the parameters where
+        the normal is not defined (e.g. at the poles of a sphere) are
+        evaluated again slightly inside the domain (see local_props())
+
+        Returns
+        -------
+        tuple
+            (N, 3) results of evaluate() (the points are not moved),
+            (N, 3) du ^ dv and the broadcast shape of us, vs
+
+        """
+        us, vs, shape = self._check_uvs_in_domain(us, vs)
+        results = self.evaluate(us, vs, order=order)
+        cross = np.cross(results[1], results[2])
+        undefined = np.linalg.norm(cross, axis=1) <= self.tolerance
+        if np.any(undefined):
+            corrected = self.evaluate(*self._inside_domain(us[undefined],
+                                                           vs[undefined]),
+                                      order=order)
+            for result, values in zip(results[1:], corrected[1:]):
+                result[undefined] = values
+            cross[undefined] = np.cross(corrected[1], corrected[2])
+        return results, cross, shape
+
+    def _normals(self, cross):
+        r"""Unit normals from du ^ dv, reversed if the face is reversed"""
+        normals = _normalized(cross, self.tolerance)
+        if self.orientation == TopAbs_REVERSED:
+            normals = -normals
+        return normals
+
+    def _curvatures(self, du, dv, duu, dvv, duv, cross):
+        r"""(N, 4) Gaussian, mean, minimum and maximum curvatures from the
+        first and second fundamental forms"""
+        normals = _normalized(cross, self.tolerance)
+        e = np.einsum("ij,ij->i", du, du)
+        f = np.einsum("ij,ij->i", du, dv)
+        g = np.einsum("ij,ij->i", dv, dv)
+        l_ = np.einsum("ij,ij->i", duu, normals)
+        m = np.einsum("ij,ij->i", duv, normals)
+        n = np.einsum("ij,ij->i", dvv, normals)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            determinant = e * g - f ** 2
+            gaussian = (l_ * n - m ** 2) / determinant
+            mean = (e * n - 2. * f * m + g * l_) / (2. * determinant)
+            root = np.sqrt(np.maximum(mean ** 2 - gaussian, 0.))
+        # NaN where the normal is not defined
+        return np.column_stack((gaussian, mean, mean - root, mean + root))
+
+    def normals(self, us, vs):
+        r"""Unit normals at arrays of parameters,
+        reversed if the face is reversed
+
+        Parameters
+        ----------
+        us : array-like
+        vs : array-like
+
+        Returns
+        -------
+        np.ndarray
+            broadcast(us, vs).shape + (3,) unit normals,
+            NaN where the normal is not defined
+
+        """
+        _, cross, shape = self._evaluate_defined(us, vs, order=1)
+        return self._normals(cross).reshape(shape + (3,))
+
+    def curvatures(self, us, vs):
+        r"""Curvatures at arrays of parameters
+
+        Computed from the first and second fundamental forms, with the
+        normal du ^ dv of the surface (as GeomLProp_SLProps does)
+
+        Parameters
+        ----------
+        us : array-like
+        vs : array-like
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            Gaussian, mean, minimum and maximum curvatures,
+            arrays of shape broadcast(us, vs).shape,
+            NaN where the curvatures are not defined
+
+        """
+        (_, du, dv, duu, dvv, duv), cross, shape = \
+            self._evaluate_defined(us, vs, order=2)
+        curvatures = self._curvatures(du, dv, duu, dvv, duv, cross)
+        return tuple(column.reshape(shape) for column in curvatures.T)
+
+    def surface_properties(self, us, vs):
+        r"""Points, normals, tangents and curvatures at arrays of parameters,
+        with a single D2 evaluation per parameter pair
+
+        Parameters
+        ----------
+        us : array-like
+        vs : array-like
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            With S = broadcast(us, vs).shape :
+            S + (3,) points,
+            S + (3,) unit normals (reversed if the face is reversed),
+            S + (2, 3) unit u and v tangents,
+            S + (4,) Gaussian, mean, minimum and maximum curvatures,
+            NaN where they are not defined
+
+        """
+        (points, du, dv, duu, dvv, duv), cross, shape = \
+            self._evaluate_defined(us, vs, order=2)
+        tangents = np.stack((_normalized(du, self.tolerance),
+                             _normalized(dv, self.tolerance)), axis=1)
+        return (points.reshape(shape + (3,)),
+                self._normals(cross).reshape(shape + (3,)),
+                tangents.reshape(shape + (2, 3)),
+                self._curvatures(du, dv, duu, dvv, duv,
+                                 cross).reshape(shape + (4,)))
+
     @property
     def geom_type(self):
         r"""Geometrical geom_type"""
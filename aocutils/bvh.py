@@ -0,0 +1,520 @@
+# coding: utf-8
+
+r"""Bounding volume hierarchy (BVH) over the triangulation of a shape
+
+Mesh based ray casting for visualization grade queries (picking, occlusion,
+approximate waterlines) where the exact IntCurvesFace intersection is not
+needed, and nearest triangle queries.
+
+The hierarchy is stored in flat NumPy arrays and the rays are traversed
+together : the (ray, node) pairs of a level of the tree are tested against
+the node boxes in one vectorized slab test, the pairs that reach a leaf
+are tested against its triangles with a vectorized Moller-Trumbore test.
+
+"""
+
+import logging
+
+import numpy as np
+
+from OCC.Core.gp import gp_Pnt, gp_Lin, gp_Dir
+from OCC.Core.IntCurvesFace import IntCurvesFace_Intersector
+from OCC.Core.TopAbs import TopAbs_FACE
+
+from aocutils.mesh import mesh, triangulation
+from aocutils.operations.intersect import RayHits
+from aocutils.topology import Topo
+from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
+
+logger = logging.getLogger(__name__)
+
+
+def _ray_triangle(origins, directions, v0, e1, e2, epsilon=1e-12):
+    r"""Vectorized Moller-Trumbore ray / triangle intersection,
+    both sides of the triangles are hit
+
+    Returns
+    -------
+    tuple[np.ndarray]
+        Hit mask, distance along the ray, barycentric coordinates (b1, b2)
+
+    """
+    p = np.cross(directions, e2)
+    det = np.einsum("ij,ij->i", e1, p)
+    hit = np.abs(det) > epsilon
+    inv_det = np.zeros_like(det)
+    inv_det[hit] = 1. / det[hit]
+    s = origins - v0
+    b1 = np.einsum("ij,ij->i", s, p) * inv_det
+    q = np.cross(s, e1)
+    b2 = np.einsum("ij,ij->i", directions, q) * inv_det
+    t = np.einsum("ij,ij->i", e2, q) * inv_det
+    hit &= (b1 >= 0.) & (b2 >= 0.) & (b1 + b2 <= 1.)
+    return hit, t, b1, b2
+
+
+def _point_triangle(points, v0, e1, e2):
+    r"""Vectorized closest points on triangles (Ericson, Real-Time Collision
+    Detection, 5.1.5)
+
+    Returns
+    -------
+    tuple[np.ndarray]
+        (N, 3) closest points and (N,) squared distances
+
+    """
+    def dot(a, b):
+        return np.einsum("ij,ij->i", a, b)
+
+    v1, v2 = v0 + e1, v0 + e2
+    d1, d2 = dot(e1, points - v0), dot(e2, points - v0)
+    d3, d4 = dot(e1, points - v1), dot(e2, points - v1)
+    d5, d6 = dot(e1, points - v2), dot(e2, points - v2)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = va + vb + vc
+        on_face = (v0 + e1 * (vb / denominator)[:, np.newaxis] +
+                   e2 * (vc / denominator)[:, np.newaxis])
+        on_01 = v0 + e1 * (d1 / (d1 - d3))[:, np.newaxis]
+        on_02 = v0 + e2 * (d2 / (d2 - d6))[:, np.newaxis]
+        on_12 = v1 + (v2 - v1) * ((d4 - d3) /
+                                  ((d4 - d3) + (d5 - d6)))[:, np.newaxis]
+    # Voronoi regions, the first that contains the point wins
+    conditions = [(d1 <= 0.) & (d2 <= 0.),
+                  (d3 >= 0.) & (d4 <= d3),
+                  (vc <= 0.) & (d1 >= 0.) & (d3 <= 0.),
+                  (d6 >= 0.) & (d5 <= d6),
+                  (vb <= 0.) & (d2 >= 0.) & (d6 <= 0.),
+                  (va <= 0.) & (d4 - d3 >= 0.) & (d5 - d6 >= 0.)]
+    choices = [v0, v1, on_01, v2, on_02, on_12]
+    closest = on_face
+    for condition, choice in reversed(list(zip(conditions, choices))):
+        closest = np.where(condition[:, np.newaxis], choice, closest)
+    # degenerate triangles
+    degenerate = np.any(np.isnan(closest), axis=1)
+    closest[degenerate] = v0[degenerate]
+    return closest, np.sum((closest - points) ** 2, axis=1)
+
+
+class TriangleBVH(object):
+    r"""Bounding volume hierarchy over the triangulation of a shape
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape
+        The faces without a triangulation are meshed with
+        aocutils.mesh.mesh()
+    leaf_size : int, optional
+        Maximum number of triangles in a leaf
+
+    """
+    def __init__(self, shape, leaf_size=4):
+        self._shape = shape
+        self._topo = Topo(shape, indexed=True)
+        shape_triangulation = triangulation(shape)
+        if np.any(np.isnan(shape_triangulation.deflections)):
+            # mesh() keeps the existing face triangulations
+            mesh(shape)
+            shape_triangulation = triangulation(shape)
+        corners = shape_triangulation.corners
+        face_indices = shape_triangulation.face_indices
+
+        # the node arrays are filled depth first, the triangles are
+        # reordered so that the triangles of a leaf are contiguous
+        lower, upper, left, right, start, count = [], [], [], [], [], []
+        order = np.arange(len(corners))
+        centroids = corners.mean(axis=1)
+        triangle_lower = corners.min(axis=1)
+        triangle_upper = corners.max(axis=1)
+        stack = [(0, len(corners))] if len(corners) > 0 else []
+        parents = [None]
+        while len(stack) > 0:
+            first, last = stack.pop()
+            parent = parents.pop()
+            node = len(lower)
+            if parent is not None:
+                parent_node, side = parent
+                (left if side == 0 else right)[parent_node] = node
+            members = order[first:last]
+            lower.append(triangle_lower[members].min(axis=0))
+            upper.append(triangle_upper[members].max(axis=0))
+            left.append(-1)
+            right.append(-1)
+            start.append(first)
+            count.append(last - first)
+            if last - first <= leaf_size:
+                continue
+            member_centroids = centroids[members]
+            axis = int(np.argmax(member_centroids.max(axis=0) -
+                                 member_centroids.min(axis=0)))
+            middle = (last - first) // 2
+            order[first:last] = members[
+                np.argpartition(member_centroids[:, axis], middle)]
+            stack.append((first + middle, last))
+            parents.append((node, 1))
+            stack.append((first, first + middle))
+            parents.append((node, 0))
+
+        self._lower = np.array(lower).reshape(-1, 3)
+        self._upper = np.array(upper).reshape(-1, 3)
+        self._left = np.array(left, dtype=np.int32)
+        self._right = np.array(right, dtype=np.int32)
+        self._start = np.array(start, dtype=np.int32)
+        self._count = np.array(count, dtype=np.int32)
+
+        corners = corners[order]
+        self._v0 = corners[:, 0]
+        self._e1 = corners[:, 1] - corners[:, 0]
+        self._e2 = corners[:, 2] - corners[:, 0]
+        self._face_indices = face_indices[order]
+        self._face_intersectors = dict()
+
+    @property
+    def shape(self):
+        r"""The shape"""
+        return self._shape
+
+    @property
+    def topo(self):
+        r"""Topo(shape, indexed=True) of the face indices"""
+        return self._topo
+
+    @property
+    def number_of_triangles(self):
+        r"""Number of triangles"""
+        return len(self._v0)
+
+    @property
+    def number_of_nodes(self):
+        r"""Number of nodes of the hierarchy"""
+        return len(self._lower)
+
+    def face(self, face_index):
+        r"""Face from a hit face index
+
+        Parameters
+        ----------
+        face_index : int
+
+        Returns
+        -------
+        TopoDS_Face
+
+        """
+        return self._topo.from_index(TopAbs_FACE, face_index)
+
+    def perform(self,
+                origins,
+                directions,
+                nearest=True,
+                low_parameter=0.0,
+                hi_parameter=float("+inf"),
+                refine=False,
+                tolerance=OCCUTILS_DEFAULT_TOLERANCE,
+                chunk_size=10000):
+        r"""Intersect the triangulation with rays
+
+        Parameters
+        ----------
+        origins : np.ndarray
+            (N, 3) ray origins
+        directions : np.ndarray
+            (N, 3) ray directions (the w parameters are distances along the
+            normalized directions)
+        nearest : bool, optional
+            If True, only keep the nearest hit of each ray,
+            otherwise keep all the hits
+        low_parameter : float, optional
+            (the default value is 0.0)
+        hi_parameter : float, optional
+            (the default value is infinity)
+        refine : bool, optional
+            If True, the hits are moved onto the exact BREP face
+            with IntCurvesFace_Intersector, which also gives their u and v
+            parameters (they are NaN otherwise)
+        tolerance : float, optional
+            Hits of a ray closer than tolerance are merged (a ray through a
+            mesh edge hits the 2 triangles), also used for the refinement
+        chunk_size : int, optional
+            Number of rays traversed together, bounds the memory use
+
+        Returns
+        -------
+        RayHits
+            The face indices are Topo(shape, indexed=True) face indices,
+            see face()
+
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        if origins.shape != directions.shape:
+            msg = "%i origins for %i directions" % (len(origins),
+                                                    len(directions))
+            logger.error(msg)
+            raise ValueError(msg)
+        directions = directions / np.linalg.norm(directions,
+                                                 axis=1)[:, np.newaxis]
+
+        hits_list, offsets = list(), list()
+        for offset in range(0, len(origins), chunk_size):
+            rays, triangles, t = self._traverse(
+                origins[offset:offset + chunk_size],
+                directions[offset:offset + chunk_size],
+                nearest,
+                low_parameter,
+                hi_parameter,
+                tolerance)
+            points = (origins[offset + rays] +
+                      t[:, np.newaxis] * directions[offset + rays])
+            uvw = np.full((len(rays), 3), np.nan)
+            uvw[:, 2] = t
+            hits = RayHits(rays, points, self._face_indices[triangles], uvw)
+            if refine:
+                self._refine(hits,
+                             origins[offset:offset + chunk_size],
+                             directions[offset:offset + chunk_size],
+                             triangles,
+                             tolerance)
+            hits_list.append(hits)
+            offsets.append(offset)
+        return RayHits.concatenate(hits_list, offsets)
+
+    def _traverse(self, origins, directions, nearest, low_parameter,
+                  hi_parameter, tolerance):
+        r"""Traverse the hierarchy with all the rays at once
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            (ray, triangle, distance) of the hits, sorted by ray and distance
+
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inverse_directions = 1. / directions
+        best = np.full(len(origins), hi_parameter)
+        ray_ids = np.arange(len(origins), dtype=np.int32)
+        node_ids = np.zeros(len(origins), dtype=np.int32)
+        if self.number_of_nodes == 0:
+            ray_ids = node_ids = np.empty(0, dtype=np.int32)
+        hit_rays, hit_triangles, hit_t = list(), list(), list()
+
+        while len(ray_ids) > 0:
+            # slab test, fmin / fmax ignore the NaN of 0 * inf
+            with np.errstate(invalid="ignore"):
+                t1 = ((self._lower[node_ids] - origins[ray_ids]) *
+                      inverse_directions[ray_ids])
+                t2 = ((self._upper[node_ids] - origins[ray_ids]) *
+                      inverse_directions[ray_ids])
+            t_near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+            t_far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+            t_far = np.minimum(t_far, best[ray_ids])
+            keep = np.maximum(t_near, low_parameter) <= t_far + tolerance
+            ray_ids, node_ids = ray_ids[keep], node_ids[keep]
+
+            leaf = self._left[node_ids] < 0
+            if np.any(leaf):
+                pair_rays, pair_triangles = self._leaf_pairs(ray_ids[leaf],
+                                                             node_ids[leaf])
+                hit, t, _, _ = _ray_triangle(origins[pair_rays],
+                                             directions[pair_rays],
+                                             self._v0[pair_triangles],
+                                             self._e1[pair_triangles],
+                                             self._e2[pair_triangles])
+                hit &= (t >= low_parameter) & (t <= best[pair_rays])
+                if nearest:
+                    np.minimum.at(best, pair_rays[hit], t[hit])
+                hit_rays.append(pair_rays[hit])
+                hit_triangles.append(pair_triangles[hit])
+                hit_t.append(t[hit])
+
+            inner_rays, inner_nodes = ray_ids[~leaf], node_ids[~leaf]
+            ray_ids = np.concatenate((inner_rays, inner_rays))
+            node_ids = np.concatenate((self._left[inner_nodes],
+                                       self._right[inner_nodes]))
+
+        if len(hit_rays) == 0:
+            return (np.empty(0, dtype=np.int32),
+                    np.empty(0, dtype=np.int32),
+                    np.empty(0))
+        rays = np.concatenate(hit_rays)
+        triangles = np.concatenate(hit_triangles)
+        t = np.concatenate(hit_t)
+        order = np.lexsort((t, rays))
+        rays, triangles, t = rays[order], triangles[order], t[order]
+        if nearest:
+            keep = np.concatenate(([True], rays[1:] != rays[:-1]))
+        else:
+            keep = np.concatenate(([True],
+                                   (rays[1:] != rays[:-1]) |
+                                   (np.diff(t) > tolerance)))
+        return rays[keep], triangles[keep], t[keep]
+
+    def _leaf_pairs(self, ids, leaf_nodes):
+        r"""(query, triangle) pairs of the triangles of leaves
+
+        Parameters
+        ----------
+        ids : np.ndarray
+            Ray or point ids
+        leaf_nodes : np.ndarray
+            The leaf node of each id
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            Repeated ids and the triangles of their leaf
+
+        """
+        counts = self._count[leaf_nodes]
+        pair_ids = np.repeat(ids, counts)
+        pair_triangles = (np.repeat(self._start[leaf_nodes], counts) +
+                          np.arange(counts.sum()) -
+                          np.repeat(np.cumsum(counts) - counts, counts))
+        return pair_ids, pair_triangles
+
+    def _box_distances(self, points, node_ids):
+        r"""Squared distances from points to node boxes"""
+        gaps = np.maximum(np.maximum(self._lower[node_ids] - points,
+                                     points - self._upper[node_ids]),
+                          0.)
+        return np.sum(gaps * gaps, axis=1)
+
+    def closest_points(self, points, chunk_size=10000):
+        r"""Nearest points on the triangulation
+
+        Parameters
+        ----------
+        points : np.ndarray
+            (N, 3) points
+        chunk_size : int, optional
+            Number of points traversed together, bounds the memory use
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            (N,) face indices (see face()), (N, 3) nearest points on the
+            triangulation and (N,) distances
+
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if self.number_of_triangles == 0:
+            msg = "No triangulation to find closest points on"
+            logger.error(msg)
+            raise ValueError(msg)
+        triangles = np.empty(len(points), dtype=np.int64)
+        closest = np.empty((len(points), 3))
+        square_distances = np.empty(len(points))
+        for offset in range(0, len(points), chunk_size):
+            chunk = slice(offset, offset + chunk_size)
+            triangles[chunk], closest[chunk], square_distances[chunk] = \
+                self._nearest(points[chunk])
+        return (self._face_indices[triangles],
+                closest,
+                np.sqrt(square_distances))
+
+    def _update_nearest(self, points, pair_points, pair_triangles, best,
+                        best_triangles):
+        r"""Keep the nearest triangles of the (point, triangle) pairs,
+        in place"""
+        _, square_distances = _point_triangle(points[pair_points],
+                                              self._v0[pair_triangles],
+                                              self._e1[pair_triangles],
+                                              self._e2[pair_triangles])
+        np.minimum.at(best, pair_points, square_distances)
+        better = square_distances == best[pair_points]
+        best_triangles[pair_points[better]] = pair_triangles[better]
+
+    def _nearest(self, points):
+        r"""Branch and bound traversal with all the points at once
+
+        A greedy descent to the nearest leaf box gives the first upper
+        bound of each point, then the (point, node) pairs of a level are
+        pruned when their box is farther than the best triangle found.
+
+        Returns
+        -------
+        tuple[np.ndarray]
+            Triangles, nearest points and squared distances
+
+        """
+        best = np.full(len(points), np.inf)
+        best_triangles = np.zeros(len(points), dtype=np.int64)
+        point_ids = np.arange(len(points))
+
+        node_ids = np.zeros(len(points), dtype=np.int32)
+        inner = self._left[node_ids] >= 0
+        while np.any(inner):
+            lefts = self._left[node_ids[inner]]
+            rights = self._right[node_ids[inner]]
+            node_ids[inner] = np.where(
+                self._box_distances(points[inner], lefts) <=
+                self._box_distances(points[inner], rights),
+                lefts,
+                rights)
+            inner = self._left[node_ids] >= 0
+        self._update_nearest(points,
+                             *self._leaf_pairs(point_ids, node_ids),
+                             best=best,
+                             best_triangles=best_triangles)
+
+        node_ids = np.zeros(len(points), dtype=np.int32)
+        while len(point_ids) > 0:
+            keep = (self._box_distances(points[point_ids], node_ids) <=
+                    best[point_ids])
+            point_ids, node_ids = point_ids[keep], node_ids[keep]
+            leaf = self._left[node_ids] < 0
+            if np.any(leaf):
+                self._update_nearest(points,
+                                     *self._leaf_pairs(point_ids[leaf],
+                                                       node_ids[leaf]),
+                                     best=best,
+                                     best_triangles=best_triangles)
+            inner_points, inner_nodes = point_ids[~leaf], node_ids[~leaf]
+            point_ids = np.concatenate((inner_points, inner_points))
+            node_ids = np.concatenate((self._left[inner_nodes],
+                                       self._right[inner_nodes]))
+
+        closest, square_distances = _point_triangle(
+            points,
+            self._v0[best_triangles],
+            self._e1[best_triangles],
+            self._e2[best_triangles])
+        return best_triangles, closest, square_distances
+
+    def _refine(self, hits, origins, directions, triangles, tolerance):
+        r"""Move the hits onto the exact BREP faces, in place
+
+        The exact intersection is searched along the ray within the
+        longest edge of the hit triangle, which bounds the distance
+        between the triangle and the face. Hits without an exact
+        intersection in that window are left unchanged.
+
+        """
+        window = np.max(np.stack((np.linalg.norm(self._e1[triangles], axis=1),
+                                  np.linalg.norm(self._e2[triangles], axis=1),
+                                  np.linalg.norm(self._e2[triangles] -
+                                                 self._e1[triangles],
+                                                 axis=1))), axis=0)
+        for i, (ray, face_index) in enumerate(zip(hits.rays.tolist(),
+                                                  hits.faces.tolist())):
+            if face_index not in self._face_intersectors:
+                self._face_intersectors[face_index] = \
+                    IntCurvesFace_Intersector(self.face(face_index),
+                                              tolerance)
+            intersector = self._face_intersectors[face_index]
+            w = hits.uvw[i, 2]
+            intersector.Perform(gp_Lin(gp_Pnt(*origins[ray].tolist()),
+                                       gp_Dir(*directions[ray].tolist())),
+                                w - window[i],
+                                w + window[i])
+            if not intersector.IsDone() or intersector.NbPnt() == 0:
+                continue
+            closest = min(range(1, intersector.NbPnt() + 1),
+                          key=lambda j: abs(intersector.WParameter(j) - w))
+            pnt = intersector.Pnt(closest)
+            hits.points[i] = (pnt.X(), pnt.Y(), pnt.Z())
+            hits.uvw[i] = (intersector.UParameter(closest),
+                           intersector.VParameter(closest),
+                           intersector.WParameter(closest))
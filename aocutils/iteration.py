@@ -82,8 +82,10 @@ class LoopWirePairs(object):
         self.wireB = wire_b
         self.wire_explorer_a = WireExplorer(self.wireA)
         self.wire_explorer_b = WireExplorer(self.wireB)
-        self.topo_a = Topo(self.wireA)
-        self.topo_b = Topo(self.wireB)
+        # indexed, so that edges_from_vertex() does not rebuild
+        # the vertex -> edges map for every vertex
+        self.topo_a = Topo(self.wireA, indexed=True)
+        self.topo_b = Topo(self.wireB, indexed=True)
         self.brep_tool = BRep_Tool()
         self.vertices_a = [v for v in self.wire_explorer_a.ordered_vertices]
         self.vertices_b = [v for v in self.wire_explorer_b.ordered_vertices]
@@ -126,12 +128,12 @@ class LoopWirePairs(object):
         closest = self.closest_point(vert)
         edges_a = self.topo_a.edges_from_vertex(vert)
         edges_b = self.topo_b.edges_from_vertex(closest)
-        edge_a1, edge_a2 = Edge(edges_a.next()), Edge(edges_a.next())
-        edge_b1, edge_b2 = Edge(edges_b.next()), Edge(edges_b.next())
-        mp_a = edge_a1.mid_point()[1]
+        edge_a1, edge_a2 = Edge(next(edges_a)), Edge(next(edges_a))
+        edge_b1, edge_b2 = Edge(next(edges_b)), Edge(next(edges_b))
+        mp_a = edge_a1.midpoint
         self.index += 1
 
-        if mp_a.Distance(edge_b1.mid_point()[1]) < mp_a.Distance(edge_b2.mid_point()[1]):
+        if mp_a.Distance(edge_b1.midpoint) < mp_a.Distance(edge_b2.midpoint):
             return iter([edge_a1, edge_a2]), iter([edge_b1, edge_b2])
         else:
             return iter([edge_a1, edge_a2]), iter([edge_b2, edge_b1])
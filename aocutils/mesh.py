@@ -14,15 +14,214 @@ BRepMesh_IncrementalMesh (const TopoDS_Shape &theShape,
 """
 
 import logging
+from timeit import default_timer
 
+import numpy as np
+
+from OCC.Core.BRep import BRep_Tool
 from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.TopAbs import TopAbs_REVERSED
+from OCC.Core.TopLoc import TopLoc_Location
 
 from aocutils.analyze.bounds import BoundingBox
+from aocutils.brep.compound_make import compound
+from aocutils.topology import Topo
 
 logger = logging.getLogger(__name__)
 
 
-def mesh(shape, factor=4000., use_min_dim=False):
+class MeshReport(object):
+    r"""Outcome of a mesh() call
+
+    The per face arrays are in the Topo(shape, indexed=True) face index order
+
+    Parameters
+    ----------
+    linear_deflection : float
+    angular_deflection : float
+    face_deflections : np.ndarray
+        (F,) linear deflection requested for each face
+    meshed : np.ndarray
+        (F,) bool, True for the faces meshed by the call
+    face_times : np.ndarray
+        (F,) meshing time of each face in seconds,
+        NaN for the faces that were not meshed or not timed individually
+    total_time : float
+        Total meshing time in seconds
+
+    """
+    def __init__(self,
+                 linear_deflection,
+                 angular_deflection,
+                 face_deflections,
+                 meshed,
+                 face_times,
+                 total_time):
+        self._linear_deflection = linear_deflection
+        self._angular_deflection = angular_deflection
+        self._face_deflections = face_deflections
+        self._meshed = meshed
+        self._face_times = face_times
+        self._total_time = total_time
+
+    @property
+    def linear_deflection(self):
+        r"""Linear deflection used, the budget deflection in adaptive mode"""
+        return self._linear_deflection
+
+    @property
+    def face_deflections(self):
+        r"""(F,) linear deflection requested for each face"""
+        return self._face_deflections
+
+    @property
+    def angular_deflection(self):
+        r"""Angular deflection used"""
+        return self._angular_deflection
+
+    @property
+    def meshed(self):
+        r"""(F,) bool, True for the faces meshed by the call"""
+        return self._meshed
+
+    @property
+    def reused(self):
+        r"""(F,) bool, True for the faces whose triangulation was kept"""
+        return ~self._meshed
+
+    @property
+    def face_times(self):
+        r"""(F,) meshing time of each face in seconds"""
+        return self._face_times
+
+    @property
+    def total_time(self):
+        r"""Total meshing time in seconds"""
+        return self._total_time
+
+    @property
+    def number_of_meshed_faces(self):
+        r"""Number of faces meshed by the call"""
+        return int(np.count_nonzero(self._meshed))
+
+    @property
+    def number_of_reused_faces(self):
+        r"""Number of faces whose triangulation was kept"""
+        return len(self._meshed) - self.number_of_meshed_faces
+
+
+def _needs_meshing(face, linear_deflection):
+    r"""Does the face lack a triangulation at least as fine as
+    linear_deflection?"""
+    poly_triangulation = BRep_Tool.Triangulation(face, TopLoc_Location())
+    if poly_triangulation is None:
+        return True
+    return poly_triangulation.Deflection() > linear_deflection
+
+
+def _face_sizes_and_curvatures(faces, samples):
+    r"""Area and largest absolute principal curvature (sampled on a
+    samples x samples grid of the u, v domain) of each face"""
+    # local import : aocutils.brep.face depends on this module
+    from aocutils.brep.face import Face
+    from aocutils.analyze.global_ import GlobalProperties
+
+    areas = np.empty(len(faces))
+    curvatures = np.zeros(len(faces))
+    fractions = (np.arange(samples) + 0.5) / samples
+    for i, topods_face in enumerate(faces):
+        areas[i] = GlobalProperties(topods_face).area
+        face = Face(topods_face)
+        u_min, u_max, v_min, v_max = face.domain
+        for u in (u_min + fractions * (u_max - u_min)).tolist():
+            for v in (v_min + fractions * (v_max - v_min)).tolist():
+                props = face.local_props(u, v)
+                if props.IsCurvatureDefined():
+                    curvatures[i] = max(curvatures[i],
+                                        abs(props.MaxCurvature()),
+                                        abs(props.MinCurvature()))
+    return areas, curvatures
+
+
+def adaptive_deflections(shape,
+                         triangle_budget,
+                         samples=5,
+                         max_relative_deflection=0.1):
+    r"""Per face linear deflections for a triangle budget
+
+    A triangle of side h on a surface of curvature k deviates from the
+    surface by about k * h**2 / 8, the number of triangles of a face of
+    area A meshed with a deflection d is about A * k / (2 * sqrt(3) * d).
+    The deflection d that spends the budget on the curved faces gives the
+    same (visual) error everywhere. The deflection of a face is capped to
+    max_relative_deflection times its radius of curvature and its size
+    (square root of its area), so that small features are not erased,
+    the budget is then shared by the other faces. A warning is logged
+    if the capped faces alone need more triangles than the budget.
+
+    Parameters
+    ----------
+    shape : OCC.TopoDS.TopoDS_Shape
+    triangle_budget : int
+        Approximate total number of triangles
+    samples : int, optional
+        Number of curvature samples along u and v on each face
+    max_relative_deflection : float, optional
+
+    Returns
+    -------
+    tuple
+        The budget deflection (float) and the (F,) face deflections
+        in the Topo(shape, indexed=True) face index order
+
+    """
+    faces = Topo(shape, indexed=True, return_iter=False).faces
+    areas, curvatures = _face_sizes_and_curvatures(faces, samples)
+    with np.errstate(divide="ignore"):
+        caps = max_relative_deflection * np.minimum(1. / curvatures,
+                                                    np.sqrt(areas))
+    # degenerated faces follow the others
+    caps[caps <= 0.] = np.inf
+    # triangles per unit of 1 / deflection
+    weights = areas * curvatures / (2. * np.sqrt(3.))
+
+    curved = weights > 0.
+    capped = np.zeros(len(faces), dtype=bool)
+    finite = np.isfinite(caps)
+    deflection = np.max(caps[finite]) if np.any(finite) else 0.
+    while np.any(curved & ~capped):
+        free = curved & ~capped
+        remaining_budget = triangle_budget - np.sum(weights[capped] /
+                                                    caps[capped])
+        if remaining_budget <= 0.:
+            deflection = np.max(caps[free])
+            break
+        deflection = np.sum(weights[free]) / remaining_budget
+        newly_capped = free & (caps < deflection)
+        if not np.any(newly_capped):
+            break
+        capped |= newly_capped
+    logger.info("Budget deflection : %f" % deflection)
+
+    face_deflections = np.minimum(caps, deflection)
+    # the caps win over the budget
+    estimate = np.sum(weights[curved] / face_deflections[curved])
+    if estimate > triangle_budget:
+        logger.warning("The capped deflections give about %i triangles, "
+                       "more than the budget of %i triangles"
+                       % (estimate, triangle_budget))
+    return deflection, face_deflections
+
+
+def mesh(shape,
+         factor=4000.,
+         use_min_dim=False,
+         linear_deflection=None,
+         angular_deflection=0.5,
+         parallel=False,
+         reuse=True,
+         per_face=False,
+         triangle_budget=None):
     r"""Mesh a shape
 
     Parameters
@@ -36,15 +235,280 @@ def mesh(shape, factor=4000., use_min_dim=False):
         The default is False (i.e. use max dimension)
         This is useful for long and thin objects where using the max dimension
         would result in a very coarse linear deflection in the other directions.
+    linear_deflection : float (optional)
+        Absolute linear deflection. If given, factor and use_min_dim are
+        ignored and no bounding box is computed
+    angular_deflection : float (optional)
+        Angular deflection in radians. The default is 0.5
+    parallel : bool (optional)
+        Mesh the faces in parallel threads (BRepMesh isInParallel flag).
+        The default is False
+    reuse : bool (optional)
+        Keep the triangulations of the faces that already meet
+        linear_deflection, so that remeshing a shape after a local edit only
+        meshes the faces that changed. The default is True.
+        The angular deflection of an existing triangulation is not known,
+        it is not checked
+    per_face : bool (optional)
+        Mesh the faces one by one to time them individually.
+        The default is False (all the faces to mesh with the same
+        deflection in one BRepMesh call)
+    triangle_budget : int (optional)
+        Adaptive mode : the deflection of each face is set from its size and
+        curvature to spend about triangle_budget triangles, see
+        adaptive_deflections(). factor, use_min_dim and linear_deflection
+        are ignored. The faces are meshed from the finest deflection to the
+        coarsest, so that shared edges are discretized at the finest one
+
+    Returns
+    -------
+    MeshReport
 
     """
-    bb = BoundingBox(shape)
-    if use_min_dim:
-        linear_deflection = bb.min_dimension / factor
-        logger.info("Linear deflection : %f" % linear_deflection)
-        BRepMesh_IncrementalMesh(shape, linear_deflection)
+    faces = Topo(shape, indexed=True, return_iter=False).faces
+    if triangle_budget is not None:
+        linear_deflection, deflections = adaptive_deflections(shape,
+                                                              triangle_budget)
+    else:
+        if linear_deflection is None:
+            bb = BoundingBox(shape)
+            if use_min_dim:
+                linear_deflection = bb.min_dimension / factor
+            else:
+                linear_deflection = bb.max_dimension / factor
+        deflections = np.full(len(faces), linear_deflection)
+    logger.info("Linear deflection : %f" % linear_deflection)
+
+    if reuse:
+        meshed = np.array([_needs_meshing(face, deflection)
+                           for face, deflection in zip(faces,
+                                                       deflections.tolist())],
+                          dtype=bool)
+    else:
+        meshed = np.ones(len(faces), dtype=bool)
+    face_times = np.full(len(faces), np.nan)
+
+    start = default_timer()
+    if per_face:
+        for i in np.flatnonzero(meshed)[np.argsort(deflections[meshed],
+                                                   kind="stable")]:
+            face_start = default_timer()
+            BRepMesh_IncrementalMesh(faces[i],
+                                     deflections[i],
+                                     False,
+                                     angular_deflection,
+                                     parallel)
+            face_times[i] = default_timer() - face_start
+    elif np.all(meshed) and triangle_budget is None:
+        BRepMesh_IncrementalMesh(shape,
+                                 linear_deflection,
+                                 False,
+                                 angular_deflection,
+                                 parallel)
+    else:
+        for deflection in np.unique(deflections[meshed]).tolist():
+            group = np.flatnonzero(meshed & (deflections == deflection))
+            BRepMesh_IncrementalMesh(compound([faces[i] for i in group]),
+                                     deflection,
+                                     False,
+                                     angular_deflection,
+                                     parallel)
+    total_time = default_timer() - start
+    logger.info("%i faces meshed, %i reused in %f s" %
+                (np.count_nonzero(meshed),
+                 len(meshed) - np.count_nonzero(meshed),
+                 total_time))
+
+    return MeshReport(linear_deflection,
+                      angular_deflection,
+                      deflections,
+                      meshed,
+                      face_times,
+                      total_time)
+
+
+class Triangulation(object):
+    r"""Triangulation of a shape as contiguous NumPy buffers
+
+    The faces are in the Topo(shape, indexed=True) face index order, the
+    vertices are not shared between faces. The triangles of the reversed
+    faces are flipped, so that all the triangles are oriented outwards.
+
+    Parameters
+    ----------
+    vertices : np.ndarray
+        (V, 3) float32 or float64 vertex coordinates
+    triangles : np.ndarray
+        (T, 3) int32 vertex indices of the triangles
+    vertex_offsets : np.ndarray
+        (F + 1,) int32, the vertices of face i are
+        vertices[vertex_offsets[i]:vertex_offsets[i + 1]]
+    triangle_offsets : np.ndarray
+        (F + 1,) int32, the triangles of face i are
+        triangles[triangle_offsets[i]:triangle_offsets[i + 1]]
+    normals : np.ndarray or None
+        (V, 3) unit vertex normals
+    deflections : np.ndarray or None
+        (F,) linear deflection of the triangulation of each face,
+        NaN for the faces without a triangulation
+
+    """
+    def __init__(self,
+                 vertices,
+                 triangles,
+                 vertex_offsets,
+                 triangle_offsets,
+                 normals=None,
+                 deflections=None):
+        self._vertices = vertices
+        self._triangles = triangles
+        self._vertex_offsets = vertex_offsets
+        self._triangle_offsets = triangle_offsets
+        self._normals = normals
+        self._deflections = deflections
+
+    @property
+    def vertices(self):
+        r"""(V, 3) vertex coordinates"""
+        return self._vertices
+
+    @property
+    def triangles(self):
+        r"""(T, 3) int32 vertex indices of the triangles"""
+        return self._triangles
+
+    @property
+    def vertex_offsets(self):
+        r"""(F + 1,) int32 offsets of the vertices of each face"""
+        return self._vertex_offsets
+
+    @property
+    def triangle_offsets(self):
+        r"""(F + 1,) int32 offsets of the triangles of each face"""
+        return self._triangle_offsets
+
+    @property
+    def normals(self):
+        r"""(V, 3) unit vertex normals, None if they were not requested"""
+        return self._normals
+
+    @property
+    def deflections(self):
+        r"""(F,) linear deflection of the triangulation of each face"""
+        return self._deflections
+
+    @property
+    def number_of_faces(self):
+        r"""Number of faces"""
+        return len(self._triangle_offsets) - 1
+
+    @property
+    def face_indices(self):
+        r"""(T,) int32 face index of each triangle"""
+        return np.repeat(np.arange(self.number_of_faces, dtype=np.int32),
+                         np.diff(self._triangle_offsets))
+
+    @property
+    def corners(self):
+        r"""(T, 3, 3) coordinates of the corners of the triangles"""
+        return self._vertices[self._triangles]
+
+    def face_triangles(self, face_index):
+        r"""Triangles of a face
+
+        Parameters
+        ----------
+        face_index : int
+
+        Returns
+        -------
+        np.ndarray
+            (t, 3) int32 indices into vertices
+
+        """
+        return self._triangles[self._triangle_offsets[face_index]:
+                               self._triangle_offsets[face_index + 1]]
+
+
+def _transformation_matrix(location):
+    r"""(3, 4) matrix of the transformation of a TopLoc_Location"""
+    trsf = location.Transformation()
+    return np.array([[trsf.Value(row, column) for column in range(1, 5)]
+                     for row in range(1, 4)])
+
+
+def _vertex_normals(vertices, triangles):
+    r"""Area weighted unit vertex normals"""
+    corners = vertices[triangles].astype(np.float64)
+    triangle_normals = np.cross(corners[:, 1] - corners[:, 0],
+                                corners[:, 2] - corners[:, 0])
+    normals = np.zeros((len(vertices), 3))
+    for i in range(3):
+        np.add.at(normals, triangles[:, i], triangle_normals)
+    norms = np.linalg.norm(normals, axis=1)
+    norms[norms == 0.] = 1.
+    return (normals / norms[:, np.newaxis]).astype(vertices.dtype)
+
+
+def triangulation(shape, dtype=np.float64, normals=False):
+    r"""Extract the triangulation of a meshed shape
+
+    Parameters
+    ----------
+    shape : OCC.TopoDS.TopoDS_Shape
+        Shape meshed by mesh() (or BRepMesh_IncrementalMesh).
+        The faces without a triangulation have no vertices and no triangles
+    dtype : np.float32 or np.float64, optional
+        Type of the vertex coordinates. The default is np.float64
+    normals : bool, optional
+        Compute the area weighted vertex normals. The default is False
+
+    Returns
+    -------
+    Triangulation
+
+    """
+    vertices, triangles, deflections = list(), list(), list()
+    vertex_offsets, triangle_offsets = [0], [0]
+    for face_index, face in enumerate(Topo(shape, indexed=True).faces):
+        location = TopLoc_Location()
+        poly_triangulation = BRep_Tool.Triangulation(face, location)
+        if poly_triangulation is None:
+            logger.warning("Face %i has no triangulation" % face_index)
+            deflections.append(np.nan)
+            vertex_offsets.append(vertex_offsets[-1])
+            triangle_offsets.append(triangle_offsets[-1])
+            continue
+        nodes = np.empty((poly_triangulation.NbNodes(), 3))
+        for i in range(poly_triangulation.NbNodes()):
+            pnt = poly_triangulation.Node(i + 1)
+            nodes[i] = pnt.X(), pnt.Y(), pnt.Z()
+        if not location.IsIdentity():
+            matrix = _transformation_matrix(location)
+            nodes = nodes.dot(matrix[:, :3].T) + matrix[:, 3]
+        face_triangles = np.array(
+            [poly_triangulation.Triangle(i).Get()
+             for i in range(1, poly_triangulation.NbTriangles() + 1)],
+            dtype=np.int32).reshape(-1, 3) - 1 + vertex_offsets[-1]
+        if face.Orientation() == TopAbs_REVERSED:
+            face_triangles = face_triangles[:, ::-1]
+        vertices.append(nodes)
+        triangles.append(face_triangles)
+        deflections.append(poly_triangulation.Deflection())
+        vertex_offsets.append(vertex_offsets[-1] + len(nodes))
+        triangle_offsets.append(triangle_offsets[-1] + len(face_triangles))
+
+    if len(vertices) == 0:
+        vertices = np.empty((0, 3), dtype=dtype)
+        triangles = np.empty((0, 3), dtype=np.int32)
     else:
-        linear_deflection = bb.max_dimension / factor
-        logger.info("Linear deflection : %f" % linear_deflection)
-        BRepMesh_IncrementalMesh(shape, linear_deflection)
-    # return shape
+        vertices = np.ascontiguousarray(np.concatenate(vertices), dtype=dtype)
+        triangles = np.ascontiguousarray(np.concatenate(triangles),
+                                         dtype=np.int32)
+    return Triangulation(vertices,
+                         triangles,
+                         np.array(vertex_offsets, dtype=np.int32),
+                         np.array(triangle_offsets, dtype=np.int32),
+                         _vertex_normals(vertices, triangles) if normals
+                         else None,
+                         np.array(deflections))
@@ -2,13 +2,25 @@
 
 r"""Intersections"""
 
+import logging
+
+import numpy as np
+
 from OCC.Core.gp import gp_Pnt, gp_Lin, gp_Dir
 from OCC.Core.IntAna import IntAna_Int3Pln
 from OCC.Core.IntCurvesFace import IntCurvesFace_ShapeIntersector
 
 from aocutils.common import AssertIsDone
+from aocutils.parallel import BrepFile, pool_map, worker_shape
+from aocutils.topology import Topo
 from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
 
+logger = logging.getLogger(__name__)
+
+# ShapeIntersector of the current (worker) process
+# key: (BREP file path, tolerance); value: ShapeIntersector
+_worker_intersectors = dict()
+
 
 def from_three_planes(plane_a, plane_b, plane_c):
     r"""Intersection from 3 planes
@@ -144,3 +156,267 @@ def intersect_shape_by_half_line(topods_shape, x, y, z, vx, vy, vz):
                                     0,
                                     float("+inf"))
 
+
+class RayHits(object):
+    r"""Hits of a set of rays on a shape, as flat arrays
+
+    The hits are sorted by ray, then by distance along the ray
+
+    Parameters
+    ----------
+    rays : np.ndarray
+        (N,) int32 index of the ray of each hit
+    points : np.ndarray
+        (N, 3) hit points
+    faces : np.ndarray
+        (N,) int32 index of the hit face, see Topo.index()
+    uvw : np.ndarray
+        (N, 3) u, v parameters on the face and w parameter on the ray
+
+    """
+    def __init__(self, rays, points, faces, uvw):
+        self._rays = rays
+        self._points = points
+        self._faces = faces
+        self._uvw = uvw
+
+    @classmethod
+    def concatenate(cls, hits_list, offsets):
+        r"""Concatenate the hits of consecutive sets of rays
+
+        Parameters
+        ----------
+        hits_list : list[RayHits]
+        offsets : list[int]
+            Index of the first ray of each set
+
+        Returns
+        -------
+        RayHits
+
+        """
+        if len(hits_list) == 0:
+            return cls.empty()
+        return cls(np.concatenate([hits.rays + offset for hits, offset
+                                   in zip(hits_list, offsets)]),
+                   np.concatenate([hits.points for hits in hits_list]),
+                   np.concatenate([hits.faces for hits in hits_list]),
+                   np.concatenate([hits.uvw for hits in hits_list]))
+
+    @classmethod
+    def empty(cls):
+        r"""No hits"""
+        return cls(np.empty(0, dtype=np.int32),
+                   np.empty((0, 3)),
+                   np.empty(0, dtype=np.int32),
+                   np.empty((0, 3)))
+
+    def __len__(self):
+        return len(self._rays)
+
+    @property
+    def rays(self):
+        r"""(N,) int32 index of the ray of each hit"""
+        return self._rays
+
+    @property
+    def points(self):
+        r"""(N, 3) hit points"""
+        return self._points
+
+    @property
+    def faces(self):
+        r"""(N,) int32 index of the hit face"""
+        return self._faces
+
+    @property
+    def uvw(self):
+        r"""(N, 3) u, v and w parameters"""
+        return self._uvw
+
+    @property
+    def u(self):
+        r"""(N,) u parameter on the face"""
+        return self._uvw[:, 0]
+
+    @property
+    def v(self):
+        r"""(N,) v parameter on the face"""
+        return self._uvw[:, 1]
+
+    @property
+    def w(self):
+        r"""(N,) parameter along the ray"""
+        return self._uvw[:, 2]
+
+    def counts(self, number_of_rays):
+        r"""Number of hits of each ray
+
+        Parameters
+        ----------
+        number_of_rays : int
+
+        Returns
+        -------
+        np.ndarray
+            (number_of_rays,) int
+
+        """
+        return np.bincount(self._rays, minlength=number_of_rays)
+
+    def split(self, number_of_rays):
+        r"""Sorted w parameters of the hits of each ray
+
+        Parameters
+        ----------
+        number_of_rays : int
+
+        Returns
+        -------
+        list[np.ndarray]
+
+        """
+        boundaries = np.searchsorted(self._rays, np.arange(1, number_of_rays))
+        return np.split(self.w, boundaries)
+
+
+class ShapeIntersector(object):
+    r"""Ray / shape intersector that loads the shape once
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape
+    tolerance : float, optional
+
+    """
+    def __init__(self, shape, tolerance=OCCUTILS_DEFAULT_TOLERANCE):
+        self._shape = shape
+        self._tolerance = tolerance
+        self._intersector = IntCurvesFace_ShapeIntersector()
+        self._intersector.Load(shape, tolerance)
+        self._topo = Topo(shape, indexed=True)
+
+    @property
+    def shape(self):
+        r"""The intersected shape"""
+        return self._shape
+
+    @property
+    def tolerance(self):
+        r"""Intersection tolerance"""
+        return self._tolerance
+
+    def perform(self,
+                origins,
+                directions,
+                nearest=True,
+                low_parameter=0.0,
+                hi_parameter=float("+inf"),
+                processes=1,
+                chunk_size=10000,
+                timeout=None):
+        r"""Intersect the shape with rays
+
+        Parameters
+        ----------
+        origins : np.ndarray
+            (N, 3) ray origins
+        directions : np.ndarray
+            (N, 3) ray directions (they do not need to be unit vectors,
+            the w parameters are distances along the normalized directions)
+        nearest : bool, optional
+            If True, only keep the nearest hit of each ray,
+            otherwise keep all the hits
+        low_parameter : float, optional
+            (the default value is 0.0)
+        hi_parameter : float, optional
+            (the default value is infinity)
+        processes : int, optional
+            Number of worker processes, 1 (default) runs in this process,
+            see aocutils.parallel.number_of_processes()
+        chunk_size : int, optional
+            Number of rays per worker task
+        timeout : float, optional
+            Maximum time in seconds to wait for the workers
+
+        Returns
+        -------
+        RayHits
+
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        if origins.shape != directions.shape:
+            msg = "%i origins for %i directions" % (len(origins),
+                                                    len(directions))
+            logger.error(msg)
+            raise ValueError(msg)
+
+        if processes == 1 or len(origins) <= chunk_size:
+            return self._perform(origins, directions, nearest,
+                                 low_parameter, hi_parameter)
+
+        offsets = list(range(0, len(origins), chunk_size))
+        with BrepFile(self._shape) as brep_file:
+            tasks = [(brep_file.filename,
+                      self._tolerance,
+                      origins[offset:offset + chunk_size],
+                      directions[offset:offset + chunk_size],
+                      nearest,
+                      low_parameter,
+                      hi_parameter) for offset in offsets]
+            hits_list = pool_map(_perform_task,
+                                 tasks,
+                                 filename=brep_file.filename,
+                                 processes=processes,
+                                 timeout=timeout)
+        return RayHits.concatenate(hits_list, offsets)
+
+    def _perform(self, origins, directions, nearest, low_parameter,
+                 hi_parameter):
+        r"""Intersect the shape with rays, in this process"""
+        intersector = self._intersector
+        rays, points, faces, uvw = list(), list(), list(), list()
+        for ray, (origin, direction) in enumerate(zip(origins.tolist(),
+                                                      directions.tolist())):
+            line = gp_Lin(gp_Pnt(*origin), gp_Dir(*direction))
+            if nearest:
+                intersector.PerformNearest(line, low_parameter, hi_parameter)
+            else:
+                intersector.Perform(line, low_parameter, hi_parameter)
+            if not intersector.IsDone():
+                logger.warning("Intersection of ray %i failed" % ray)
+                continue
+            ray_hits = list()
+            for i in range(1, intersector.NbPnt() + 1):
+                pnt = intersector.Pnt(i)
+                ray_hits.append((intersector.WParameter(i),
+                                 (pnt.X(), pnt.Y(), pnt.Z()),
+                                 self._topo.index(intersector.Face(i)),
+                                 intersector.UParameter(i),
+                                 intersector.VParameter(i)))
+            ray_hits.sort(key=lambda hit: hit[0])
+            for w, xyz, face_index, u, v in ray_hits:
+                rays.append(ray)
+                points.append(xyz)
+                faces.append(face_index)
+                uvw.append((u, v, w))
+        if len(rays) == 0:
+            return RayHits.empty()
+        return RayHits(np.array(rays, dtype=np.int32),
+                       np.array(points),
+                       np.array(faces, dtype=np.int32),
+                       np.array(uvw))
+
+
+def _perform_task(task):
+    r"""Intersect the shape of a BREP file with a chunk of rays,
+    in a worker process"""
+    (filename, tolerance, origins, directions, nearest,
+     low_parameter, hi_parameter) = task
+    key = (filename, tolerance)
+    if key not in _worker_intersectors:
+        _worker_intersectors[key] = ShapeIntersector(worker_shape(filename),
+                                                     tolerance)
+    return _worker_intersectors[key]._perform(origins, directions, nearest,
+                                              low_parameter, hi_parameter)
@@ -0,0 +1,213 @@
+# coding: utf-8
+
+r"""Process pool helpers
+
+OCC shapes cannot be pickled, they are shipped to the worker processes
+as a BREP file : the parent writes the shape (or a compound of shapes) once,
+each worker process reads it once and keeps it for all the tasks it runs.
+This also sidesteps the GIL and the thread safety limits of OCC.
+
+"""
+
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from OCC.Core.BRep import BRep_Builder
+from OCC.Core.BRepTools import breptools_Write, breptools_Read
+from OCC.Core.TopoDS import TopoDS_Shape, TopoDS_Iterator
+
+from aocutils.brep.compound_make import compound
+
+logger = logging.getLogger(__name__)
+
+# shapes read by the current (worker) process
+# key: BREP file path; value: TopoDS_Shape
+_worker_shapes = dict()
+
+# sub-shapes of the shapes read by the current (worker) process
+# key: BREP file path; value: list of TopoDS_Shape
+_worker_sub_shapes = dict()
+
+
+def write_brep(shape, filename):
+    r"""Write a shape to a BREP file
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape
+    filename : str
+
+    """
+    if not breptools_Write(shape, filename):
+        msg = "Could not write the shape to %s" % filename
+        logger.error(msg)
+        raise IOError(msg)
+
+
+def read_brep(filename):
+    r"""Read a shape from a BREP file
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    TopoDS_Shape
+
+    """
+    shape = TopoDS_Shape()
+    if not breptools_Read(shape, filename, BRep_Builder()):
+        msg = "Could not read a shape from %s" % filename
+        logger.error(msg)
+        raise IOError(msg)
+    return shape
+
+
+class BrepFile(object):
+    r"""Temporary BREP file holding a shape, or a compound of shapes
+
+    This is a context manager, the file is removed on exit.
+
+    Parameters
+    ----------
+    shape_or_shapes : TopoDS_Shape or list[TopoDS_Shape]
+        If a list is given, the shapes are written as a compound
+        and can be retrieved in order with worker_sub_shapes()
+
+    """
+    def __init__(self, shape_or_shapes):
+        if isinstance(shape_or_shapes, (list, tuple)):
+            self._shape = compound(shape_or_shapes)
+        else:
+            self._shape = shape_or_shapes
+        self._directory = None
+        self._filename = None
+
+    @property
+    def filename(self):
+        r"""Path to the BREP file"""
+        return self._filename
+
+    def __enter__(self):
+        self._directory = tempfile.mkdtemp(prefix="aocutils_")
+        self._filename = os.path.join(self._directory, "shape.brep")
+        write_brep(self._shape, self._filename)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+
+def worker_shape(filename):
+    r"""Shape stored in a BREP file, read once per process
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    TopoDS_Shape
+
+    """
+    if filename not in _worker_shapes:
+        _worker_shapes[filename] = read_brep(filename)
+    return _worker_shapes[filename]
+
+
+def worker_sub_shapes(filename):
+    r"""Direct sub-shapes of the shape stored in a BREP file,
+    read once per process
+
+    The order is the one of the list given to BrepFile
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    list[TopoDS_Shape]
+
+    """
+    if filename not in _worker_sub_shapes:
+        sub_shapes = list()
+        iterator = TopoDS_Iterator(worker_shape(filename))
+        while iterator.More():
+            sub_shapes.append(iterator.Value())
+            iterator.Next()
+        _worker_sub_shapes[filename] = sub_shapes
+    return _worker_sub_shapes[filename]
+
+
+def _load_worker_shape(filename):
+    r"""Pool initializer : read the shape as soon as the worker starts"""
+    worker_shape(filename)
+
+
+def number_of_processes(processes=None):
+    r"""Number of worker processes to use
+
+    Parameters
+    ----------
+    processes : int or None
+        None or a value < 1 means one process per CPU
+
+    Returns
+    -------
+    int
+
+    """
+    if processes is None or processes < 1:
+        return multiprocessing.cpu_count()
+    return processes
+
+
+def pool_map(function, tasks, filename=None, processes=None, timeout=None):
+    r"""Map function over tasks in a process pool
+
+    The results are returned in the order of the tasks, whatever
+    the order in which the workers complete them.
+
+    Parameters
+    ----------
+    function : callable
+        Module level function (it has to be importable by the workers)
+        taking a single task as argument
+    tasks : list
+        The (picklable) tasks
+    filename : str, optional
+        BREP file (see BrepFile) that the workers load when they start
+    processes : int, optional
+        Number of worker processes, see number_of_processes()
+    timeout : float, optional
+        Maximum time in seconds to wait for all the results
+
+    Returns
+    -------
+    list
+        The results
+
+    Raises
+    ------
+    multiprocessing.TimeoutError
+        If the results are not available within timeout
+
+    """
+    tasks = list(tasks)
+    processes = min(number_of_processes(processes), max(len(tasks), 1))
+    if filename is None:
+        pool = multiprocessing.Pool(processes)
+    else:
+        pool = multiprocessing.Pool(processes,
+                                    initializer=_load_worker_shape,
+                                    initargs=(filename,))
+    try:
+        return pool.map_async(function, tasks, chunksize=1).get(timeout)
+    finally:
+        pool.terminate()
+        pool.join()
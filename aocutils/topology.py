@@ -6,14 +6,17 @@ from __future__ import print_function
 
 import logging
 
+import numpy as np
+
 # import OCC.BRep
 from OCC.Core.BRepTools import BRepTools_WireExplorer
 from OCC.Core.TopAbs import TopAbs_VERTEX, TopAbs_EDGE, TopAbs_WIRE, \
     TopAbs_FACE, TopAbs_SHELL, TopAbs_SOLID, TopAbs_COMPOUND, TopAbs_COMPSOLID
-from OCC.Core.TopExp import TopExp_Explorer, topexp_MapShapesAndAncestors
+from OCC.Core.TopExp import TopExp_Explorer, topexp_MapShapesAndAncestors, \
+    topexp_MapShapes
 from OCC.Core.TopTools import TopTools_ListOfShape, \
     TopTools_ListIteratorOfListOfShape, \
-    TopTools_IndexedDataMapOfShapeListOfShape
+    TopTools_IndexedDataMapOfShapeListOfShape, TopTools_IndexedMapOfShape
 from OCC.Core.TopoDS import topods_Edge, topods_Vertex, TopoDS_Shape, \
     TopoDS_Wire
 
@@ -41,6 +44,214 @@ def shape_to_topology(shape):
         raise AttributeError(msg)
 
 
+class ShapeKey(object):
+    r"""Hashable, orientation insensitive key for a TopoDS_Shape
+
+    Two keys are equal if their shapes share the same TShape and the same
+    Location, whatever their Orientation (i.e. TopoDS_Shape.IsSame()).
+    The hash is TopoDS_Shape.HashCode(), that is also built from the TShape
+    and the Location, so that sets and dicts of keys only compare shapes
+    that fall in the same bucket instead of scanning everything pairwise.
+
+    Parameters
+    ----------
+    shape : TopoDS_Shape or subclass
+
+    """
+    _hash_upper_bound = 2147483647
+
+    def __init__(self, shape):
+        self._shape = shape
+        self._hash = shape.HashCode(ShapeKey._hash_upper_bound)
+
+    @property
+    def shape(self):
+        r"""The shape the key was built from"""
+        return self._shape
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, ShapeKey):
+            return NotImplemented
+        return self._hash == other._hash and self._shape.IsSame(other._shape)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, str(self._hash))
+
+
+class CSRAdjacency(object):
+    r"""Compressed sparse row adjacency between 2 indexed sub-shape tables
+
+    The neighbours of the row i are indices[indptr[i]:indptr[i + 1]],
+    sorted in ascending order
+
+    Parameters
+    ----------
+    indptr : np.ndarray
+        (n_rows + 1,) row pointers
+    indices : np.ndarray
+        (n_entries,) column indices
+
+    """
+    def __init__(self, indptr, indices):
+        self._indptr = indptr
+        self._indices = indices
+
+    @classmethod
+    def from_pairs(cls, rows, cols, n_rows):
+        r"""Build the adjacency from (row, column) index pairs
+
+        Duplicate pairs are dropped
+
+        Parameters
+        ----------
+        rows : np.ndarray
+        cols : np.ndarray
+        n_rows : int
+
+        Returns
+        -------
+        CSRAdjacency
+
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        if rows.size > 0:
+            n_cols = int(cols.max()) + 1
+            unique_pairs = np.unique(rows * n_cols + cols)
+            rows, cols = unique_pairs // n_cols, unique_pairs % n_cols
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+        return cls(indptr, cols.astype(np.int32))
+
+    @property
+    def indptr(self):
+        r"""Row pointers"""
+        return self._indptr
+
+    @property
+    def indices(self):
+        r"""Column indices"""
+        return self._indices
+
+    @property
+    def degrees(self):
+        r"""Number of neighbours of each row"""
+        return np.diff(self._indptr)
+
+    @property
+    def rows(self):
+        r"""Row index of each entry of indices"""
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.degrees)
+
+    def neighbours(self, i):
+        r"""Column indices adjacent to row i"""
+        return self._indices[self._indptr[i]:self._indptr[i + 1]]
+
+    def transpose(self, n_cols):
+        r"""Adjacency from the columns to the rows
+
+        Parameters
+        ----------
+        n_cols : int
+            Number of columns (i.e. the number of rows of the transpose)
+
+        Returns
+        -------
+        CSRAdjacency
+
+        """
+        return CSRAdjacency.from_pairs(self._indices, self.rows, n_cols)
+
+    def __len__(self):
+        return len(self._indptr) - 1
+
+
+class TopologyGraph(object):
+    r"""Integer indexed sub-shapes tables and their CSR adjacencies
+
+    The index of a sub-shape in a table is the one returned by Topo.index()
+
+    Parameters
+    ----------
+    vertices, edges, faces, solids : list of TopoDS_*
+        The sub-shape tables
+    adjacency : dict
+        key: (from type name, to type name) e.g. ('face', 'edge');
+        value: CSRAdjacency
+
+    """
+    def __init__(self, vertices, edges, faces, solids, adjacency):
+        self._vertices = vertices
+        self._edges = edges
+        self._faces = faces
+        self._solids = solids
+        self._adjacency = adjacency
+
+    @property
+    def vertices(self):
+        r"""Vertices table"""
+        return self._vertices
+
+    @property
+    def edges(self):
+        r"""Edges table"""
+        return self._edges
+
+    @property
+    def faces(self):
+        r"""Faces table"""
+        return self._faces
+
+    @property
+    def solids(self):
+        r"""Solids table"""
+        return self._solids
+
+    @property
+    def face_edge(self):
+        r"""Face -> edges adjacency"""
+        return self._adjacency[('face', 'edge')]
+
+    @property
+    def edge_face(self):
+        r"""Edge -> faces adjacency"""
+        return self._adjacency[('edge', 'face')]
+
+    @property
+    def edge_vertex(self):
+        r"""Edge -> vertices adjacency"""
+        return self._adjacency[('edge', 'vertex')]
+
+    @property
+    def vertex_edge(self):
+        r"""Vertex -> edges adjacency"""
+        return self._adjacency[('vertex', 'edge')]
+
+    @property
+    def face_face(self):
+        r"""Face -> faces adjacency, through shared edges"""
+        return self._adjacency[('face', 'face')]
+
+    @property
+    def solid_face(self):
+        r"""Solid -> faces adjacency"""
+        return self._adjacency[('solid', 'face')]
+
+    @property
+    def face_solid(self):
+        r"""Face -> solids adjacency"""
+        return self._adjacency[('face', 'solid')]
+
+
 class WireExplorer(object):
     """Wire traversal
 
@@ -67,7 +278,7 @@ class WireExplorer(object):
             self._reinitialize()
         topology_type = topods_Edge if edges else topods_Vertex
         python_list_of_shape = list()
-        hashes = list()  # list that stores hashes to avoid redundancy
+        keys = set()  # set that stores keys to avoid redundancy
         toptools_list_of_shape = TopTools_ListOfShape()
         while self.wire_explorer.More():
             # loop edges
@@ -76,9 +287,9 @@ class WireExplorer(object):
             # loop vertices
             else:
                 current_item = self.wire_explorer.CurrentVertex()
-            current_item_hash = current_item.__hash__()
-            if current_item_hash not in hashes:
-                hashes.append(current_item_hash)
+            current_item_key = ShapeKey(current_item)
+            if current_item_key not in keys:
+                keys.add(current_item_key)
                 toptools_list_of_shape.Append(current_item)
             self.wire_explorer.Next()
 
@@ -130,6 +341,18 @@ class Topo(object):
     to True, in case of a cube, just 12 edges and only 8 vertices will be
     returned
 
+    With ``indexed`` set to True, the shape is walked once and an index table
+    is built for every sub-shape type. Enumerations are then served from
+    these tables and the (child type, ancestor type) maps used by the
+    ``*_from_*`` methods are built once and memoized, so that repeated
+    adjacency queries (e.g. faces_from_edge for every edge of a large
+    assembly) do not rebuild a TopTools_IndexedDataMapOfShapeListOfShape
+    on each call. Indexed sub-shapes are unique in the IsSame sense.
+
+    With ``streaming`` set to True, the traversals return generators that
+    yield the sub-shapes as the TopExp_Explorer advances, instead of
+    collecting them first (see stream()).
+
     See Also
     --------
     TopoDS_Shape IsEqual / IsSame methods
@@ -142,13 +365,206 @@ class Topo(object):
         filter out TopoDS_* entities of similar TShape but different Orientation
     return_iter : bool
         If True, return iterators. If False, return lists
+    indexed : bool
+        If True, use cached index tables and memoized ancestor maps
+    streaming : bool
+        If True, traversals return generators (return_iter is then ignored)
 
     """
 
-    def __init__(self, my_shape, ignore_orientation=False, return_iter=True):
+    def __init__(self,
+                 my_shape,
+                 ignore_orientation=False,
+                 return_iter=True,
+                 indexed=False,
+                 streaming=False):
         self._my_shape = my_shape
         self._ignore_orientation = ignore_orientation
         self._return_iter = return_iter
+        self._indexed = indexed
+        self._streaming = streaming
+        # key: topology type; value: TopTools_IndexedMapOfShape
+        self._index_tables = None
+        # key: topology type; value: list of downcast TopoDS_* entities
+        self._index_lists = None
+        # key: (child type, ancestor type);
+        # value: TopTools_IndexedDataMapOfShapeListOfShape
+        self._ancestor_maps = dict()
+
+    @property
+    def indexed(self):
+        r"""Is the indexed mode on?"""
+        return self._indexed
+
+    def _build_index_tables(self):
+        r"""Walk the shape once and split its sub-shapes by type
+
+        The per-type tables are TopTools_IndexedMapOfShape, hence
+        lookups by shape are O(1)
+
+        """
+        all_sub_shapes = TopTools_IndexedMapOfShape()
+        topexp_MapShapes(self._my_shape, all_sub_shapes)
+
+        self._index_tables = dict()
+        self._index_lists = dict()
+        for topology_type in topo_type_class.keys():
+            self._index_tables[topology_type] = TopTools_IndexedMapOfShape()
+            self._index_lists[topology_type] = list()
+
+        for i in range(1, all_sub_shapes.Extent() + 1):
+            sub_shape = all_sub_shapes.FindKey(i)
+            topology_type = sub_shape.ShapeType()
+            self._index_tables[topology_type].Add(sub_shape)
+            self._index_lists[topology_type].append(
+                topo_factory[topology_type](sub_shape))
+
+    def _index_table(self, topology_type):
+        r"""Index table (TopTools_IndexedMapOfShape) for a topology type"""
+        if self._index_tables is None:
+            self._build_index_tables()
+        return self._index_tables[topology_type]
+
+    def _index_list(self, topology_type):
+        r"""Downcast sub-shapes of a topology type, in index order"""
+        if self._index_lists is None:
+            self._build_index_tables()
+        return self._index_lists[topology_type]
+
+    def index(self, topological_entity):
+        r"""Index of a sub-shape in the table of its topology type
+
+        Parameters
+        ----------
+        topological_entity : TopoDS_*
+
+        Returns
+        -------
+        int
+            0 based index, -1 if the entity is not a sub-shape of the shape
+
+        """
+        table = self._index_table(topological_entity.ShapeType())
+        return table.FindIndex(topological_entity) - 1
+
+    def from_index(self, topology_type, index):
+        r"""Sub-shape of a topology type at a given index
+
+        Parameters
+        ----------
+        topology_type : TopAbs_*
+        index : int
+            0 based index, as returned by index()
+
+        Returns
+        -------
+        TopoDS_*
+
+        """
+        return self._index_list(topology_type)[index]
+
+    def _ancestor_pairs(self, topo_type_a, topo_type_b):
+        r"""(topo_type_a index, topo_type_b index) pairs of all
+        the sub-shapes and their ancestors
+
+        Returns
+        -------
+        tuple[np.ndarray]
+
+        """
+        _map = self._ancestor_map(topo_type_a, topo_type_b)
+        table_a = self._index_table(topo_type_a)
+        table_b = self._index_table(topo_type_b)
+        indices_a, indices_b = list(), list()
+        for i in range(1, _map.Extent() + 1):
+            index_a = table_a.FindIndex(_map.FindKey(i)) - 1
+            topology_iterator = TopTools_ListIteratorOfListOfShape(
+                _map.FindFromIndex(i))
+            while topology_iterator.More():
+                indices_a.append(index_a)
+                indices_b.append(
+                    table_b.FindIndex(topology_iterator.Value()) - 1)
+                topology_iterator.Next()
+        return (np.array(indices_a, dtype=np.int64),
+                np.array(indices_b, dtype=np.int64))
+
+    def graph(self):
+        r"""Topology graph with NumPy CSR adjacency arrays
+
+        Builds the vertex, edge, face and solid tables and the
+        face <-> edge, edge <-> vertex, face <-> face (through shared edges)
+        and solid <-> face adjacencies, so that graph algorithms can run on
+        integer arrays instead of repeated *_from_* calls
+
+        Returns
+        -------
+        TopologyGraph
+
+        """
+        n_vertices = len(self._index_list(TopAbs_VERTEX))
+        n_edges = len(self._index_list(TopAbs_EDGE))
+        n_faces = len(self._index_list(TopAbs_FACE))
+        n_solids = len(self._index_list(TopAbs_SOLID))
+
+        adjacency = dict()
+
+        edges, faces = self._ancestor_pairs(TopAbs_EDGE, TopAbs_FACE)
+        edge_face = CSRAdjacency.from_pairs(edges, faces, n_edges)
+        adjacency[('edge', 'face')] = edge_face
+        adjacency[('face', 'edge')] = edge_face.transpose(n_faces)
+
+        vertices, edges = self._ancestor_pairs(TopAbs_VERTEX, TopAbs_EDGE)
+        vertex_edge = CSRAdjacency.from_pairs(vertices, edges, n_vertices)
+        adjacency[('vertex', 'edge')] = vertex_edge
+        adjacency[('edge', 'vertex')] = vertex_edge.transpose(n_edges)
+
+        faces, solids = self._ancestor_pairs(TopAbs_FACE, TopAbs_SOLID)
+        face_solid = CSRAdjacency.from_pairs(faces, solids, n_faces)
+        adjacency[('face', 'solid')] = face_solid
+        adjacency[('solid', 'face')] = face_solid.transpose(n_solids)
+
+        # face <-> face : pair every face of an edge
+        # with every other face of the same edge
+        degrees = edge_face.degrees
+        entry_edges = edge_face.rows
+        n_partners = degrees[entry_edges]
+        faces_a = np.repeat(edge_face.indices, n_partners)
+        partner_starts = np.repeat(edge_face.indptr[entry_edges], n_partners)
+        partner_offsets = (np.arange(n_partners.sum()) -
+                           np.repeat(np.cumsum(n_partners) - n_partners,
+                                     n_partners))
+        faces_b = edge_face.indices[partner_starts + partner_offsets]
+        different = faces_a != faces_b
+        adjacency[('face', 'face')] = CSRAdjacency.from_pairs(
+            faces_a[different], faces_b[different], n_faces)
+
+        return TopologyGraph(list(self._index_list(TopAbs_VERTEX)),
+                             list(self._index_list(TopAbs_EDGE)),
+                             list(self._index_list(TopAbs_FACE)),
+                             list(self._index_list(TopAbs_SOLID)),
+                             adjacency)
+
+    def _ancestor_map(self, topo_type_a, topo_type_b):
+        r"""Map of the topo_type_a sub-shapes to their topo_type_b ancestors
+
+        The map is memoized in indexed mode
+
+        Returns
+        -------
+        TopTools_IndexedDataMapOfShapeListOfShape
+
+        """
+        key = (topo_type_a, topo_type_b)
+        if self._indexed and key in self._ancestor_maps:
+            return self._ancestor_maps[key]
+        _map = TopTools_IndexedDataMapOfShapeListOfShape()
+        topexp_MapShapesAndAncestors(self._my_shape,
+                                     topo_type_a,
+                                     topo_type_b,
+                                     _map)
+        if self._indexed:
+            self._ancestor_maps[key] = _map
+        return _map
 
     def _loop_topo(self,
                    topology_type,
@@ -192,61 +608,109 @@ class Topo(object):
             logger.critical(msg)
             raise WrongTopologicalType(msg)
 
-        self.topexp_explorer = TopExp_Explorer()
-        # use self._my_shape if nothing is specified
-        if topological_entity is None and topology_type_to_avoid is None:
-            self.topexp_explorer.Init(self._my_shape, topology_type)
-
-        elif topological_entity is None and topology_type_to_avoid is not None:
-            self.topexp_explorer.Init(self._my_shape, topology_type,
-                                      topology_type_to_avoid)
-
-        elif topology_type_to_avoid is None:
-            self.topexp_explorer.Init(topological_entity, topology_type)
-
-        elif topology_type_to_avoid:
-            self.topexp_explorer.Init(topological_entity,
-                                      topology_type,
-                                      topology_type_to_avoid)
-
-        seq = list()
-        hashes = list()  # list that stores hashes to avoid redundancy
-        occ_seq = TopTools_ListOfShape()
-        while self.topexp_explorer.More():
-            current_item = self.topexp_explorer.Current()
-            current_item_hash = current_item.__hash__()
+        if (self._indexed and topological_entity is None and
+                topology_type_to_avoid is None):
+            seq = list(self._index_list(topology_type))
+            if self._ignore_orientation:
+                # the index tables are already unique in the IsSame sense
+                return seq
+            if self._return_iter:
+                return iter(seq)
+            else:
+                return seq
 
-            if current_item_hash not in hashes:
-                hashes.append(current_item_hash)
-                occ_seq.Append(current_item)
+        if self._streaming:
+            return self._stream(topology_type,
+                                topological_entity,
+                                topology_type_to_avoid,
+                                unique=True)
 
-            self.topexp_explorer.Next()
-        # Convert occ_seq to python list
-        occ_iterator = TopTools_ListIteratorOfListOfShape(occ_seq)
-        while occ_iterator.More():
-            topo_to_add = topo_factory[topology_type](occ_iterator.Value())
-            seq.append(topo_to_add)
-            occ_iterator.Next()
+        seq = list(self._stream(topology_type,
+                                topological_entity,
+                                topology_type_to_avoid,
+                                unique=True))
 
         if self._ignore_orientation:
-            # filter out those entities that share the same TShape
-            # but do *not* share the same orientation
-            filter_orientation_seq = list()
-            for i in seq:
-                _present = False
-                for j in filter_orientation_seq:
-                    if i.IsSame(j):
-                        _present = True
-                        break
-                if _present is False:
-                    filter_orientation_seq.append(i)
-            return filter_orientation_seq
+            # entities that share the same TShape but do *not* share the
+            # same orientation have already been filtered out by the ShapeKey
+            return seq
         else:
             if self._return_iter:
                 return iter(seq)  # iterator
             else:
                 return seq  # list
 
+    def _stream(self,
+                topology_type,
+                topological_entity=None,
+                topology_type_to_avoid=None,
+                unique=True):
+        r"""Generator that yields the downcast sub-shapes as the
+        TopExp_Explorer advances
+
+        A new explorer is used for each call so that nested loops
+        over the same Topo object do not interfere
+
+        """
+        if topological_entity is None:
+            topological_entity = self._my_shape
+
+        explorer = TopExp_Explorer()
+        if topology_type_to_avoid is None:
+            explorer.Init(topological_entity, topology_type)
+        else:
+            explorer.Init(topological_entity,
+                          topology_type,
+                          topology_type_to_avoid)
+
+        downcast = topo_factory[topology_type]
+        keys = set()  # set that stores keys to avoid redundancy
+        while explorer.More():
+            current_item = explorer.Current()
+            explorer.Next()
+            if unique:
+                current_item_key = ShapeKey(current_item)
+                if current_item_key in keys:
+                    continue
+                keys.add(current_item_key)
+            yield downcast(current_item)
+
+    def stream(self,
+               topology_type,
+               topological_entity=None,
+               topology_type_to_avoid=None,
+               unique=True):
+        r"""Stream the sub-shapes of a given type
+
+        The sub-shapes are yielded as the underlying TopExp_Explorer
+        advances : nothing is collected up front, a consumer that stops
+        after the first few items does not pay for the whole traversal.
+
+        Parameters
+        ----------
+        topology_type : TopAbs_*
+        topological_entity : TopoDS_*, optional
+            The entity to explore. The default is the Topo shape
+        topology_type_to_avoid : TopAbs_*, optional
+        unique : bool, optional
+            If True (default), skip the sub-shapes already yielded
+            (IsSame sense). The keys of the yielded sub-shapes are kept,
+            use False for a constant memory footprint.
+
+        Returns
+        -------
+        generator of TopoDS_*
+
+        """
+        if topology_type not in topo_type_class.keys():
+            msg = '%s not one of %s' % (topology_type, topo_type_class.keys())
+            logger.critical(msg)
+            raise WrongTopologicalType(msg)
+        return self._stream(topology_type,
+                            topological_entity,
+                            topology_type_to_avoid,
+                            unique)
+
     @property
     def faces(self):
         """Loops over all faces"""
@@ -429,11 +893,7 @@ class Topo(object):
 
         """
         topo_set = set()
-        _map = TopTools_IndexedDataMapOfShapeListOfShape()
-        topexp_MapShapesAndAncestors(self._my_shape,
-                                     topo_type_a,
-                                     topo_type_b,
-                                     _map)
+        _map = self._ancestor_map(topo_type_a, topo_type_b)
         results = _map.FindFromKey(topological_entity)
         if results.IsEmpty():
             yield None
@@ -444,19 +904,14 @@ class Topo(object):
             topo_entity = topo_factory[topo_type_b](topology_iterator.Value())
             # return the entity if not in set to insure we're not
             # returning entities several times
-            if topo_entity not in topo_set:
-                if self._ignore_orientation:
-                    unique = True
-                    for i in topo_set:
-                        if i.IsSame(topo_entity):
-                            unique = False
-                            break
-                    if unique:
-                        yield topo_entity
-                else:
-                    yield topo_entity
-
-            topo_set.add(topo_entity)
+            if self._ignore_orientation:
+                topo_key = ShapeKey(topo_entity)
+            else:
+                topo_key = topo_entity
+            if topo_key not in topo_set:
+                yield topo_entity
+
+            topo_set.add(topo_key)
             topology_iterator.Next()
 
     def _number_shapes_ancestors(self,
@@ -481,11 +936,7 @@ class Topo(object):
             The number of shape ancestors
         """
         topo_set = set()
-        _map = TopTools_IndexedDataMapOfShapeListOfShape()
-        topexp_MapShapesAndAncestors(self._my_shape,
-                                     topo_type_a,
-                                     topo_type_b,
-                                     _map)
+        _map = self._ancestor_map(topo_type_a, topo_type_b)
         results = _map.FindFromKey(topological_entity)
         if results.IsEmpty():
             # left as is on purpose, maybe 0 would be a better return value
@@ -6,23 +6,36 @@ r"""analyze package tests"""
 import pytest
 import math
 import os
+import tempfile
+
+import numpy as np
 
 from OCC.Core.gp import gp_Pnt
+from OCC.Core.TopAbs import TopAbs_IN, TopAbs_OUT, TopAbs_ON
 
-from aocutils.primitives import box, sphere
+from aocutils.primitives import box, sphere, cylinder
 from aocutils.tolerance import OCCUTILS_DEFAULT_TOLERANCE
 from aocutils.topology import Topo
-# from aocutils.mesh import mesh
+from aocutils.mesh import mesh, triangulation
 from aocutils.exceptions import WrongTopologicalType
 from aocutils.brep.edge_make import line
 from aocutils.brep.wire_make import wire
 from aocutils.brep.face_make import face
+from aocutils.brep.compound_make import compound
 
 from aocutils.analyze.bounds import BoundingBox, BetterBoundingBox, \
-    stl_bounding_box
-from aocutils.analyze.distance import MinimumDistance
-from aocutils.analyze.global_ import GlobalProperties
-from aocutils.analyze.inclusion import point_in_boundingbox, point_in_solid
+    stl_bounding_box, TightBoundingBox, OptimalBoundingBox, \
+    OrientedBoundingBox
+from aocutils.analyze.distance import MinimumDistance, clearance_matrix
+from aocutils.analyze.clash import ClashDetector, TOUCH, INTERFERENCE, \
+    CLEARANCE_VIOLATION
+from aocutils.analyze.global_ import GlobalProperties, VOLUME, SURFACE, \
+    DEFAULT, ADAPTIVE, MESH, clear_cache, mass_properties
+from aocutils.analyze.mass import bulk_mass_properties
+from aocutils.analyze.inclusion import point_in_boundingbox, point_in_solid, \
+    points_in_boundingbox, points_in_solid
+from aocutils.analyze.voxel import voxelize
+from aocutils.analyze.deviation import DeviationAnalysis
 
 from aocxchange.step import StepImporter
 from aocxchange.utils import path_from_file
@@ -103,6 +116,18 @@ def test_better_bounds_box():
     assert bbb.z_max - box_dim_z <= 2 * tolerance
 
 
+def test_better_bounds_parallel():
+    r"""The process pool evaluation gives the same result
+    as the sequential evaluation"""
+    tolerance = 0.01
+    bbb = BetterBoundingBox(sphere_, tol=tolerance)
+    bbb_parallel = BetterBoundingBox(sphere_, tol=tolerance, processes=6,
+                                     timeout=600)
+    # the pool workers read the shape back from a BREP file
+    assert bbb_parallel.as_tuple == pytest.approx(bbb.as_tuple, abs=tolerance)
+    assert bbb_parallel.boolean_evaluations == bbb.boolean_evaluations
+
+
 def test_bounds_sphere():
     r"""Test the bounding box on a sphere"""
     # mesh(box)
@@ -130,6 +155,31 @@ def test_better_bounds_sphere():
     assert bbb.z_max - sphere_radius <= 2 * tolerance
 
 
+def test_tight_bounds_sphere():
+    r"""Test the boolean free tight bounding box on a sphere"""
+    tolerance = 0.01
+    tbb = TightBoundingBox(sphere_, tol=tolerance)
+    bbb = BetterBoundingBox(sphere_, tol=tolerance)
+    for value, better_value in zip(tbb.as_tuple, bbb.as_tuple):
+        assert sphere_radius <= abs(value) <= sphere_radius + tolerance
+        assert abs(value - better_value) <= 2 * tolerance
+
+    obb = OptimalBoundingBox(sphere_)
+    assert 2 * sphere_radius <= obb.x_span < 2 * sphere_radius + 2.001 * tol
+
+
+def test_oriented_bounds_box():
+    r"""Test the oriented bounding box on a box"""
+    obb = OrientedBoundingBox(box_)
+    half_sizes = sorted(obb.half_sizes)
+    assert abs(half_sizes[0] - box_dim_x / 2.) < 1e-3
+    assert abs(half_sizes[1] - box_dim_y / 2.) < 1e-3
+    assert abs(half_sizes[2] - box_dim_z / 2.) < 1e-3
+    assert abs(obb.volume - box_dim_x * box_dim_y * box_dim_z) < 1.
+    assert len(obb.corners) == 8
+    assert obb.is_out(OrientedBoundingBox(sphere_2)) is True
+
+
 def test_better_bounds_complex_shape():
     r"""Test BetterBoundingBox on a complex shape"""
 
@@ -171,6 +221,76 @@ def test_minimum_distance():
     assert isinstance(md.point_pairs[0][0], (gp_Pnt, ))
 
 
+def test_clearance_matrix():
+    r"""Test the clearance matrix of a box and 3 spheres"""
+    sphere_3 = sphere(gp_Pnt(200, 0, 0), sphere_radius)
+    shapes = [box_, sphere_, sphere_2, sphere_3]
+
+    matrix = clearance_matrix(shapes, 25.)
+    assert matrix.number_of_candidates == 3
+    assert [tuple(pair) for pair in matrix.pairs] == [(0, 1), (0, 2), (1, 2)]
+    assert matrix.distance(1, 0) == pytest.approx(0.)
+    assert matrix.distance(0, 2) == pytest.approx(20.)
+    assert matrix.distance(1, 2) == pytest.approx(20.)
+    assert matrix.distance(2, 3) is None
+    point_1, point_2 = matrix.point_pair(2, 1)
+    assert np.allclose(point_1, [30., 0., 0.])
+    assert np.allclose(point_2, [10., 0., 0.])
+    dense = matrix.to_dense()
+    assert dense.shape == (4, 4) and np.all(np.isinf(dense[3, :3]))
+
+    # 3 candidates in chunks of 1 pair : 3 worker tasks
+    parallel_matrix = clearance_matrix(shapes, 25., processes=2, chunk_size=1)
+    assert parallel_matrix.number_of_candidates == 3
+    assert np.array_equal(parallel_matrix.pairs, matrix.pairs)
+    for i, j in matrix.pairs.tolist():
+        assert parallel_matrix.distance(i, j) == \
+            pytest.approx(matrix.distance(i, j))
+
+    matrix = clearance_matrix(shapes, 5.)
+    assert len(matrix) == 1 and matrix.distance(0, 1) == pytest.approx(0.)
+
+
+def test_clash_detector():
+    r"""Test the staged clash detection and its incremental update"""
+    touching_box = box(gp_Pnt(box_dim_x, 10., 10.), 5., 5., 5.)
+    detector = ClashDetector([box_, sphere_, touching_box, sphere_2])
+    clashes = detector.perform()
+    assert [(c.i, c.j, c.kind) for c in clashes] == [(0, 1, INTERFERENCE),
+                                                    (0, 2, TOUCH)]
+    assert clashes[0].volume == pytest.approx(
+        4. / 3. * math.pi * sphere_radius ** 3 / 8., rel=1e-3)
+    assert clashes[1].volume == pytest.approx(0.)
+    assert detector.stage_counts["aabb"] == 6
+    assert detector.stage_counts["boolean"] == 2
+
+    # distance and boolean stages in a process pool, 1 pair per task
+    parallel_detector = ClashDetector([box_, sphere_, touching_box, sphere_2],
+                                      processes=2,
+                                      chunk_size=1)
+    parallel_clashes = parallel_detector.perform()
+    assert [(c.i, c.j, c.kind) for c in parallel_clashes] == \
+        [(c.i, c.j, c.kind) for c in clashes]
+    assert parallel_clashes[0].volume == pytest.approx(clashes[0].volume)
+    assert parallel_detector.stage_counts == detector.stage_counts
+
+    # sphere_2 moved onto a corner of the box
+    clashes = detector.move(3, sphere(gp_Pnt(box_dim_x, box_dim_y, box_dim_z),
+                                      2.))
+    assert detector.stage_counts["aabb"] == 3
+    assert [(c.i, c.j) for c in clashes] == [(0, 1), (0, 2), (0, 3)]
+    assert clashes[2].kind == INTERFERENCE
+    assert clashes[2].volume == pytest.approx(4. / 3. * math.pi * 8. / 8.,
+                                              rel=1e-3)
+
+    detector = ClashDetector([box_, sphere_2], clearance=21.)
+    clashes = detector.perform()
+    assert len(clashes) == 1
+    assert clashes[0].kind == CLEARANCE_VIOLATION
+    assert clashes[0].distance == pytest.approx(20.)
+    assert detector.clashes_of_kind(INTERFERENCE) == []
+
+
 def test_global_properties_box():
     r"""Properties of a the box"""
 
@@ -205,6 +325,126 @@ def test_global_properties_box():
         _ = shell_properties.volume
 
 
+def test_global_properties_cache():
+    r"""The properties are integrated once and compounds are aggregated"""
+    clear_cache()
+    box_properties = GlobalProperties(box_)
+    system = box_properties.system
+    assert GlobalProperties(box_).system is system
+
+    properties = box_properties.properties
+    box_volume = box_dim_x * box_dim_y * box_dim_z
+    assert properties.kind == VOLUME
+    assert properties.mass == pytest.approx(box_volume)
+    assert np.allclose(properties.centre,
+                       [box_dim_x / 2., box_dim_y / 2., box_dim_z / 2.])
+    expected_inertia = box_volume / 12. * np.diag(
+        [box_dim_y ** 2 + box_dim_z ** 2,
+         box_dim_x ** 2 + box_dim_z ** 2,
+         box_dim_x ** 2 + box_dim_y ** 2])
+    assert np.allclose(properties.inertia, expected_inertia)
+
+    clear_cache()
+    assert GlobalProperties(box_).system is not system
+
+    # throwaway shapes are integrated without the cache
+    assert mass_properties(box_, VOLUME) is mass_properties(box_, VOLUME)
+    assert mass_properties(box_, VOLUME, cache=False) is not \
+        mass_properties(box_, VOLUME, cache=False)
+
+    # a box and a sphere
+    two_solids = compound([box_, sphere_2])
+    sphere_volume = 4. / 3. * math.pi * sphere_radius ** 3
+    compound_properties = GlobalProperties(two_solids)
+    assert compound_properties.kind == VOLUME
+    assert compound_properties.volume == pytest.approx(box_volume +
+                                                       sphere_volume)
+    expected_centre = (box_volume * np.array([5., 10., 15.]) +
+                       sphere_volume * np.array([40., 0., 0.])) / \
+        (box_volume + sphere_volume)
+    assert np.allclose(compound_properties.properties.centre,
+                       expected_centre)
+    parallel_properties = mass_properties(two_solids, VOLUME,
+                                          processes=2, chunk_size=1)
+    assert np.allclose(parallel_properties.inertia,
+                       compound_properties.properties.inertia)
+
+
+def test_bulk_mass_properties():
+    r"""Test the bulk mass properties of a box and a sphere"""
+    box_volume = box_dim_x * box_dim_y * box_dim_z
+    box_area = 2. * (box_dim_x * box_dim_y + box_dim_y * box_dim_z +
+                     box_dim_x * box_dim_z)
+    sphere_volume = 4. / 3. * math.pi * sphere_radius ** 3
+
+    bulk = bulk_mass_properties([box_, sphere_2], densities=[2., 3.])
+    assert len(bulk) == 2
+    assert np.allclose(bulk.volumes, [box_volume, sphere_volume])
+    assert bulk.areas[0] == pytest.approx(box_area)
+    assert np.allclose(bulk.masses, [2. * box_volume, 3. * sphere_volume])
+    assert np.allclose(bulk.centres, [[5., 10., 15.], [40., 0., 0.]])
+    sphere_moment = 2. / 5. * 3. * sphere_volume * sphere_radius ** 2
+    assert np.allclose(bulk.inertias[1], sphere_moment * np.eye(3))
+
+    records = bulk.as_structured()
+    assert records.shape == (2,)
+    assert np.allclose(records["mass"], bulk.masses)
+    assert records["inertia"].shape == (2, 3, 3)
+
+    mass, centre, inertia = bulk.total()
+    assert mass == pytest.approx(bulk.masses.sum())
+    assert np.allclose(centre, np.dot(bulk.masses, bulk.centres) / mass)
+    assert np.allclose(inertia, inertia.T)
+
+    # same results from a compound, in a pool, with a single density
+    pooled = bulk_mass_properties(compound([box_, sphere_2]),
+                                  processes=2, chunk_size=1)
+    assert np.allclose(pooled.volumes, bulk.volumes)
+    pooled.densities = [2., 3.]
+    assert np.allclose(pooled.total()[2], inertia)
+
+    with pytest.raises(ValueError):
+        bulk.densities = [1., 2., 3.]
+
+
+def test_global_properties_modes():
+    r"""Test the precision modes of the global properties of a sphere"""
+    theoretical_volume = 4. / 3. * math.pi * sphere_radius ** 3
+    theoretical_area = 4. * math.pi * sphere_radius ** 2
+
+    default_properties = GlobalProperties(sphere_)
+    assert default_properties.mode == DEFAULT
+    assert default_properties.error is None
+
+    adaptive_properties = GlobalProperties(sphere_, eps=1e-8)
+    assert adaptive_properties.mode == ADAPTIVE
+    assert adaptive_properties.properties.relative_error < 1e-6
+    assert adaptive_properties.volume == pytest.approx(theoretical_volume,
+                                                       rel=1e-6)
+
+    # a new sphere, not to mesh the module level one
+    new_sphere = sphere(sphere_radius)
+    mesh_properties = GlobalProperties(new_sphere, mode=MESH)
+    assert mesh_properties.volume == pytest.approx(theoretical_volume,
+                                                   rel=0.05)
+    assert 0. < mesh_properties.properties.relative_error < 0.1
+    assert np.allclose(mesh_properties.properties.centre, 0., atol=1e-3)
+    mesh_area = mass_properties(Topo(new_sphere, return_iter=False).shells[0],
+                                SURFACE,
+                                mode=MESH)
+    assert mesh_area.mass == pytest.approx(theoretical_area, rel=0.05)
+    assert mesh_area.error > 0.
+
+    # a partially meshed shape : the other faces are meshed
+    new_box = box(box_dim_x, box_dim_y, box_dim_z)
+    mesh(next(Topo(new_box).faces), linear_deflection=0.1)
+    mesh_box = GlobalProperties(new_box, mode=MESH)
+    assert mesh_box.volume == pytest.approx(box_dim_x * box_dim_y * box_dim_z)
+
+    with pytest.raises(ValueError):
+        GlobalProperties(sphere_, mode="exact")
+
+
 def test_global_properties_edge():
     r"""Test the GlobalProperties of an edge"""
     # wrap the box in GlobalProperties
@@ -288,6 +528,111 @@ def test_inclusion():
     assert point_in_solid(sphere_shell, gp_Pnt(sphere_radius, 0, 0)) is None
 
 
+def test_batch_inclusion():
+    r"""Test the batch inclusion of points in the bounding box
+    and in the solid"""
+    points = np.array([[sphere_radius - 1., 0, 0],
+                       [sphere_radius - 1.,
+                        sphere_radius - 1.,
+                        sphere_radius - 1.],
+                       [sphere_radius, 0, 0],
+                       [3 * sphere_radius, 0, 0]])
+    assert list(points_in_boundingbox(sphere_, points)) == [True, True,
+                                                            True, False]
+    expected = [TopAbs_IN, TopAbs_OUT, TopAbs_ON, TopAbs_OUT]
+    assert list(points_in_solid(sphere_, points)) == expected
+    assert list(points_in_solid(sphere_, points,
+                                processes=2, chunk_size=1)) == expected
+
+    with pytest.raises(WrongTopologicalType):
+        points_in_solid(edge, points)
+
+
+def test_voxelize():
+    r"""Test the voxel occupancy grids of a box and a sphere"""
+    grid = voxelize(box_, 1.)
+    assert grid.number_of_occupied == box_dim_x * box_dim_y * box_dim_z
+    assert grid.indices().shape == (grid.number_of_occupied, 3)
+    assert np.array_equal(
+        np.unpackbits(grid.packed(), axis=-1)[:, :, :grid.shape[2]],
+        grid.occupancy)
+
+    band = grid.narrow_band()
+    assert not np.any(band.occupancy & ~grid.occupancy)
+    assert band.number_of_occupied == \
+        grid.number_of_occupied - (box_dim_x - 2) * (box_dim_y - 2) * \
+        (box_dim_z - 2)
+
+    sphere_volume = 4. / 3. * math.pi * sphere_radius ** 3
+    for axis in [None, 0, 2]:
+        grid = voxelize(sphere_, 1., axis=axis)
+        assert abs(grid.volume - sphere_volume) / sphere_volume < 0.05
+
+    with pytest.raises(WrongTopologicalType):
+        voxelize(face_, 1.)
+
+
+def test_deviation():
+    r"""Test the signed distances of points to a box and a sphere"""
+    points = np.array([[5., 10., 35.],
+                       [5., 10., 28.],
+                       [12., 22., 10.],
+                       [-3., -4., -12.]])
+    analysis = DeviationAnalysis(box_)
+    deviations = analysis.perform(points)
+    assert np.allclose(deviations.distances,
+                       [5., -2., 2. * math.sqrt(2.), 13.])
+    assert np.allclose(deviations.closest_points[:3],
+                       [[5., 10., 30.], [5., 10., 30.], [10., 20., 10.]])
+    top_face = analysis.face(deviations.faces[0])
+    assert np.allclose(
+        top_face.parameters_to_points(*deviations.uvs[0]), [5., 10., 30.])
+    assert deviations.faces[0] == deviations.faces[1]
+
+    statistics = deviations.statistics(tolerance=3.)
+    assert statistics["number_of_points"] == 4
+    assert statistics["min"] == pytest.approx(-2.)
+    assert statistics["max_absolute"] == pytest.approx(13.)
+    assert statistics["within_tolerance"] == pytest.approx(0.5)
+    counts, bin_edges = deviations.histogram(bins=5)
+    assert counts.sum() == 4 and len(bin_edges) == 6
+
+    directions = np.random.RandomState(0).normal(size=(200, 3))
+    directions /= np.linalg.norm(directions, axis=1)[:, np.newaxis]
+    radii = np.linspace(0.5, 1.5, 200) * sphere_radius
+    points = directions * radii[:, np.newaxis]
+    deviations = DeviationAnalysis(sphere_).perform(points)
+    assert np.allclose(deviations.distances, radii - sphere_radius,
+                       atol=1e-5)
+    parallel_deviations = DeviationAnalysis(sphere_).perform(
+        points, processes=2, chunk_size=50)
+    assert np.allclose(parallel_deviations.distances, deviations.distances)
+
+
+def test_deviation_coarse_mesh():
+    r"""On a coarse mesh, the nearest triangle of a point above the rim of
+    a cylinder can be on the lateral face, the closest face is the top face"""
+    radius, height = 10., 20.
+    cylinder_ = cylinder(radius, height)
+    mesh(cylinder_, linear_deflection=1., angular_deflection=1.)
+    vertices = triangulation(cylinder_).vertices
+    rim = vertices[np.isclose(vertices[:, 2], height) &
+                   np.isclose(np.linalg.norm(vertices[:, :2], axis=1),
+                              radius)]
+    angles = np.unique(np.round(np.arctan2(rim[:, 1], rim[:, 0]), 6))
+    # between 2 rim vertices, outside of the top face triangles
+    middle = (angles[0] + angles[1]) / 2.
+    point = np.array([0.99 * radius * math.cos(middle),
+                      0.99 * radius * math.sin(middle),
+                      height + 0.2])
+
+    analysis = DeviationAnalysis(cylinder_)
+    deviations = analysis.perform([point])
+    assert deviations.distances[0] == pytest.approx(0.2)
+    assert np.allclose(deviations.closest_points[0], point - [0., 0., 0.2])
+    assert analysis.face(deviations.faces[0]).is_planar()
+
+
 def test_stl_bounding_box():
     r"""Test the computation of the STL bounding box"""
     bb_ascii = stl_bounding_box(path_from_file(__file__,
@@ -320,4 +665,33 @@ def test_stl_bounding_box():
     assert y_max_ascii - tolerance <= y_max_binary <= y_max_ascii + tolerance
 
     assert z_min_ascii - tolerance <= z_min_binary <= z_min_ascii + tolerance
-    assert z_max_ascii - tolerance <= z_max_binary <= z_max_ascii + tolerance
\ No newline at end of file
+    assert z_max_ascii - tolerance <= z_max_binary <= z_max_ascii + tolerance
+
+
+def test_stl_bounding_box_chunks():
+    r"""The result does not depend on the chunk size"""
+    path = path_from_file(__file__, "./test_files/board_binary.stl")
+    assert stl_bounding_box(path, chunk_size=7) == stl_bounding_box(path)
+
+    # ascii : the chunk size is a number of bytes, a chunk of 100 bytes
+    # holds about 2 vertex lines
+    with tempfile.NamedTemporaryFile(mode="w",
+                                     suffix=".stl",
+                                     delete=False) as f:
+        ascii_path = f.name
+        f.write("solid triangles\n")
+        for k in range(10):
+            f.write("facet normal 0 0 1\n"
+                    "outer loop\n"
+                    "vertex %f 0.5 -1.0\n"
+                    "vertex 1.0 %f 2.0\n"
+                    "vertex 0.0 1.0 %f\n"
+                    "endloop\n"
+                    "endfacet\n" % (k, -k, 0.5 * k))
+        f.write("endsolid triangles\n")
+    try:
+        expected = ((0., 9.), (-9., 1.), (-1., 4.5))
+        assert stl_bounding_box(ascii_path) == expected
+        assert stl_bounding_box(ascii_path, chunk_size=100) == expected
+    finally:
+        os.remove(ascii_path)
@@ -7,12 +7,16 @@ r"""tests/test_brep.py
 import sys
 import pytest
 
+import numpy as np
+
 from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox, BRepPrimAPI_MakeSphere
 from OCC.Core.Geom import Geom_Curve, Geom_Surface, Geom_BSplineCurve
 from OCC.Core.gp import gp_Pnt, gp_Vec, gp_Dir
 from OCC.Core.TopAbs import TopAbs_FORWARD
 from OCC.Core.Adaptor3d import Adaptor3d_IsoCurve
 from OCC.Core.GeomLProp import GeomLProp_SLProps
+from OCC.Core.GeomAPI import GeomAPI_PointsToBSpline
+from OCC.Core.TColgp import TColgp_Array1OfPnt
 
 from aocutils.topology import Topo
 # import aocutils.tolerance
@@ -23,6 +27,7 @@ from aocutils.brep.shell import Shell
 from aocutils.brep.wire import Wire
 from aocutils.brep.face import Face
 from aocutils.brep.base import BaseObject
+from aocutils.brep.edge_make import edge, geodesic_path
 from aocutils.exceptions import UndefinedPropertyException, \
     ParameterOutOfDomainException
 
@@ -49,6 +54,18 @@ def sphere_shape():
     return BRepPrimAPI_MakeSphere(sphere_radius).Shape()
 
 
+bspline_through_points = [(0, 0, 0), (1, 2, 0), (3, 1, 1), (4, 3, 2)]
+
+
+@pytest.fixture()
+def bspline_edge():
+    r"""BSpline edge for testing as a pytest fixture"""
+    through_points = TColgp_Array1OfPnt(1, len(bspline_through_points))
+    for i, xyz in enumerate(bspline_through_points):
+        through_points.SetValue(i + 1, gp_Pnt(*xyz))
+    return edge(GeomAPI_PointsToBSpline(through_points).Curve())
+
+
 def test_base(box_shape):
     r"""Test Base class in brep/base.py"""
     b = BaseObject(box_shape, name="box_shape")
@@ -191,6 +208,113 @@ def test_edge_sphere(sphere_shape):
         my_edge.normal(9999.)
 
 
+def _xyz(gp_xyz):
+    r"""Coordinates of a gp_Pnt, gp_Vec or gp_Dir"""
+    return [gp_xyz.X(), gp_xyz.Y(), gp_xyz.Z()]
+
+
+def test_edge_vectorized(bspline_edge, sphere_shape):
+    r"""The array evaluations match the scalar evaluations
+
+    Parameters
+    ----------
+    bspline_edge : TopoDS_Edge
+        BSpline edge (pytest fixture)
+    sphere_shape : TopoDS_Shape
+        Sphere shape (pytest fixture)
+
+    """
+    circle_edge = Edge(Topo(sphere_shape, return_iter=False).edges[1])
+
+    for my_edge in [Edge(bspline_edge), circle_edge]:
+        us = np.linspace(my_edge.domain_start, my_edge.domain_end, 7)[1:-1]
+        points, d1, d2 = my_edge.evaluate(us)
+        assert points.shape == (5, 3)
+        assert np.allclose(my_edge.parameters_to_points(us), points)
+        assert np.allclose(my_edge.derivatives(us, 2), d2)
+        tangents = my_edge.tangents(us)
+        curvatures = my_edge.curvatures(us)
+        normals = my_edge.normals(us)
+        for i, u in enumerate(us):
+            assert np.allclose(points[i], _xyz(my_edge.parameter_to_point(u)))
+            assert np.allclose(d1[i], _xyz(my_edge.derivative(u, 1)))
+            assert np.allclose(d2[i], _xyz(my_edge.derivative(u, 2)))
+            assert np.allclose(tangents[i], _xyz(my_edge.tangent(u)))
+            assert np.isclose(curvatures[i], my_edge.curvature(u))
+            assert np.allclose(normals[i], _xyz(my_edge.normal(u)))
+
+    with pytest.raises(ParameterOutOfDomainException):
+        circle_edge.evaluate([circle_edge.domain_end + 10.])
+
+
+def test_edge_arc_length_table(bspline_edge):
+    r"""The arc length table agrees with the numerical integration
+
+    Parameters
+    ----------
+    bspline_edge : TopoDS_Edge
+        BSpline edge (pytest fixture)
+
+    """
+    my_edge = Edge(bspline_edge)
+    first, last = my_edge.domain
+    middle = (first + last) / 2.
+
+    table = my_edge.arc_length_table
+    assert table is my_edge.arc_length_table
+    assert table.error_bound < my_edge.tolerance
+    assert abs(my_edge.length(use_table=True) - my_edge.length()) < 1e-5
+    assert abs(my_edge.length(first, middle, use_table=True) -
+               my_edge.length(first, middle)) < 1e-5
+
+    assert abs(my_edge.distance_on_curve(1., first, middle, use_table=True) -
+               my_edge.distance_on_curve(1., first, middle)) < 1e-5
+
+    divided = my_edge.divide_by_number_of_points(10, use_table=True)
+    reference = my_edge.divide_by_number_of_points(10)
+    assert len(divided) == len(reference) == 10
+    for (param, _), (reference_param, _) in zip(divided, reference):
+        assert abs(param - reference_param) < 1e-5
+
+    # a trimmed edge has its own table
+    trimmed = my_edge.trim(first, middle)
+    assert abs(trimmed.length(use_table=True) -
+               my_edge.length(first, middle, use_table=True)) < 1e-5
+
+
+def test_edge_project_points(bspline_edge):
+    r"""Batch projection of points offset from the curve along its normals
+
+    Parameters
+    ----------
+    bspline_edge : TopoDS_Edge
+        BSpline edge (pytest fixture)
+
+    """
+    my_edge = Edge(bspline_edge)
+    us = np.linspace(my_edge.domain_start, my_edge.domain_end, 12)[1:-1]
+    points = my_edge.parameters_to_points(us) + 0.01 * my_edge.normals(us)
+
+    for warm_start in [True, False]:
+        params, nearest, distances = my_edge.project_points(points,
+                                                            warm_start)
+        assert np.allclose(params, us, atol=1e-5)
+        assert np.allclose(nearest, my_edge.parameters_to_points(us),
+                           atol=1e-5)
+        assert np.allclose(distances, 0.01)
+
+    # unordered points, the default is a global search for each point
+    shuffled = np.random.RandomState(0).permutation(len(us))
+    params, _, distances = my_edge.project_points(points[shuffled])
+    assert np.allclose(params, us[shuffled], atol=1e-5)
+    assert np.allclose(distances, 0.01)
+
+    # the ends of the edge are the nearest points beyond them
+    params, nearest, _ = my_edge.project_points([(-1., -1., 0.),
+                                                 (5., 4., 3.)])
+    assert np.allclose(params, my_edge.domain)
+
+
 def test_face_flat(box_shape):
     r"""aocutils flat Face test
 
@@ -280,6 +404,105 @@ def test_face_flat(box_shape):
                       gp_Vec)
 
 
+def test_face_vectorized(box_shape, sphere_shape):
+    r"""Array evaluations of Face on grids and scattered parameters
+
+    Parameters
+    ----------
+    box_shape : TopoDS_Shape
+        Box shape (pytest fixture)
+    sphere_shape : TopoDS_Shape
+        Sphere shape (pytest fixture)
+
+    """
+    sphere_face = Face(Topo(sphere_shape, return_iter=False).faces[0])
+    us, vs = sphere_face.uv_grid(5, 4)
+    points = sphere_face.parameters_to_points(us, vs)
+    assert points.shape == (5, 4, 3)
+    assert np.allclose(np.linalg.norm(points, axis=-1), sphere_radius)
+
+    # the normals are defined at the poles thanks to the domain correction
+    normals = sphere_face.normals(us, vs)
+    assert not np.any(np.isnan(normals))
+    for i, j in [(1, 1), (2, 2), (3, 1)]:
+        assert np.allclose(normals[i, j],
+                           _xyz(sphere_face.normal(us[i, j], vs[i, j])))
+
+    scattered_us = us[1:-1, 1:-1].ravel()
+    scattered_vs = vs[1:-1, 1:-1].ravel()
+    gaussian, mean, minimum, maximum = \
+        sphere_face.curvatures(scattered_us, scattered_vs)
+    assert gaussian.shape == (len(scattered_us),)
+    assert np.allclose(gaussian, 1. / sphere_radius ** 2)
+    assert np.allclose(np.abs(mean), 1. / sphere_radius)
+    assert np.allclose(minimum, maximum)
+
+    # single pass evaluation, the points are not moved at the poles
+    points, normals, tangents, curvatures = \
+        sphere_face.surface_properties(us, vs)
+    assert points.shape == normals.shape == (5, 4, 3)
+    assert tangents.shape == (5, 4, 2, 3)
+    assert curvatures.shape == (5, 4, 4)
+    assert np.allclose(points, sphere_face.parameters_to_points(us, vs))
+    assert np.allclose(normals, sphere_face.normals(us, vs))
+    assert np.allclose(curvatures[1:-1, 1:-1, 0].ravel(), gaussian)
+    assert np.allclose(np.linalg.norm(tangents, axis=-1), 1.)
+    u_tangent, v_tangent = sphere_face.tangent(us[2, 1], vs[2, 1])
+    assert np.allclose(tangents[2, 1], [_xyz(u_tangent), _xyz(v_tangent)])
+
+    for topods_face in Topo(box_shape, return_iter=False).faces:
+        box_face = Face(topods_face)
+        u, v = box_face.midpoint_parameters
+        assert np.allclose(box_face.normals([u], [v])[0],
+                           _xyz(box_face.normal(u, v)))
+        assert np.allclose(box_face.curvatures(u, v), 0.)
+
+    with pytest.raises(ParameterOutOfDomainException):
+        sphere_face.evaluate([sphere_face.u_domain_end + 1.], [0.])
+
+
+def test_face_project_points(sphere_shape):
+    r"""Batch projection of points on a sphere and geodesic path
+
+    Parameters
+    ----------
+    sphere_shape : TopoDS_Shape
+        Sphere shape (pytest fixture)
+
+    """
+    sphere_face = Face(Topo(sphere_shape, return_iter=False).faces[0])
+    angles = np.linspace(0.5, 2.5, 9)
+    directions = np.column_stack((np.cos(angles) * np.cos(angles - 1.5),
+                                  np.sin(angles) * np.cos(angles - 1.5),
+                                  np.sin(angles - 1.5)))
+    points = 12. * directions
+
+    uvs, nearest, distances = sphere_face.project_points(points)
+    assert uvs.shape == (9, 2)
+    assert np.allclose(nearest, sphere_radius * directions)
+    assert np.allclose(distances, 12. - sphere_radius)
+    for uv, xyz in zip(uvs, points.tolist()):
+        assert np.allclose(uv, sphere_face.point_to_parameter(gp_Pnt(*xyz)))
+
+    same_uvs, _, _ = sphere_face.project_points(points, uv0=uvs)
+    assert np.allclose(same_uvs, uvs)
+    warm_uvs, _, _ = sphere_face.project_points(points, warm_start=True)
+    assert np.allclose(warm_uvs, uvs)
+
+    # unordered points, the default is a global search for each point
+    shuffled = np.random.RandomState(0).permutation(len(points))
+    shuffled_uvs, shuffled_nearest, _ = \
+        sphere_face.project_points(points[shuffled])
+    assert np.allclose(shuffled_uvs, uvs[shuffled])
+    assert np.allclose(shuffled_nearest, nearest[shuffled])
+
+    # quarter of the equator
+    geodesic = Edge(geodesic_path(gp_Pnt(sphere_radius, 0.01, 0.),
+                                  gp_Pnt(0., sphere_radius, 0.),
+                                  sphere_face))
+    assert abs(geodesic.length() - np.pi / 2. * sphere_radius) < 1e-2
+
+
 def test_wire(box_shape):
     r"""aocutils Wire test
 
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""Tests for the bvh.py module"""
+
+import numpy as np
+
+from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeSphere, BRepPrimAPI_MakeBox
+
+from aocutils.bvh import TriangleBVH
+from aocutils.operations.intersect import ShapeIntersector
+from aocutils.topology import Topo
+
+
+def test_bvh_box():
+    r"""Test the mesh based ray casting on a box"""
+    dx, dy, dz = 10.0, 20.0, 30.0
+    box = BRepPrimAPI_MakeBox(dx, dy, dz).Shape()
+    bvh = TriangleBVH(box)
+    assert bvh.number_of_triangles >= 12
+
+    origins = np.array([[-1., 1., 1.], [-1., 5., 7.], [-1., -1., 1.]])
+    directions = np.array([[1., 0., 0.], [1., 0., 0.], [1., 0., 0.]])
+
+    hits = bvh.perform(origins, directions, nearest=False)
+    assert list(hits.counts(len(origins))) == [2, 2, 0]
+    assert np.allclose(hits.points[:, 0], [0., dx, 0., dx])
+    assert np.allclose(hits.w, [1., 1. + dx, 1., 1. + dx])
+    assert np.all(np.isnan(hits.u))
+
+    nearest = bvh.perform(origins, directions, nearest=True, refine=True)
+    assert list(nearest.rays) == [0, 1]
+    assert not np.any(np.isnan(nearest.uvw))
+    topo = Topo(box, indexed=True)
+    for face_index in nearest.faces:
+        assert topo.index(bvh.face(face_index)) == face_index
+
+
+def test_bvh_partially_meshed():
+    r"""The faces without a triangulation are meshed"""
+    box = BRepPrimAPI_MakeBox(10., 20., 30.).Shape()
+    BRepMesh_IncrementalMesh(next(Topo(box).faces), 0.1)
+    bvh = TriangleBVH(box)
+    faces, _, _ = bvh.closest_points(np.array([[-1., 10., 15.],
+                                               [11., 10., 15.],
+                                               [5., -1., 15.],
+                                               [5., 21., 15.],
+                                               [5., 10., -1.],
+                                               [5., 10., 31.]]))
+    assert sorted(faces.tolist()) == list(range(6))
+
+
+def test_bvh_refine_sphere():
+    r"""The refined hits on a sphere match the exact intersection"""
+    radius = 10.0
+    sphere = BRepPrimAPI_MakeSphere(radius).Shape()
+    bvh = TriangleBVH(sphere)
+
+    origins = np.array([[-11., 0.5, 0.5], [0.3, -11., 2.], [1., 2., 15.]])
+    directions = -origins
+    exact = ShapeIntersector(sphere).perform(origins, directions)
+    approximate = bvh.perform(origins, directions)
+    refined = bvh.perform(origins, directions, refine=True)
+
+    assert np.allclose(approximate.points, exact.points, atol=radius * 0.01)
+    assert np.allclose(refined.points, exact.points, atol=1e-6)
+    assert np.allclose(np.linalg.norm(refined.points, axis=1), radius)
+
+
+def test_bvh_closest_points():
+    r"""Test the nearest triangle queries on a box"""
+    dx, dy, dz = 10.0, 20.0, 30.0
+    box = BRepPrimAPI_MakeBox(dx, dy, dz).Shape()
+    bvh = TriangleBVH(box)
+
+    points = np.array([[5., 10., 35.], [5., 10., 28.], [12., 22., 10.],
+                       [-3., -4., -12.]])
+    faces, closest, distances = bvh.closest_points(points, chunk_size=3)
+    assert np.allclose(distances, [5., 2., 2. * np.sqrt(2.), 13.])
+    assert np.allclose(closest, [[5., 10., 30.], [5., 10., 30.],
+                                 [10., 20., 10.], [0., 0., 0.]])
+    assert faces[0] == faces[1]
@@ -3,9 +3,12 @@
 
 r"""Tests for the operations/intersect.py module"""
 
+import numpy as np
+
 from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeSphere, BRepPrimAPI_MakeBox
 
-from aocutils.operations.intersect import intersect_shape_by_half_line
+from aocutils.operations.intersect import intersect_shape_by_half_line, \
+    ShapeIntersector
 
 
 def test_intersect_sphere():
@@ -90,3 +93,29 @@ def test_intersect_box():
                                                        x=1., y=-1., z=-0.0001,
                                                        vx=0, vy=1, vz=0)
     assert len(intersection_points) == 0
+
+
+def test_shape_intersector():
+    r"""Test the batched ray casting on a sphere"""
+    radius = 10.0
+    sphere = BRepPrimAPI_MakeSphere(radius).Shape()
+    intersector = ShapeIntersector(sphere)
+
+    origins = np.array([[-11., 0., 0.], [-9., 0., 0.], [-11., 11., 0.]])
+    directions = np.array([[1., 0., 0.], [2., 0., 0.], [1., 0., 0.]])
+
+    hits = intersector.perform(origins, directions, nearest=False)
+    assert list(hits.counts(len(origins))) == [2, 1, 0]
+    assert list(hits.rays) == [0, 0, 1]
+    assert np.allclose(hits.points[:, 0], [-10., 10., 10.])
+    assert np.allclose(hits.w, [1., 21., 19.])
+    assert np.all(hits.faces == 0)
+
+    nearest = intersector.perform(origins, directions, nearest=True)
+    assert list(nearest.rays) == [0, 1]
+    assert np.allclose(nearest.points[:, 0], [-10., 10.])
+
+    parallel = intersector.perform(origins, directions, nearest=False,
+                                   processes=2, chunk_size=1)
+    assert np.array_equal(parallel.rays, hits.rays)
+    assert np.allclose(parallel.uvw, hits.uvw)
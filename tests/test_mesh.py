@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+r"""Tests for the mesh.py module"""
+
+import numpy as np
+
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox, \
+    BRepPrimAPI_MakeSphere, BRepPrimAPI_MakeCylinder
+from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_Transform
+from OCC.Core.gp import gp_Trsf, gp_Vec
+
+from aocutils.mesh import mesh, triangulation, adaptive_deflections
+
+
+def test_triangulation_box():
+    r"""Test the triangulation buffers of a box"""
+    dx, dy, dz = 10.0, 20.0, 30.0
+    box = BRepPrimAPI_MakeBox(dx, dy, dz).Shape()
+    mesh(box)
+    box_triangulation = triangulation(box, normals=True)
+
+    assert box_triangulation.number_of_faces == 6
+    assert box_triangulation.vertices.dtype == np.float64
+    assert box_triangulation.triangles.dtype == np.int32
+    assert box_triangulation.triangle_offsets[-1] == \
+        len(box_triangulation.triangles)
+    assert box_triangulation.vertex_offsets[-1] == \
+        len(box_triangulation.vertices)
+    assert np.allclose(box_triangulation.vertices.min(axis=0), [0., 0., 0.])
+    assert np.allclose(box_triangulation.vertices.max(axis=0), [dx, dy, dz])
+    assert box_triangulation.deflections.shape == (6,)
+    assert not np.any(np.isnan(box_triangulation.deflections))
+
+    # the triangles are oriented outwards : the signed volume is the volume
+    corners = box_triangulation.corners
+    volume = np.einsum("ij,ij->i",
+                       corners[:, 0],
+                       np.cross(corners[:, 1], corners[:, 2])).sum() / 6.
+    assert abs(volume - dx * dy * dz) < 1e-6
+
+    # the vertex normals of a face point out of the box
+    centre = np.array([dx, dy, dz]) / 2.
+    outwards = np.einsum("ij,ij->i",
+                         box_triangulation.normals,
+                         box_triangulation.vertices - centre)
+    assert np.all(outwards > 0.)
+
+    single = triangulation(box, dtype=np.float32)
+    assert single.vertices.dtype == np.float32
+    assert single.normals is None
+
+
+def test_triangulation_location():
+    r"""The location of a moved shape is applied to the vertices"""
+    box = BRepPrimAPI_MakeBox(1., 1., 1.).Shape()
+    mesh(box)
+    trsf = gp_Trsf()
+    trsf.SetTranslation(gp_Vec(5., 0., 0.))
+    moved = BRepBuilderAPI_Transform(box, trsf, False).Shape()
+    assert np.allclose(triangulation(moved).vertices,
+                       triangulation(box).vertices + [5., 0., 0.])
+
+
+def test_mesh_reuse():
+    r"""Test the reuse of the triangulations that meet the deflection"""
+    box = BRepPrimAPI_MakeBox(10., 20., 30.).Shape()
+
+    report = mesh(box, linear_deflection=0.1)
+    assert report.number_of_meshed_faces == 6
+    assert report.number_of_reused_faces == 0
+    assert np.all(np.isnan(report.face_times))
+
+    # a coarser mesh is already met
+    report = mesh(box, linear_deflection=1.)
+    assert report.number_of_meshed_faces == 0
+    assert list(report.reused) == [True] * 6
+
+    # a finer one is not
+    report = mesh(box, linear_deflection=0.01, per_face=True, parallel=True)
+    assert report.number_of_meshed_faces == 6
+    assert np.all(report.face_times >= 0.)
+    assert report.total_time >= np.sum(report.face_times)
+
+    report = mesh(box, linear_deflection=0.01, reuse=False)
+    assert report.number_of_meshed_faces == 6
+
+
+def test_mesh_adaptive(caplog):
+    r"""Test the curvature driven deflections"""
+    sphere = BRepPrimAPI_MakeSphere(10.).Shape()
+    budget = 1000
+    deflection, deflections = adaptive_deflections(sphere, budget)
+    assert deflection > 0.
+    assert np.allclose(deflections, deflection)
+    assert "more than the budget" not in caplog.text
+
+    report = mesh(sphere, triangle_budget=budget)
+    assert report.number_of_meshed_faces == 1
+    number_of_triangles = len(triangulation(sphere).triangles)
+    assert budget / 4 < number_of_triangles < budget * 4
+
+    # the deflection of a thin cylinder is capped by its radius
+    cylinder = BRepPrimAPI_MakeCylinder(0.1, 100.).Shape()
+    deflection, deflections = adaptive_deflections(cylinder, budget)
+    assert abs(deflections.min() - 0.1 * 0.1) < 1e-9
+    assert np.all(deflections < deflection)
+
+    # budget mode on several faces : each face gets its own deflection
+    report = mesh(cylinder, triangle_budget=budget)
+    assert report.linear_deflection == deflection
+    assert np.allclose(report.face_deflections, deflections)
+    assert report.number_of_meshed_faces == 3
+    cylinder_triangulation = triangulation(cylinder)
+    assert not np.any(np.isnan(cylinder_triangulation.deflections))
+    assert np.all(np.diff(cylinder_triangulation.triangle_offsets) > 0)
+
+    # the caps overrun the budget : the overrun is not silent
+    assert len(cylinder_triangulation.triangles) > budget
+    assert "more than the budget" in caplog.text
@@ -99,3 +99,25 @@ def test_with_box():
 
     assert bbw_z_max >= dz
     assert abs(bbw_z_max - dz) <= 2 * increment
+
+
+def test_bisection_vs_linear():
+    r"""The bisection search agrees with the linear search
+    and uses fewer boolean operations"""
+    radius = 10.0
+    sphere = BRepPrimAPI_MakeSphere(radius).Shape()
+    bb = BoundingBox(sphere)
+    increment = 0.001
+
+    linear, linear_evaluations = real_bb_position("X", "MAX", bb.x_max,
+                                                  sphere,
+                                                  increment=increment,
+                                                  method="linear",
+                                                  return_evaluations=True)
+    bisection, bisection_evaluations = real_bb_position(
+        "X", "MAX", bb.x_max, sphere, increment=increment,
+        return_evaluations=True)
+    assert radius <= bisection <= radius + 2 * increment
+    assert abs(bisection - linear) <= 2 * increment
+    assert bisection_evaluations < 30
+    assert bisection_evaluations <= linear_evaluations
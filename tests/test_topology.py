@@ -7,11 +7,13 @@ import sys
 import pytest
 
 from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox
+from OCC.Core.TopAbs import TopAbs_FACE, TopAbs_EDGE
 from OCC.Core.TopoDS import TopoDS_Solid, TopoDS_Shape, TopoDS_Compound, \
     TopoDS_CompSolid, TopoDS_Shell, TopoDS_Face, TopoDS_Edge
 
-from aocutils.topology import Topo, shape_to_topology, WireExplorer
+from aocutils.topology import Topo, shape_to_topology, WireExplorer, ShapeKey
 from aocutils.primitives import box
+from aocutils.exceptions import WrongTopologicalType
 # import aocutils.brep.edge
 # import aocutils.brep.face
 # import aocutils.brep.wire
@@ -314,3 +316,87 @@ def test_wires_out_of_scope(topo):
         _vertices.append(vert)
     for v in _vertices:
         assert not v.IsNull()
+
+
+def test_indexed_topo():
+    r"""The indexed mode returns the same entities as the default mode"""
+    shape = box(10, 10, 10)
+    topo = Topo(shape, return_iter=False)
+    indexed_topo = Topo(shape, return_iter=False, indexed=True)
+
+    assert indexed_topo.indexed is True
+    assert indexed_topo.number_of_faces == 6
+    assert indexed_topo.number_of_edges == 12
+    assert indexed_topo.number_of_vertices == 8
+    assert indexed_topo.number_of_solids == 1
+    assert indexed_topo.number_of_compounds == 0
+
+    for i, face in enumerate(indexed_topo.faces):
+        assert indexed_topo.index(face) == i
+        assert indexed_topo.from_index(TopAbs_FACE, i).IsSame(face)
+
+    for edg in topo.edges:
+        assert len(list(indexed_topo.faces_from_edge(edg))) == 2
+        assert indexed_topo.number_of_faces_from_edge(edg) == \
+            topo.number_of_faces_from_edge(edg)
+    # the ancestor map has been built once and memoized
+    assert len(indexed_topo._ancestor_maps) == 1
+
+
+def test_shape_key():
+    r"""ShapeKey equality ignores the orientation of the shapes"""
+    shape = box(10, 10, 10)
+    edges = list()
+    for face in Topo(shape).faces:
+        edges.extend(Topo(face).edges)
+    # each edge of the box is shared by 2 faces, with opposite orientations
+    assert len(edges) == 24
+    assert len(set(ShapeKey(e) for e in edges)) == 12
+
+    edg = edges[0]
+    assert ShapeKey(edg) == ShapeKey(edg.Reversed())
+    assert hash(ShapeKey(edg)) == hash(ShapeKey(edg.Reversed()))
+    assert ShapeKey(edg) != ShapeKey(edges[1])
+
+    topo = Topo(shape, ignore_orientation=True)
+    assert len(topo.edges) == 12
+    assert len(topo.vertices) == 8
+
+
+def test_streaming_topo():
+    r"""The streaming mode yields the same entities, lazily"""
+    shape = box(10, 10, 10)
+    topo = Topo(shape, streaming=True)
+
+    faces = topo.faces
+    assert isinstance(next(faces), TopoDS_Face)
+    assert topo.number_of_faces == 6
+    assert topo.number_of_edges == 12
+    assert topo.number_of_vertices == 8
+
+    # without the uniqueness filter, shared edges are yielded once per face
+    assert len(list(topo.stream(TopAbs_EDGE, unique=False))) == 24
+    assert len(list(topo.stream(TopAbs_EDGE))) == 12
+
+    with pytest.raises(WrongTopologicalType):
+        topo.stream(-1)
+
+
+def test_topology_graph():
+    r"""CSR adjacencies of a box"""
+    graph = Topo(box(10, 10, 10), indexed=True).graph()
+
+    assert len(graph.vertices) == 8
+    assert len(graph.edges) == 12
+    assert len(graph.faces) == 6
+    assert len(graph.solids) == 1
+
+    assert (graph.edge_face.degrees == 2).all()
+    assert (graph.face_edge.degrees == 4).all()
+    assert (graph.edge_vertex.degrees == 2).all()
+    assert (graph.vertex_edge.degrees == 3).all()
+    # each face of a box touches 4 other faces
+    assert (graph.face_face.degrees == 4).all()
+    assert list(graph.solid_face.neighbours(0)) == [0, 1, 2, 3, 4, 5]
+    for i in range(6):
+        assert i not in graph.face_face.neighbours(i)